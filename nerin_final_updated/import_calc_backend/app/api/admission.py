@@ -0,0 +1,251 @@
+from __future__ import annotations
+
+import asyncio
+import bisect
+import itertools
+import logging
+import math
+import re
+import time
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi.responses import JSONResponse
+
+from ..config import get_settings
+
+LOGGER = logging.getLogger(__name__)
+
+WEBHOOK = "webhook"
+
+# Lower number is served first when a slot frees up.
+_PRIORITIES = {WEBHOOK: 0, "default": 1, "export": 2, "batch": 2}
+
+# First match wins; ``None`` exempts the request from admission control.
+_ROUTE_CLASSES: List[Tuple[Optional[str], "re.Pattern[str]", Optional[str]]] = [
+    ("POST", re.compile(r"^/api/payments/notify$"), WEBHOOK),
+    ("GET", re.compile(r"^/api/(calculations(/\d+/export)?|reports/calculations)$"), "export"),
+    ("POST", re.compile(r"^/api/(presets/compare|calculations/(tiers|what-if|import-store)|ncm/import|exchange-rates/import|simulations/margin-risk|reports/replica/refresh)$"), "batch"),
+    (None, re.compile(r"^/api/metrics/"), None),
+    # Long-lived SSE streams only poll the database; they must not pin a slot.
+    ("GET", re.compile(r"^/api/jobs/\d+/events$"), None),
+    (None, re.compile(r"^/api/"), "default"),
+]
+
+_MAX_RETRY_AFTER = 60
+# Weight of the newest sample in the per-class service time average.
+_EWMA_ALPHA = 0.2
+
+
+def classify_request(method: str, path: str) -> Optional[str]:
+    for route_method, pattern, name in _ROUTE_CLASSES:
+        if (route_method is None or route_method == method) and pattern.match(path):
+            return name
+    return None
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, status_code: int, retry_after: int, detail: str) -> None:
+        super().__init__(detail)
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.detail = detail
+
+
+@dataclass
+class RouteClassStats:
+    limit: int
+    queue_size: int
+    priority: int
+    active: int = 0
+    queued: int = 0
+    admitted: int = 0
+    rejected_queue_full: int = 0
+    rejected_timeout: int = 0
+    service_seconds: float = 0.05
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "limit": self.limit,
+            "queue_size": self.queue_size,
+            "active": self.active,
+            "queued": self.queued,
+            "admitted": self.admitted,
+            "rejected_queue_full": self.rejected_queue_full,
+            "rejected_timeout": self.rejected_timeout,
+            "avg_service_ms": round(self.service_seconds * 1000, 2),
+        }
+
+
+@dataclass(order=True)
+class _Waiter:
+    priority: int
+    sequence: int
+    name: str = field(compare=False)
+    future: "asyncio.Future[None]" = field(compare=False)
+
+
+class AdmissionController:
+    """Per-route-class concurrency limits with bounded priority queues.
+
+    Every class has its own concurrency limit and queue, and all of them share
+    ``total_limit`` slots, mirroring the threadpool and SQLite writer they
+    compete for. ``webhook_reserved`` of those slots are only usable by payment
+    webhooks, and when a slot frees up the waiting webhook is admitted before
+    any other class. A full queue is answered with 429 and a wait that exceeds
+    ``queue_timeout`` with 503, both carrying ``Retry-After`` derived from the
+    class's recent service time and backlog.
+
+    All state is touched from the event loop thread only, so no locking is needed.
+    """
+
+    def __init__(
+        self,
+        total_limit: int,
+        webhook_reserved: int,
+        limits: Dict[str, int],
+        queue_sizes: Dict[str, int],
+        queue_timeout: float,
+    ) -> None:
+        self.total_limit = total_limit
+        self.webhook_reserved = min(webhook_reserved, total_limit - 1)
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.classes = {
+            name: RouteClassStats(limit=limits.get(name, 1), queue_size=queue_sizes.get(name, 0), priority=priority)
+            for name, priority in _PRIORITIES.items()
+        }
+        self._waiters: List[_Waiter] = []
+        self._sequence = itertools.count()
+
+    def _can_run(self, name: str) -> bool:
+        stats = self.classes[name]
+        if stats.active >= stats.limit or self.active >= self.total_limit:
+            return False
+        return name == WEBHOOK or self.active < self.total_limit - self.webhook_reserved
+
+    def _admit(self, name: str) -> None:
+        stats = self.classes[name]
+        stats.active += 1
+        stats.admitted += 1
+        self.active += 1
+
+    def retry_after(self, name: str) -> int:
+        stats = self.classes[name]
+        backlog = (stats.queued + stats.active + 1) / max(stats.limit, 1)
+        return max(1, min(_MAX_RETRY_AFTER, math.ceil(stats.service_seconds * backlog)))
+
+    async def acquire(self, name: str) -> None:
+        stats = self.classes[name]
+        # Do not overtake a waiter of the same or higher priority that is only
+        # held back by the shared slots (not by its own class limit).
+        ahead = any(
+            waiter.priority <= stats.priority
+            and not waiter.future.done()
+            and self.classes[waiter.name].active < self.classes[waiter.name].limit
+            for waiter in self._waiters
+        )
+        if not ahead and self._can_run(name):
+            self._admit(name)
+            return
+        if stats.queued >= stats.queue_size:
+            stats.rejected_queue_full += 1
+            raise AdmissionRejected(429, self.retry_after(name), f"Too many queued '{name}' requests")
+
+        future: "asyncio.Future[None]" = asyncio.get_running_loop().create_future()
+        bisect.insort(self._waiters, _Waiter(stats.priority, next(self._sequence), name, future))
+        stats.queued += 1
+        try:
+            await asyncio.wait_for(future, self.queue_timeout)
+        except asyncio.TimeoutError:
+            stats.queued -= 1
+            stats.rejected_timeout += 1
+            raise AdmissionRejected(503, self.retry_after(name), f"Timed out waiting for a '{name}' slot") from None
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Admitted just as the client went away: give the slot back.
+                self.release(name)
+            else:
+                stats.queued -= 1
+            raise
+
+    def release(self, name: str, elapsed: Optional[float] = None) -> None:
+        stats = self.classes[name]
+        stats.active -= 1
+        self.active -= 1
+        if elapsed is not None:
+            stats.service_seconds += _EWMA_ALPHA * (elapsed - stats.service_seconds)
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        # Waiters are ordered by (priority, arrival); a class at its own limit
+        # must not block lower-priority classes that still have room.
+        remaining: List[_Waiter] = []
+        for waiter in self._waiters:
+            if waiter.future.done():
+                continue
+            if self._can_run(waiter.name):
+                self.classes[waiter.name].queued -= 1
+                self._admit(waiter.name)
+                waiter.future.set_result(None)
+            else:
+                remaining.append(waiter)
+        self._waiters = remaining
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "total_limit": self.total_limit,
+            "webhook_reserved": self.webhook_reserved,
+            "active": self.active,
+            "queued": sum(stats.queued for stats in self.classes.values()),
+            "classes": {name: stats.snapshot() for name, stats in self.classes.items()},
+        }
+
+
+class AdmissionControlMiddleware:
+    """ASGI middleware gating ``/api`` requests through an :class:`AdmissionController`."""
+
+    def __init__(self, app, controller: AdmissionController) -> None:
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        name = classify_request(scope["method"], scope["path"])
+        if name is None:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            await self.controller.acquire(name)
+        except AdmissionRejected as exc:
+            LOGGER.warning(
+                "Request rejected by admission control",
+                extra={"route_class": name, "status_code": exc.status_code, "path": scope["path"]},
+            )
+            response = JSONResponse(
+                {"detail": exc.detail}, status_code=exc.status_code, headers={"Retry-After": str(exc.retry_after)}
+            )
+            await response(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(name, time.perf_counter() - started)
+
+
+@lru_cache()
+def get_admission_controller() -> AdmissionController:
+    settings = get_settings()
+    return AdmissionController(
+        total_limit=settings.admission_total_limit,
+        webhook_reserved=settings.admission_webhook_reserved,
+        limits=settings.admission_limits,
+        queue_sizes=settings.admission_queue_sizes,
+        queue_timeout=settings.admission_queue_timeout_seconds,
+    )
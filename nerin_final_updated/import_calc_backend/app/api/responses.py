@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from fastapi.responses import JSONResponse, Response
+
+from ..utils.serialization import dumps_json, encode_json
+
+
+class EncodedJSONResponse(JSONResponse):
+    """JSON response rendered with the shared Decimal-aware encoder.
+
+    Returning it from a route skips FastAPI's ``response_model`` revalidation and
+    ``jsonable_encoder`` pass, so it must only wrap payloads we built ourselves.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return encode_json(content)
+
+
+def calculation_etag(calculation_id: int, revision: int, variant: Optional[str] = None) -> str:
+    """Weak validator for a calculation revision (and export format, if any).
+
+    Weak because ``GZipMiddleware`` may send the same revision gzip-encoded or
+    as identity, and a strong validator must differ between content codings.
+    """
+
+    suffix = f"-{variant}" if variant else ""
+    return f'W/"calc-{calculation_id}-r{revision}{suffix}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Evaluate ``If-None-Match`` using the weak comparison RFC 9110 prescribes for it."""
+
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = (candidate.strip() for candidate in if_none_match.split(","))
+    opaque = etag.removeprefix("W/")
+    return any(candidate.removeprefix("W/") == opaque for candidate in candidates)
+
+
+def validator_headers(etag: str) -> Dict[str, str]:
+    # ``no-cache`` lets clients keep the body but forces a conditional request
+    # on every poll, which is answered with a body-less 304 while unchanged.
+    return {"ETag": etag, "Cache-Control": "no-cache"}
+
+
+def not_modified_response(etag: str) -> Response:
+    return Response(status_code=304, headers=validator_headers(etag))
+
+
+def raw_calculation_response(
+    calculation_id: int,
+    created_at: datetime,
+    parameters_json: str,
+    results_json: str,
+    headers: Optional[Dict[str, str]] = None,
+) -> Response:
+    """Splice pre-rendered JSON fragments into a ``CalculationResponse`` body."""
+
+    body = (
+        f'{{"calculation_id":{calculation_id},"created_at":"{created_at.isoformat()}",'
+        f'"parameters":{parameters_json},"results":{results_json}}}'
+    )
+    return Response(content=body.encode("utf-8"), media_type="application/json", headers=headers)
+
+
+def sse_event(event: str, data: Any, event_id: Optional[int] = None) -> str:
+    """Format one Server-Sent Events message; ``data`` is JSON-encoded on a single line."""
+
+    prefix = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{prefix}event: {event}\ndata: {dumps_json(data)}\n\n"
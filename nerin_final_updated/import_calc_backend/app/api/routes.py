@@ -1,26 +1,81 @@
 from __future__ import annotations
 
+import asyncio
 import logging
-from typing import Any, Dict
+import os
+from dataclasses import asdict
+from datetime import date, datetime
+from typing import Any, BinaryIO, Dict, Iterator, Literal, Optional
 
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, File, Header, HTTPException, Query, Request, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import Response, StreamingResponse
+from pydantic import ValidationError
+from sqlalchemy import LargeBinary, type_coerce
+from sqlmodel import select
 
 from ..schemas import (
     CalculationCreateRequest,
     CalculationParameters,
     CalculationResponse,
+    JobResponse,
+    JobSubmitRequest,
+    MonteCarloRequest,
     PaymentNotificationRequest,
+    PresetComparisonRequest,
     PresetCreateRequest,
     PresetResponse,
+    TierPricingRequest,
+    WhatIfRequest,
 )
-from ..services.calculator import calculate_import_cost
+from ..services.archival import find_archived_calculation, load_calculation_snapshot
+from ..services.calculator import build_result_payload, calculate_import_cost
+from ..services.comparison import compare_presets
+from ..services.idempotency import (
+    MAX_KEY_LENGTH,
+    IdempotencyConflict,
+    IdempotencyInProgress,
+    StoredResponse,
+    request_fingerprint,
+    run_idempotent,
+)
+from ..services.exchange_rates import (
+    ExchangeRateImportError,
+    cross_rates_as_of,
+    get_exchange_rate_index,
+    import_csv,
+    rate_as_of,
+)
+from ..services.export_cache import get_export_cache
+from ..services.formula_graph import evaluate_scenarios
 from ..services.exporter import default_filename, export_to_csv, export_to_xlsx
 from ..services.notifications import process_payment_notification
+from ..services import job_handlers  # noqa: F401  (registers the built-in job kinds)
+from ..services.jobs import TERMINAL_STATUSES, get_job, list_job_items, submit_job
+from ..services.montecarlo import simulate_margin_risk
+from ..services.ncm import NcmImportError, import_file, lookup_ncm, normalize_ncm_code
 from ..services.presets import create_preset, ensure_default_presets, get_preset, list_presets
+from ..services.reports import list_calculations, summarize_calculations
+from ..services.store_import import spool_upload
+from ..services.tax_formulas import FormulaError
+from ..services.tiers import calculate_price_tiers
+from ..storage.cache import get_cache
+from ..storage.codec import decode_json
 from ..storage.database import get_session
 from ..storage.models import Calculation
-from ..utils.serialization import to_serializable
+from ..storage.replica import get_reporting_replica, get_reporting_session, reporting_status
+from ..utils.serialization import dumps_json
+from .admission import get_admission_controller
+from .responses import (
+    EncodedJSONResponse,
+    calculation_etag,
+    etag_matches,
+    not_modified_response,
+    raw_calculation_response,
+    sse_event,
+    validator_headers,
+)
 
 LOGGER = logging.getLogger(__name__)
 
@@ -32,91 +87,294 @@ def startup_event() -> None:
     ensure_default_presets()
 
 
-@router.post("/calculations", response_model=CalculationResponse)
-def create_calculation(request: CalculationCreateRequest) -> CalculationResponse:
-    parameters_data = request.parameters.model_dump()
+def _resolve_parameters(parameters: CalculationParameters, preset_name: Optional[str]) -> CalculationParameters:
+    if not preset_name:
+        return parameters
+    preset = get_preset(preset_name)
+    if not preset:
+        raise HTTPException(status_code=404, detail="Preset not found")
+    merged = {**preset.parameters, **parameters.model_dump()}
+    return CalculationParameters.model_validate(merged)
+
+
+def _calculation_failed(exc: Exception) -> HTTPException:
+    # Parameters can validate and still not compute: a tax formula dividing by
+    # zero or going negative, or amounts beyond the Decimal precision.
+    detail = str(exc) if isinstance(exc, ValueError) else f"Calculation failed: {exc.__class__.__name__}"
+    return HTTPException(status_code=422, detail=detail)
+
+
+def _create_calculation(request: CalculationCreateRequest) -> StoredResponse:
     preset_name = request.preset_name
+    parameters = _resolve_parameters(request.parameters, preset_name)
 
-    if preset_name:
-        preset = get_preset(preset_name)
-        if not preset:
-            raise HTTPException(status_code=404, detail="Preset not found")
-        merged = {**preset.parameters, **parameters_data}
-        parameters = CalculationParameters.model_validate(merged)
-    else:
-        parameters = request.parameters
-
-    result = calculate_import_cost(parameters)
-
-    stored_result: Dict[str, Any] = {
-        "precio_neto_ars": str(result.precio_neto_ars),
-        "precio_final_ars": str(result.precio_final_ars),
-        "utilidad_ars": str(result.utilidad),
-        "margen": str(result.margen),
-        "costo_puesto_ars": str(result.costo_puesto_ars),
-        "breakdown": to_serializable(result.breakdown),
-        "additional_taxes": to_serializable(result.additional_taxes),
-        "totals": to_serializable(result.totals),
-        "unitary": to_serializable(result.unitary),
-    }
+    try:
+        results_payload = build_result_payload(calculate_import_cost(parameters))
+    except (ValueError, ArithmeticError) as exc:
+        raise _calculation_failed(exc) from exc
+    parameters_payload = parameters.model_dump(mode="json")
 
     with get_session() as session:
         calculation = Calculation(
-            parameters=to_serializable(parameters.model_dump()),
-            results=stored_result,
+            parameters=parameters_payload,
+            results=results_payload,
             order_reference=parameters.order_reference,
             preset_name=preset_name,
-            mp_fee_applied=float(result.mp_fee_total),
+            mp_fee_applied=float(results_payload["breakdown"]["MP_Fee_Total_ARS"]),
         )
         session.add(calculation)
+        session.flush()
+        calculation_id, created_at = calculation.id, calculation.created_at
         session.commit()
-        session.refresh(calculation)
 
-    LOGGER.info("Calculation created", extra={"id": calculation.id, "order_reference": parameters.order_reference})
+    LOGGER.info("Calculation created", extra={"id": calculation_id, "order_reference": parameters.order_reference})
+
+    body = dumps_json(
+        {
+            "calculation_id": calculation_id,
+            "created_at": created_at.isoformat(),
+            "parameters": parameters_payload,
+            "results": results_payload,
+        }
+    )
+    return StoredResponse(
+        status_code=200, body=body, etag=calculation_etag(calculation_id, 1), calculation_id=calculation_id
+    )
+
+
+@router.post("/calculations", response_model=CalculationResponse)
+async def create_calculation(
+    request: CalculationCreateRequest,
+    http_request: Request,
+    idempotency_key: Optional[str] = Header(default=None),
+) -> Response:
+    # Fingerprint the body as sent: ``request`` is filled in later (NCM rates,
+    # exchange and fx rates), so its dump changes when those sources do.
+    body = await http_request.body() if idempotency_key is not None else b""
+    return await run_in_threadpool(_calculation_response, request, idempotency_key, body)
+
+
+def _calculation_response(request: CalculationCreateRequest, idempotency_key: Optional[str], body: bytes) -> Response:
+    if idempotency_key is None:
+        stored = _create_calculation(request)
+    else:
+        if not idempotency_key or len(idempotency_key) > MAX_KEY_LENGTH:
+            raise HTTPException(status_code=400, detail="Invalid Idempotency-Key")
+        fingerprint = request_fingerprint(body)
+        try:
+            stored = run_idempotent(idempotency_key, fingerprint, lambda: _create_calculation(request))
+        except IdempotencyConflict as exc:
+            raise HTTPException(status_code=422, detail=str(exc)) from exc
+        except IdempotencyInProgress as exc:
+            raise HTTPException(status_code=409, detail=str(exc), headers={"Retry-After": "1"}) from exc
+        if stored.replayed:
+            LOGGER.info("Idempotent replay", extra={"idempotency_key": idempotency_key, "id": stored.calculation_id})
 
-    return CalculationResponse(
-        calculation_id=calculation.id,
-        created_at=calculation.created_at,
-        parameters=calculation.parameters,
-        results=calculation.results,
+    headers = validator_headers(stored.etag) if stored.etag else {}
+    if stored.replayed:
+        headers["Idempotent-Replayed"] = "true"
+    return Response(
+        content=stored.body.encode("utf-8"),
+        status_code=stored.status_code,
+        media_type="application/json",
+        headers=headers,
     )
 
 
+@router.post("/calculations/tiers")
+def calculate_tiers(request: TierPricingRequest) -> Response:
+    parameters = _resolve_parameters(request.parameters, request.preset_name)
+    try:
+        tiers = calculate_price_tiers(parameters, request.tiers)
+    except ArithmeticError as exc:
+        raise _calculation_failed(exc) from exc
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    return EncodedJSONResponse(tiers)
+
+
+@router.post("/calculations/what-if")
+def calculate_what_if(request: WhatIfRequest) -> Response:
+    parameters = _resolve_parameters(request.parameters, request.preset_name)
+    try:
+        payload = evaluate_scenarios(parameters, request.scenarios)
+    except ValidationError as exc:
+        raise HTTPException(status_code=422, detail=jsonable_encoder(exc.errors())) from exc
+    except (FormulaError, ArithmeticError) as exc:
+        raise _calculation_failed(exc) from exc
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    return EncodedJSONResponse(payload)
+
+
+@router.post("/simulations/margin-risk")
+def simulate_margin_risk_route(request: MonteCarloRequest) -> Response:
+    if request.calculation_id is not None:
+        snapshot = load_calculation_snapshot(request.calculation_id)
+        if snapshot is None:
+            raise HTTPException(status_code=404, detail="Calculation not found")
+        parameters = CalculationParameters.model_validate(snapshot[0])
+    else:
+        parameters = _resolve_parameters(request.parameters, request.preset_name)
+    try:
+        summary = simulate_margin_risk(parameters, request)
+    except (FormulaError, ArithmeticError) as exc:
+        raise _calculation_failed(exc) from exc
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    return EncodedJSONResponse(summary)
+
+
+def _archived_calculation(calculation_id: int) -> Dict[str, Any]:
+    archived = find_archived_calculation(calculation_id)
+    if archived is None:
+        raise HTTPException(status_code=404, detail="Calculation not found")
+    return archived
+
+
+def _current_revision(calculation_id: int) -> int:
+    with get_session() as session:
+        revision = session.exec(select(Calculation.revision).where(Calculation.id == calculation_id)).first()
+    if revision is None:
+        return _archived_calculation(calculation_id)["revision"]
+    return revision
+
+
+@router.get("/calculations")
+def list_calculations_route(
+    before: Optional[int] = Query(default=None, ge=1),
+    limit: int = Query(default=50, ge=1, le=500),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    order_reference: Optional[str] = None,
+    preset_name: Optional[str] = None,
+) -> Response:
+    page = list_calculations(before, limit, since, until, order_reference, preset_name)
+    return EncodedJSONResponse({**page, "replica": reporting_status()})
+
+
 @router.get("/calculations/{calculation_id}", response_model=CalculationResponse)
-def get_calculation(calculation_id: int) -> CalculationResponse:
+def get_calculation(calculation_id: int, if_none_match: Optional[str] = Header(default=None)) -> Response:
+    if if_none_match:
+        # Answer polling clients from the revision alone, without reading the JSON blobs.
+        etag = calculation_etag(calculation_id, _current_revision(calculation_id))
+        if etag_matches(if_none_match, etag):
+            return not_modified_response(etag)
+
+    statement = select(
+        Calculation.revision,
+        Calculation.created_at,
+        type_coerce(Calculation.parameters, LargeBinary),
+        type_coerce(Calculation.results, LargeBinary),
+    ).where(Calculation.id == calculation_id)
     with get_session() as session:
-        calculation = session.get(Calculation, calculation_id)
-        if not calculation:
-            raise HTTPException(status_code=404, detail="Calculation not found")
-    return CalculationResponse(
-        calculation_id=calculation.id,
-        created_at=calculation.created_at,
-        parameters=calculation.parameters,
-        results=calculation.results,
+        row = session.exec(statement).first()
+    if row:
+        # Render the stored blobs straight to JSON text, skipping the dict round trip.
+        revision, created_at, parameters_blob, results_blob = row
+        parameters_json, results_json = decode_json(parameters_blob), decode_json(results_blob)
+    else:
+        archived = _archived_calculation(calculation_id)
+        revision = archived["revision"]
+        created_at = datetime.fromisoformat(archived["created_at"])
+        parameters_json = dumps_json(archived["parameters"])
+        results_json = dumps_json(archived["results"])
+    etag = calculation_etag(calculation_id, revision)
+    if etag_matches(if_none_match, etag):
+        return not_modified_response(etag)
+    return raw_calculation_response(
+        calculation_id, created_at, parameters_json, results_json, headers=validator_headers(etag)
     )
 
 
+_EXPORT_MEDIA_TYPES = {
+    "csv": "text/csv",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+_EXPORT_CHUNK_BYTES = 64 * 1024
+
+
+def _read_chunks(handle: BinaryIO) -> Iterator[bytes]:
+    with handle:
+        while chunk := handle.read(_EXPORT_CHUNK_BYTES):
+            yield chunk
+
+
+def _export_headers(etag: str, format: str, size: int) -> Dict[str, str]:
+    return {
+        **validator_headers(etag),
+        "Content-Length": str(size),
+        "Content-Disposition": f'attachment; filename="{default_filename("calculo", format)}"',
+    }
+
+
 @router.get("/calculations/{calculation_id}/export")
-def export_calculation(calculation_id: int, format: str = "csv") -> StreamingResponse:
-    with get_session() as session:
-        calculation = session.get(Calculation, calculation_id)
-        if not calculation:
-            raise HTTPException(status_code=404, detail="Calculation not found")
+def export_calculation(
+    calculation_id: int,
+    format: str = "csv",
+    if_none_match: Optional[str] = Header(default=None),
+) -> Response:
+    if format not in _EXPORT_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail="Unsupported export format")
 
-    breakdown = calculation.results.get("breakdown", {})
+    revision = _current_revision(calculation_id)
+    etag = calculation_etag(calculation_id, revision, format)
+    if etag_matches(if_none_match, etag):
+        return not_modified_response(etag)
 
-    if format == "csv":
-        content = export_to_csv(breakdown)
-        filename = default_filename("calculo", "csv")
-        media_type = "text/csv"
-    elif format == "xlsx":
-        content = export_to_xlsx(breakdown)
-        filename = default_filename("calculo", "xlsx")
-        media_type = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    cache = get_export_cache()
+    handle = cache.open(calculation_id, revision, format)
+    if handle is not None:
+        return StreamingResponse(
+            _read_chunks(handle),
+            media_type=_EXPORT_MEDIA_TYPES[format],
+            headers=_export_headers(etag, format, os.fstat(handle.fileno()).st_size),
+        )
+
+    statement = select(Calculation.revision, Calculation.results).where(Calculation.id == calculation_id)
+    with get_reporting_session() as session:
+        row = session.exec(statement).first()
+    if row is None or row[0] < revision:
+        # Not in the replica yet, or changed since it was copied.
+        with get_session() as session:
+            row = session.exec(statement).first()
+    # The row may have moved on since the revision lookup; key the artifact by what was rendered.
+    if row:
+        revision, results = row
     else:
-        raise HTTPException(status_code=400, detail="Unsupported export format")
+        archived = _archived_calculation(calculation_id)
+        revision, results = archived["revision"], archived["results"]
+    etag = calculation_etag(calculation_id, revision, format)
+    breakdown = results.get("breakdown", {})
+    content = export_to_csv(breakdown) if format == "csv" else export_to_xlsx(breakdown)
+    cache.put(calculation_id, revision, format, content)
+    # Serve the rendered bytes: the artifact may be evicted before a path could be opened.
+    return Response(
+        content, media_type=_EXPORT_MEDIA_TYPES[format], headers=_export_headers(etag, format, len(content))
+    )
+
+
+@router.get("/reports/calculations")
+def calculations_report_route(
+    group_by: Literal["day", "month", "preset"] = "day",
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+) -> Response:
+    report = summarize_calculations(group_by, since, until)
+    return EncodedJSONResponse({**report, "replica": reporting_status()})
 
-    return StreamingResponse(iter([content]), media_type=media_type, headers={"Content-Disposition": f"attachment; filename={filename}"})
+
+@router.get("/reports/replica")
+def replica_status_route() -> Dict[str, Any]:
+    return reporting_status()
+
+
+@router.post("/reports/replica/refresh")
+def refresh_replica_route() -> Dict[str, Any]:
+    replica = get_reporting_replica()
+    if replica is None:
+        raise HTTPException(status_code=409, detail="Reporting replica is disabled")
+    return replica.refresh()
 
 
 @router.post("/presets", response_model=PresetResponse)
@@ -131,6 +389,162 @@ def list_presets_route() -> list[PresetResponse]:
     return [PresetResponse(id=p.id, name=p.name, description=p.description, parameters=p.parameters) for p in presets]
 
 
+@router.post("/presets/compare")
+def compare_presets_route(payload: PresetComparisonRequest) -> Response:
+    return EncodedJSONResponse(compare_presets(payload))
+
+
+@router.post("/ncm/import")
+def import_ncm_route(file: UploadFile = File(...), replace: bool = Query(default=False)) -> Response:
+    try:
+        summary = import_file(file.file.read(), file.filename or "", replace=replace)
+    except NcmImportError as exc:
+        raise HTTPException(status_code=422, detail=str(exc)) from exc
+    return EncodedJSONResponse(summary)
+
+
+@router.post("/exchange-rates/import")
+def import_exchange_rates_route(
+    file: UploadFile = File(...), source_key: Optional[str] = Query(default=None)
+) -> Response:
+    try:
+        summary = import_csv(file.file.read(), source_key)
+    except ExchangeRateImportError as exc:
+        raise HTTPException(status_code=422, detail=str(exc)) from exc
+    return EncodedJSONResponse(summary)
+
+
+@router.get("/exchange-rates")
+def list_exchange_rate_sources_route() -> Response:
+    return EncodedJSONResponse(get_exchange_rate_index().sources())
+
+
+@router.get("/exchange-rates/cross-rates")
+def get_cross_rates_route(as_of: Optional[date] = Query(default=None, alias="date")) -> Response:
+    return EncodedJSONResponse(cross_rates_as_of(as_of).as_dict())
+
+
+@router.get("/exchange-rates/{source_key}")
+def get_exchange_rate_route(source_key: str, as_of: Optional[date] = Query(default=None, alias="date")) -> Response:
+    try:
+        point = rate_as_of(source_key, as_of)
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc)) from exc
+    if point is None:
+        raise HTTPException(status_code=404, detail="No exchange rate on or before that date")
+    return EncodedJSONResponse(asdict(point))
+
+
+@router.get("/ncm/{code}")
+def get_ncm_route(code: str) -> Response:
+    try:
+        entry = lookup_ncm(code)
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc)) from exc
+    if entry is None:
+        raise HTTPException(status_code=404, detail="No NCM position matches this code")
+    return EncodedJSONResponse({"query": normalize_ncm_code(code), **asdict(entry)})
+
+
+def _job_view(job) -> Dict[str, Any]:
+    return JobResponse.model_validate(job, from_attributes=True).model_dump(mode="json")
+
+
+@router.post("/jobs", status_code=202, response_model=JobResponse)
+def submit_job_route(request: JobSubmitRequest) -> Response:
+    try:
+        job = submit_job(request.kind, request.payload)
+    except ValidationError as exc:
+        raise HTTPException(status_code=422, detail=jsonable_encoder(exc.errors())) from exc
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    return EncodedJSONResponse(_job_view(job), status_code=202, headers={"Location": f"/api/jobs/{job.id}"})
+
+
+@router.post("/calculations/import-store", status_code=202, response_model=JobResponse)
+def import_store_route(
+    file: UploadFile = File(...), chunk_size: int = Query(default=500, ge=1, le=10_000)
+) -> Response:
+    path = spool_upload(file.file)
+    job = submit_job("store_import", {"path": str(path), "chunk_size": chunk_size, "remove_when_done": True})
+    return EncodedJSONResponse(_job_view(job), status_code=202, headers={"Location": f"/api/jobs/{job.id}"})
+
+
+def _require_job(job_id: int):
+    job = get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@router.get("/jobs/{job_id}", response_model=JobResponse)
+def get_job_route(job_id: int) -> Response:
+    return EncodedJSONResponse(_job_view(_require_job(job_id)))
+
+
+@router.get("/jobs/{job_id}/items")
+def list_job_items_route(job_id: int, after: int = 0, limit: int = Query(default=100, ge=1, le=1000)) -> Response:
+    _require_job(job_id)
+    items = list_job_items(job_id, after, limit)
+    return EncodedJSONResponse({"items": [{"seq": item.seq, **item.data} for item in items]})
+
+
+_SSE_POLL_SECONDS = 0.5
+_SSE_KEEPALIVE_SECONDS = 15.0
+
+
+@router.get("/jobs/{job_id}/events")
+async def job_events(job_id: int, last_event_id: Optional[str] = Header(default=None)) -> StreamingResponse:
+    """Stream ``progress``, ``item`` and a final ``end`` event for a job.
+
+    State is read back from the database, so the stream works whichever worker
+    or process runs the job. ``item`` events carry their sequence number as the
+    SSE id; a reconnecting client sending ``Last-Event-ID`` resumes after it.
+    """
+
+    await run_in_threadpool(_require_job, job_id)
+    after = int(last_event_id) if last_event_id and last_event_id.isdigit() else 0
+
+    async def stream():
+        nonlocal after
+        last_progress = None
+        idle = 0.0
+        while True:
+            job = await run_in_threadpool(get_job, job_id)
+            items = await run_in_threadpool(list_job_items, job_id, after, 500)
+            for item in items:
+                after = item.seq
+                yield sse_event("item", {"seq": item.seq, **item.data}, event_id=item.seq)
+            progress = (job.status, job.progress_done, job.progress_total)
+            if progress != last_progress:
+                last_progress = progress
+                yield sse_event(
+                    "progress", {"status": job.status, "done": job.progress_done, "total": job.progress_total}
+                )
+            if job.status in TERMINAL_STATUSES and len(items) < 500:
+                yield sse_event("end", _job_view(job))
+                return
+            if items:
+                idle = 0.0
+            elif idle >= _SSE_KEEPALIVE_SECONDS:
+                idle = 0.0
+                yield ": keep-alive\n\n"
+            await asyncio.sleep(_SSE_POLL_SECONDS)
+            idle += _SSE_POLL_SECONDS
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+@router.get("/metrics/admission")
+def admission_metrics() -> Dict[str, Any]:
+    return get_admission_controller().snapshot()
+
+
+@router.get("/metrics/cache")
+def cache_metrics() -> Dict[str, Any]:
+    return get_cache().stats()
+
+
 @router.post("/payments/notify")
 def payment_notification(payload: PaymentNotificationRequest) -> Dict[str, Any]:
     notification, calculation = process_payment_notification(payload)
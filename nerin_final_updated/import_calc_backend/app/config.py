@@ -2,7 +2,7 @@ from __future__ import annotations
 
 from functools import lru_cache
 from pathlib import Path
-from typing import List, Optional
+from typing import Dict, List, Literal, Optional
 
 from pydantic import BaseModel, Field
 from pydantic_settings import BaseSettings
@@ -19,6 +19,77 @@ class EnvironmentSettings(BaseSettings):
     log_level: str = Field(default="INFO")
     payment_provider_token: Optional[str] = None
     environment: str = Field(default="dev")
+    gzip_minimum_size: int = Field(default=1024, description="Smallest response body (bytes) worth compressing")
+    export_cache_dir: str = Field(
+        default=str(Path(__file__).resolve().parent.parent / "cache" / "exports"),
+        description="Directory holding rendered CSV/XLSX exports",
+    )
+    export_cache_max_bytes: int = Field(default=64 * 1024 * 1024, description="Disk budget for cached exports")
+    cache_backend: Literal["sqlite", "memory"] = Field(
+        default="sqlite", description="Shared cache for presets and results: SQLite file (all workers) or in-process"
+    )
+    cache_path: str = Field(
+        default=str(Path(__file__).resolve().parent.parent / "cache" / "shared.sqlite3"),
+        description="SQLite file of the shared cache",
+    )
+    cache_max_bytes: int = Field(default=32 * 1024 * 1024, ge=1, description="Budget of cached values")
+    idempotency_ttl_seconds: int = Field(default=24 * 3600, ge=1, description="How long Idempotency-Key replays last")
+    idempotency_wait_seconds: float = Field(
+        default=30.0, description="How long a duplicate waits for another worker's in-flight request"
+    )
+    admission_enabled: bool = Field(default=True, description="Apply per-route-class concurrency limits")
+    admission_total_limit: int = Field(
+        default=24, ge=1, description="Requests running at once across all classes (keep below the threadpool size)"
+    )
+    admission_webhook_reserved: int = Field(
+        default=4, ge=0, description="Slots of the total only payment webhooks may use"
+    )
+    admission_limits: Dict[str, int] = Field(
+        default_factory=lambda: {"webhook": 8, "default": 16, "export": 4, "batch": 2},
+        description="Concurrent requests per route class",
+    )
+    admission_queue_sizes: Dict[str, int] = Field(
+        default_factory=lambda: {"webhook": 64, "default": 32, "export": 8, "batch": 4},
+        description="Requests allowed to wait per route class before 429",
+    )
+    admission_queue_timeout_seconds: float = Field(default=5.0, description="Longest wait in queue before 503")
+    job_workers: int = Field(default=2, ge=0, description="Background job worker threads; 0 disables them")
+    job_poll_interval_seconds: float = Field(default=1.0, description="How often idle workers look for queued jobs")
+    job_stale_seconds: float = Field(
+        default=60.0, description="Running jobs without a heartbeat for this long are requeued"
+    )
+    archive_dir: str = Field(
+        default=str(Path(__file__).resolve().parent.parent / "archive"),
+        description="Directory holding compressed NDJSON archive segments",
+    )
+    store_import_dir: str = Field(
+        default=str(Path(__file__).resolve().parent.parent / "imports"),
+        description="Directory where uploaded Node store files wait for their import job",
+    )
+    archive_after_days: int = Field(default=365, ge=1, description="Age after which rows move to the archive")
+    archive_interval_seconds: int = Field(default=3600, ge=0, description="Archival/VACUUM period; 0 disables it")
+    archive_batch_size: int = Field(default=500, ge=1, description="Rows per compressed archive member")
+    archive_segment_max_bytes: int = Field(default=16 * 1024 * 1024, description="Size at which a segment rotates")
+    vacuum_pages: int = Field(default=2000, ge=0, description="Free pages released per incremental VACUUM")
+    reporting_replica: bool = Field(
+        default=False, description="Serve listings, exports and reports from a read-only copy of the database"
+    )
+    reporting_replica_path: str = Field(
+        default=str(Path(__file__).resolve().parent.parent / "replica" / "reporting.db"),
+        description="SQLite file holding the reporting replica",
+    )
+    reporting_refresh_seconds: float = Field(
+        default=300.0, ge=0, description="How often the reporting replica is refreshed; 0 refreshes only on demand"
+    )
+    presets_reload_seconds: float = Field(
+        default=5.0, ge=0, description="How often defaults.yaml is checked for changes; 0 reads it only at startup"
+    )
+    ncm_refresh_seconds: float = Field(
+        default=30.0, ge=0, description="How often the in-memory NCM trie checks the table for a newer load"
+    )
+    exchange_rate_refresh_seconds: float = Field(
+        default=30.0, ge=0, description="How often the in-memory rate series check the table for a newer load"
+    )
 
     model_config = {
         "env_prefix": "IMPORT_CALC_",
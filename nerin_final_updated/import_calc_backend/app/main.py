@@ -6,33 +6,57 @@ from datetime import datetime
 import pytz
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 
+from .api.admission import AdmissionControlMiddleware, get_admission_controller
 from .api.routes import router
 from .config import get_settings
 from .logger import configure_logging
+from .services.archival import ArchiveScheduler
+from .services.jobs import JobWorkerPool
 from .storage.database import init_db
+from .storage.replica import ReplicaRefresher, get_reporting_replica
 
 configure_logging()
 settings = get_settings()
 
 app = FastAPI(title="Import Cost Calculator", version="1.0.0")
+if settings.admission_enabled:
+    # Added first so it runs innermost: rejections still get CORS headers and gzip.
+    app.add_middleware(AdmissionControlMiddleware, controller=get_admission_controller())
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "Idempotent-Replayed", "Retry-After"],
 )
+app.add_middleware(GZipMiddleware, minimum_size=settings.gzip_minimum_size, compresslevel=6)
 
 app.include_router(router)
 
+archive_scheduler = ArchiveScheduler(settings.archive_interval_seconds)
+replica_refresher = ReplicaRefresher(get_reporting_replica(), settings.reporting_refresh_seconds)
+job_workers = JobWorkerPool(settings.job_workers, settings.job_poll_interval_seconds, settings.job_stale_seconds)
+
 
 @app.on_event("startup")
 def startup() -> None:
     init_db()
+    archive_scheduler.start()
+    replica_refresher.start()
+    job_workers.start()
     logging.getLogger(__name__).info("Application started", extra={"environment": settings.environment})
 
 
+@app.on_event("shutdown")
+def shutdown() -> None:
+    job_workers.stop()
+    replica_refresher.stop()
+    archive_scheduler.stop()
+
+
 @app.get("/health")
 def health_check() -> dict[str, str]:
     tz = pytz.timezone(settings.default_timezone)
@@ -1,23 +1,40 @@
 from __future__ import annotations
 
-from datetime import datetime
+import re
+from datetime import date, datetime
 from decimal import Decimal
-from typing import Any, Dict, List, Literal, Optional
+from typing import Any, Dict, Iterable, List, Literal, Optional
 
 from pydantic import BaseModel, Field, field_validator, model_validator
 
 from .utils.decimal_utils import to_decimal
 
+_CURRENCY_PATTERN = re.compile(r"^[A-Z]{3}$")
+# Converted with tc_aduana rather than through fx_rates.
+_CUSTOMS_CURRENCIES = {"USD", "ARS"}
+
+
+def normalize_currency(value: Any) -> str:
+    code = str(value).strip().upper()
+    if not _CURRENCY_PATTERN.match(code):
+        raise ValueError(f"Invalid ISO 4217 currency code '{value}'")
+    return code
+
 
 class MoneyInput(BaseModel):
     amount: Decimal = Field(..., description="Numeric amount as decimal")
-    currency: Literal["USD", "ARS"] = Field(default="USD")
+    currency: str = Field(default="USD", description="Código ISO 4217; fuera de USD y ARS se convierte con fx_rates")
 
     @field_validator("amount", mode="before")
     @classmethod
     def _validate_amount(cls, value: Any) -> Decimal:
         return to_decimal(value)
 
+    @field_validator("currency", mode="before")
+    @classmethod
+    def _validate_currency(cls, value: Any) -> str:
+        return normalize_currency(value)
+
 
 class CostBreakdownInput(BaseModel):
     fob: MoneyInput = Field(...)
@@ -27,16 +44,26 @@ class CostBreakdownInput(BaseModel):
 
 class AdditionalTaxInput(BaseModel):
     name: str
-    base: Literal["CIF", "BaseIVA", "ARS"]
+    base: Literal["CIF", "BaseIVA", "ARS", "formula"]
     rate: Optional[Decimal] = None
     amount_ars: Optional[Decimal] = Field(default=None, description="Fixed amount in ARS if base is ARS")
+    amount: Optional[MoneyInput] = Field(
+        default=None, description="Fixed amount in any currency if base is ARS, instead of amount_ars"
+    )
+    formula: Optional[str] = Field(default=None, description="USD amount as an expression if base is formula")
 
     @model_validator(mode="after")
     def validate_consistency(self) -> "AdditionalTaxInput":
-        if self.base == "ARS" and self.amount_ars is None:
-            raise ValueError("amount_ars is required when base is ARS")
-        if self.base != "ARS" and self.rate is None:
+        if self.base == "ARS" and (self.amount_ars is None) == (self.amount is None):
+            raise ValueError("Exactly one of amount_ars or amount is required when base is ARS")
+        if self.base in ("CIF", "BaseIVA") and self.rate is None:
             raise ValueError("rate is required when base is CIF or BaseIVA")
+        if self.base == "formula":
+            if not self.formula:
+                raise ValueError("formula is required when base is formula")
+            from .services.tax_formulas import compile_formula
+
+            compile_formula(self.formula)
         return self
 
     @field_validator("rate", mode="before")
@@ -68,14 +95,54 @@ class RoundingRule(BaseModel):
         return to_decimal(value)
 
 
+def _resolve_usd_rates(
+    moneys: Iterable[Optional[MoneyInput]], fx_rates: Dict[str, Decimal], day: Optional[date]
+) -> Dict[str, Decimal]:
+    """``fx_rates`` completed with the rates of every currency in ``moneys`` it lacks."""
+
+    missing = {money.currency for money in moneys if money is not None} - _CUSTOMS_CURRENCIES - set(fx_rates)
+    if not missing:
+        return fx_rates
+    # Imported lazily, like the other rate lookups: the schemas must not bind the database engine.
+    from .services.exchange_rates import usd_rates
+
+    return {**fx_rates, **usd_rates(missing, day)}
+
+
+def _validate_fx_rates(value: Any) -> Dict[str, Decimal]:
+    rates = {normalize_currency(currency): to_decimal(rate) for currency, rate in (value or {}).items()}
+    if any(rate <= 0 for rate in rates.values()):
+        raise ValueError("fx_rates must be positive")
+    return rates
+
+
 class CalculationParameters(BaseModel):
     costs: CostBreakdownInput
-    tc_aduana: Decimal
+    tc_aduana: Optional[Decimal] = None
     tc_aduana_source: Optional[str] = Field(default=None, description="Descripción legible del tipo de cambio utilizado")
     tc_aduana_source_key: Optional[str] = Field(
         default=None, description="Identificador interno del tipo de cambio seleccionado"
     )
-    di_rate: Decimal
+    tc_aduana_date: Optional[date] = Field(
+        default=None, description="Fecha de la cotización a usar si tc_aduana no se informa; por defecto hoy"
+    )
+    tc_aduana_rate_date: Optional[date] = Field(
+        default=None, description="Fecha de la cotización histórica que resolvió tc_aduana"
+    )
+    fx_date: Optional[date] = Field(
+        default=None, description="Fecha de las cotizaciones cruzadas (fuentes fx.*); por defecto tc_aduana_date u hoy"
+    )
+    fx_rates: Dict[str, Decimal] = Field(
+        default_factory=dict,
+        description="USD por unidad de cada moneda distinta de USD y ARS; las faltantes salen de exchange_rates",
+    )
+    ncm_code: Optional[str] = Field(
+        default=None, description="Posición NCM; completa di_rate y apply_tasa_estadistica si no se informan"
+    )
+    ncm_position: Optional[str] = Field(
+        default=None, description="Posición de la tabla NCM que resolvió las alícuotas"
+    )
+    di_rate: Optional[Decimal] = None
     apply_tasa_estadistica: bool = True
     iva_rate: Decimal = Field(default=Decimal("0.21"))
     perc_iva_rate: Decimal = Field(default=Decimal("0.20"))
@@ -92,8 +159,52 @@ class CalculationParameters(BaseModel):
     rounding: Optional[RoundingRule] = None
     order_reference: Optional[str] = None
 
+    @model_validator(mode="before")
+    @classmethod
+    def _resolve_ncm(cls, data: Any) -> Any:
+        if not isinstance(data, dict) or not data.get("ncm_code"):
+            return data
+        missing_rate = data.get("di_rate") is None
+        missing_tasa = data.get("apply_tasa_estadistica") is None
+        # Rates already present win, so re-validating stored parameters keeps
+        # them stable even after a newer tariff table is loaded.
+        if not (missing_rate or missing_tasa):
+            return data
+        # Imported lazily (here and for exchange rates): the schemas must not bind the database engine.
+        from .services.ncm import lookup_ncm
+
+        entry = lookup_ncm(data["ncm_code"])
+        if entry is None:
+            raise ValueError(f"No NCM position matches '{data['ncm_code']}'")
+        data = dict(data, ncm_position=entry.code)
+        if missing_rate:
+            data["di_rate"] = entry.di_rate
+        if missing_tasa:
+            data["apply_tasa_estadistica"] = entry.apply_tasa_estadistica
+        return data
+
+    @model_validator(mode="before")
+    @classmethod
+    def _resolve_exchange_rate(cls, data: Any) -> Any:
+        if not isinstance(data, dict) or data.get("tc_aduana") is not None or not data.get("tc_aduana_source_key"):
+            return data
+        from .services.exchange_rates import rate_as_of
+
+        requested = data.get("tc_aduana_date")
+        day = date.fromisoformat(requested) if isinstance(requested, str) else requested
+        point = rate_as_of(data["tc_aduana_source_key"], day)
+        if point is None:
+            raise ValueError(
+                f"No '{data['tc_aduana_source_key']}' exchange rate on or before {day or 'today'}"
+            )
+        return dict(data, tc_aduana=point.rate, tc_aduana_rate_date=point.rate_date)
+
     @model_validator(mode="after")
     def validate_rates(self) -> "CalculationParameters":
+        if self.tc_aduana is None:
+            raise ValueError("tc_aduana is required unless tc_aduana_source_key resolves it")
+        if self.di_rate is None:
+            raise ValueError("di_rate is required unless ncm_code resolves it")
         if not (Decimal("0") <= self.di_rate <= Decimal("1")):
             raise ValueError("di_rate must be between 0 and 1")
         if self.mp_rate is not None and self.mp_rate >= Decimal("1"):
@@ -107,6 +218,27 @@ class CalculationParameters(BaseModel):
             raise ValueError("precio_neto_input_ars is required when target is 'precio'")
         return self
 
+    @model_validator(mode="after")
+    def _resolve_fx_rates(self) -> "CalculationParameters":
+        # Rates already present win, as with tc_aduana, so stored parameters recalculate the same.
+        costs = self.costs
+        moneys = [costs.fob, costs.freight, costs.insurance, *(tax.amount for tax in self.additional_taxes)]
+        self.fx_rates = _resolve_usd_rates(moneys, self.fx_rates, self.fx_date or self.tc_aduana_date)
+        return self
+
+    @model_validator(mode="after")
+    def _check_tax_formulas(self) -> "CalculationParameters":
+        if any(tax.base == "formula" for tax in self.additional_taxes):
+            from .services.tax_formulas import check_tax_formulas
+
+            check_tax_formulas(self.additional_taxes)
+        return self
+
+    @field_validator("fx_rates", mode="before")
+    @classmethod
+    def _convert_fx_rates(cls, value: Any) -> Dict[str, Decimal]:
+        return _validate_fx_rates(value)
+
     @field_validator(
         "tc_aduana",
         "di_rate",
@@ -153,6 +285,199 @@ class PresetResponse(BaseModel):
     parameters: Dict[str, Any]
 
 
+TierComponent = Literal["freight", "insurance", "gastos_locales_ars", "costos_salida_ars", "additional_taxes_ars"]
+
+
+class TierPricingInput(BaseModel):
+    quantities: List[int] = Field(..., min_length=1, description="Cantidades de corte, p. ej. [1, 5, 10, 50, 100]")
+    per_shipment: List[TierComponent] = Field(
+        default_factory=lambda: ["freight", "insurance", "gastos_locales_ars", "additional_taxes_ars"],
+        description="Costos que se pagan una vez por embarque y se prorratean; el resto es por unidad",
+    )
+
+    @field_validator("quantities")
+    @classmethod
+    def _validate_quantities(cls, value: List[int]) -> List[int]:
+        if any(quantity < 1 for quantity in value):
+            raise ValueError("quantities must be greater than or equal to 1")
+        return sorted(set(value))
+
+
+class TierPricingRequest(BaseModel):
+    preset_name: Optional[str] = None
+    parameters: CalculationParameters
+    tiers: TierPricingInput
+
+
+class WhatIfRequest(BaseModel):
+    preset_name: Optional[str] = None
+    parameters: CalculationParameters
+    scenarios: List[Dict[str, Any]] = Field(
+        ...,
+        min_length=1,
+        max_length=200,
+        description="Cambios parciales sobre los parámetros base (los objetos anidados se combinan)",
+    )
+
+
+class PresetComparisonRequest(BaseModel):
+    costs: CostBreakdownInput
+    tc_aduana: Decimal
+    parameters: Dict[str, Any] = Field(
+        default_factory=dict,
+        description="Parámetros comunes (target, margen_objetivo, gastos...); los presets pisan las alícuotas",
+    )
+    preset_names: Optional[List[str]] = Field(default=None, description="Limita la comparación a estos presets")
+    rank_by: Literal[
+        "costo_puesto_ars", "precio_neto_ars", "precio_final_ars", "utilidad_ars", "margen"
+    ] = Field(default="precio_final_ars")
+    fx_date: Optional[date] = None
+    fx_rates: Dict[str, Decimal] = Field(default_factory=dict)
+
+    @field_validator("tc_aduana", mode="before")
+    @classmethod
+    def _convert_decimal(cls, value: Any) -> Decimal:
+        return to_decimal(value)
+
+    @field_validator("fx_rates", mode="before")
+    @classmethod
+    def _convert_fx_rates(cls, value: Any) -> Dict[str, Decimal]:
+        return _validate_fx_rates(value)
+
+    @model_validator(mode="after")
+    def _resolve_fx_rates(self) -> "PresetComparisonRequest":
+        costs = self.costs
+        self.fx_rates = _resolve_usd_rates([costs.fob, costs.freight, costs.insurance], self.fx_rates, self.fx_date)
+        return self
+
+
+class DistributionInput(BaseModel):
+    """Random variable for a simulation; ``mean`` defaults to the quoted value."""
+
+    kind: Literal["normal", "lognormal", "uniform", "triangular"]
+    mean: Optional[Decimal] = None
+    std: Optional[Decimal] = Field(default=None, description="Desvío estándar absoluto (normal y lognormal)")
+    low: Optional[Decimal] = None
+    high: Optional[Decimal] = None
+    mode: Optional[Decimal] = Field(default=None, description="Moda de la triangular; por defecto la media")
+
+    @model_validator(mode="after")
+    def validate_shape(self) -> "DistributionInput":
+        if self.kind in ("normal", "lognormal"):
+            if self.std is None or self.std < 0:
+                raise ValueError(f"std is required and must be non-negative for a {self.kind} distribution")
+        else:
+            if self.low is None or self.high is None or self.low > self.high:
+                raise ValueError(f"low <= high is required for a {self.kind} distribution")
+        return self
+
+    @field_validator("mean", "std", "low", "high", "mode", mode="before")
+    @classmethod
+    def _convert_decimal(cls, value: Any) -> Optional[Decimal]:
+        if value is None:
+            return value
+        return to_decimal(value)
+
+
+class MonteCarloRequest(BaseModel):
+    calculation_id: Optional[int] = None
+    preset_name: Optional[str] = None
+    parameters: Optional[CalculationParameters] = None
+    tc_aduana: DistributionInput
+    freight: Optional[DistributionInput] = Field(
+        default=None, description="Flete en la moneda en que se cotizó; por defecto queda fijo"
+    )
+    scenarios: int = Field(default=20000, ge=100, le=500000)
+    seed: int = Field(default=0, description="Semilla del generador; la misma semilla reproduce el resultado")
+    percentiles: List[float] = Field(default_factory=lambda: [5.0, 25.0, 50.0, 75.0, 95.0])
+
+    @model_validator(mode="after")
+    def validate_source(self) -> "MonteCarloRequest":
+        if (self.calculation_id is None) == (self.parameters is None):
+            raise ValueError("Provide exactly one of calculation_id or parameters")
+        if any(not 0 <= value <= 100 for value in self.percentiles):
+            raise ValueError("percentiles must be between 0 and 100")
+        return self
+
+
+class RepriceItemInput(BaseModel):
+    reference: str
+    fob: MoneyInput
+    freight: Optional[MoneyInput] = None
+    insurance: Optional[MoneyInput] = None
+    quantity: Optional[int] = Field(default=None, ge=1)
+
+
+class RepriceJobPayload(BaseModel):
+    preset_name: Optional[str] = None
+    parameters: Dict[str, Any] = Field(
+        ..., description="Parámetros comunes; cada ítem reemplaza FOB (y flete/seguro si los informa)"
+    )
+    items: List[RepriceItemInput] = Field(..., min_length=1)
+
+
+class RevalueJobPayload(BaseModel):
+    tc_aduana: Decimal
+    calculation_ids: List[int] = Field(..., min_length=1)
+
+    @field_validator("tc_aduana", mode="before")
+    @classmethod
+    def _convert_decimal(cls, value: Any) -> Decimal:
+        return to_decimal(value)
+
+
+class StoreCalculationRecord(BaseModel):
+    """One entry of ``calculations`` in the Node ``import-calculator-store.json``."""
+
+    id: Optional[int] = Field(default=None, ge=1)
+    created_at: Optional[datetime] = None
+    parameters: CalculationParameters
+    results: Dict[str, Any]
+    order_reference: Optional[str] = None
+    preset_name: Optional[str] = None
+    mp_fee_applied: Optional[float] = None
+    mp_fee_details: Optional[Dict[str, Any]] = None
+
+
+class StoreNotificationRecord(BaseModel):
+    """One entry of ``notifications`` in the Node store."""
+
+    payment_id: str = Field(..., min_length=1)
+    order_reference: Optional[str] = None
+    amount: float
+    currency: str
+    fee_total: float
+    fee_breakdown: Dict[str, Any] = Field(default_factory=dict)
+    raw_payload: Dict[str, Any] = Field(default_factory=dict)
+    received_at: Optional[datetime] = None
+
+
+class StoreImportJobPayload(BaseModel):
+    path: str = Field(..., description="Archivo JSON del store de Node, accesible desde el servidor")
+    chunk_size: int = Field(default=500, ge=1, le=10_000)
+    remove_when_done: bool = Field(default=False, description="Borra el archivo al terminar (subidas por la API)")
+
+
+class JobSubmitRequest(BaseModel):
+    kind: str
+    payload: Dict[str, Any] = Field(default_factory=dict)
+
+
+class JobResponse(BaseModel):
+    id: int
+    kind: str
+    status: str
+    progress_done: int
+    progress_total: Optional[int]
+    items_count: int
+    attempts: int
+    result: Optional[Dict[str, Any]]
+    error: Optional[str]
+    created_at: datetime
+    started_at: Optional[datetime]
+    finished_at: Optional[datetime]
+
+
 class PaymentNotificationRequest(BaseModel):
     payment_id: str
     order_reference: Optional[str] = None
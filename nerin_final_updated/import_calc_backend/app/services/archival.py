@@ -0,0 +1,274 @@
+from __future__ import annotations
+
+import argparse
+import logging
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Collection, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import delete, func, or_
+from sqlalchemy.orm import undefer
+from sqlmodel import select
+
+from ..config import get_settings
+from ..storage.archive import ArchiveSegmentStore
+from ..storage.database import enable_incremental_vacuum, get_session, incremental_vacuum, init_db
+from ..storage.models import ArchivedRecord, Calculation, PaymentNotification
+from ..utils.serialization import dumps_json
+from .idempotency import purge_expired
+
+try:  # pragma: no cover - fcntl is POSIX only
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+LOGGER = logging.getLogger(__name__)
+
+CALCULATIONS = Calculation.__tablename__
+PAYMENT_NOTIFICATIONS = PaymentNotification.__tablename__
+
+
+@dataclass(frozen=True)
+class _ArchivedTable:
+    model: Any
+    age_column: Any
+
+
+_TABLES = (
+    _ArchivedTable(Calculation, Calculation.created_at),
+    _ArchivedTable(PaymentNotification, PaymentNotification.received_at),
+)
+
+_RUN_LOCK = threading.Lock()
+
+
+@lru_cache()
+def get_archive_store() -> ArchiveSegmentStore:
+    settings = get_settings()
+    return ArchiveSegmentStore(Path(settings.archive_dir), settings.archive_segment_max_bytes)
+
+
+@contextmanager
+def _exclusive_run() -> Iterator[bool]:
+    """Yield whether this process won the right to archive.
+
+    Several workers may share one database and archive directory; a
+    non-blocking ``flock`` lets exactly one of them append segments per run.
+    """
+
+    if not _RUN_LOCK.acquire(blocking=False):
+        yield False
+        return
+    try:
+        if fcntl is None:
+            yield True
+            return
+        directory = Path(get_settings().archive_dir)
+        directory.mkdir(parents=True, exist_ok=True)
+        with (directory / ".lock").open("w") as handle:
+            try:
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            yield True
+    finally:
+        _RUN_LOCK.release()
+
+
+def _archive_batch(table: _ArchivedTable, cutoff: datetime, batch_size: int) -> int:
+    model = table.model
+    with get_session() as session:
+        # SQLite hands out ``max(id) + 1`` for new rows, so archiving the newest
+        # row could let a later insert reuse an id the archive index still owns.
+        newest_id = session.exec(select(func.max(model.id))).one()
+        rows = session.exec(
+            select(model)
+            .options(undefer("*"))
+            .where(table.age_column < cutoff, model.id < newest_id)
+            .order_by(model.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            return 0
+        records = [row.model_dump(mode="json") for row in rows]
+        segment, offset, length = get_archive_store().append(model.__tablename__, records, dumps_json)
+
+        # The segment is durable before any row leaves the database. If the
+        # transaction below fails the member is simply orphaned and the rows are
+        # archived again on the next run.
+        archived = []
+        if model is Calculation:
+            for row in rows:
+                # A row updated since it was read (e.g. a late real fee) stays
+                # live; its stale copy in the member is never indexed.
+                result = session.exec(
+                    delete(Calculation).where(Calculation.id == row.id, Calculation.revision == row.revision)
+                )
+                if result.rowcount:
+                    archived.append(row)
+        else:
+            session.exec(delete(model).where(model.id.in_([row.id for row in rows])))
+            archived = list(rows)
+
+        for row in archived:
+            session.add(
+                ArchivedRecord(
+                    table_name=model.__tablename__,
+                    record_id=row.id,
+                    order_reference=row.order_reference,
+                    payment_id=getattr(row, "payment_id", None),
+                    segment=segment,
+                    offset=offset,
+                    length=length,
+                )
+            )
+        session.commit()
+    return len(rows)
+
+
+def archive_old_rows(older_than: Optional[timedelta] = None, now: Optional[datetime] = None) -> Dict[str, int]:
+    """Move rows older than ``older_than`` into archive segments; returns rows moved per table."""
+
+    settings = get_settings()
+    older_than = older_than if older_than is not None else timedelta(days=settings.archive_after_days)
+    cutoff = (now or datetime.utcnow()) - older_than
+    moved: Dict[str, int] = {}
+    for table in _TABLES:
+        total = 0
+        while True:
+            count = _archive_batch(table, cutoff, settings.archive_batch_size)
+            total += count
+            if count < settings.archive_batch_size:
+                break
+        moved[table.model.__tablename__] = total
+    LOGGER.info("Archival finished", extra={"moved": moved, "cutoff": cutoff.isoformat()})
+    return moved
+
+
+def _load(entry: ArchivedRecord) -> Optional[Dict[str, Any]]:
+    for record in get_archive_store().read(entry.segment, entry.offset, entry.length):
+        if record["id"] == entry.record_id:
+            return record
+    LOGGER.error("Archive index points to a missing record", extra={"segment": entry.segment, "id": entry.record_id})
+    return None
+
+
+def _find(*conditions) -> List[Dict[str, Any]]:
+    with get_session() as session:
+        entries = session.exec(select(ArchivedRecord).where(*conditions).order_by(ArchivedRecord.record_id)).all()
+    return [record for record in map(_load, entries) if record is not None]
+
+
+def find_archived_calculation(calculation_id: int) -> Optional[Dict[str, Any]]:
+    """Return an archived calculation as a JSON-ready dict, or ``None``."""
+
+    found = _find(ArchivedRecord.table_name == CALCULATIONS, ArchivedRecord.record_id == calculation_id)
+    return found[0] if found else None
+
+
+def load_calculation_snapshot(calculation_id: int) -> Optional[Tuple[Dict[str, Any], Dict[str, Any]]]:
+    """``(parameters, results)`` of a live or archived calculation, or ``None``."""
+
+    with get_session() as session:
+        row = session.exec(
+            select(Calculation.parameters, Calculation.results).where(Calculation.id == calculation_id)
+        ).first()
+    if row is not None:
+        return row[0], row[1]
+    archived = find_archived_calculation(calculation_id)
+    if archived is None:
+        return None
+    return archived["parameters"], archived["results"]
+
+
+def find_archived_calculations(ids: Collection[int], order_references: Collection[str]) -> List[Dict[str, Any]]:
+    """Archived calculations whose id is in ``ids`` or whose ``order_reference`` is in ``order_references``."""
+
+    if not ids and not order_references:
+        return []
+    return _find(
+        ArchivedRecord.table_name == CALCULATIONS,
+        or_(ArchivedRecord.record_id.in_(ids), ArchivedRecord.order_reference.in_(order_references)),
+    )
+
+
+def find_archived_payment(payment_id: str) -> Optional[Dict[str, Any]]:
+    found = _find(ArchivedRecord.table_name == PAYMENT_NOTIFICATIONS, ArchivedRecord.payment_id == payment_id)
+    return found[0] if found else None
+
+
+def find_archived_by_order_reference(order_reference: str) -> Dict[str, List[Dict[str, Any]]]:
+    return {
+        table: _find(ArchivedRecord.table_name == table, ArchivedRecord.order_reference == order_reference)
+        for table in (CALCULATIONS, PAYMENT_NOTIFICATIONS)
+    }
+
+
+def run_maintenance(older_than: Optional[timedelta] = None, vacuum_pages: Optional[int] = None) -> Dict[str, Any]:
+    """Archive old rows, drop expired idempotency keys and hand freed pages back with an incremental VACUUM."""
+
+    with _exclusive_run() as acquired:
+        if not acquired:
+            LOGGER.info("Archival already running elsewhere; skipping")
+            return {"skipped": True}
+        moved = archive_old_rows(older_than)
+        purged = purge_expired()
+        pages = get_settings().vacuum_pages if vacuum_pages is None else vacuum_pages
+        released = incremental_vacuum(pages)
+    LOGGER.info("Incremental VACUUM finished", extra={"released_pages": released})
+    return {"skipped": False, "moved": moved, "purged_idempotency_keys": purged, "released_pages": released}
+
+
+class ArchiveScheduler:
+    """Daemon thread running :func:`run_maintenance` every ``interval`` seconds."""
+
+    def __init__(self, interval: float) -> None:
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="archive-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run(self) -> None:
+        # Wait a full interval first so startup never pays for a maintenance pass.
+        while not self._stop.wait(self.interval):
+            try:
+                run_maintenance()
+            except Exception:  # pragma: no cover - keep the scheduler alive
+                LOGGER.exception("Scheduled archival failed")
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Archive old calculations/notifications and compact the database")
+    parser.add_argument("--older-than-days", type=int, default=None, help="override IMPORT_CALC_ARCHIVE_AFTER_DAYS")
+    parser.add_argument("--vacuum-pages", type=int, default=None, help="override IMPORT_CALC_VACUUM_PAGES")
+    parser.add_argument(
+        "--enable-incremental-vacuum",
+        action="store_true",
+        help="convert the database to auto_vacuum=INCREMENTAL first (one full VACUUM; stop the workers before)",
+    )
+    args = parser.parse_args(argv)
+
+    init_db()
+    converted = enable_incremental_vacuum() if args.enable_incremental_vacuum else False
+    older_than = timedelta(days=args.older_than_days) if args.older_than_days is not None else None
+    print(dumps_json({**run_maintenance(older_than, args.vacuum_pages), "converted_to_incremental": converted}))
+
+
+if __name__ == "__main__":
+    main()
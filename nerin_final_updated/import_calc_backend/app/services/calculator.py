@@ -3,19 +3,157 @@ from __future__ import annotations
 import logging
 from dataclasses import dataclass
 from decimal import Decimal, ROUND_CEILING, ROUND_FLOOR, ROUND_HALF_UP
-from typing import Dict, List, Optional, Tuple
+from types import MappingProxyType
+from typing import Any, Dict, List, Mapping, Optional, Tuple
 
-from ..schemas import AdditionalTaxInput, CalculationParameters
+from ..schemas import AdditionalTaxInput, CalculationParameters, CostBreakdownInput
 from ..utils.decimal_utils import quantize, to_decimal
+from .tax_formulas import FormulaError, evaluate_formulas, formula_taxes, tax_identifier
 
 LOGGER = logging.getLogger(__name__)
 
+EMPTY_RATES: Mapping[str, Decimal] = MappingProxyType({})
+
+
+# Key order of ``CalculationResult.breakdown``: the landed-cost chain, then pricing.
+LANDED_KEYS = (
+    "CIF_USD",
+    "DI_USD",
+    "Tasa_Estadistica_USD",
+    "Base_IVA_USD",
+    "IVA_USD",
+    "Percepcion_IVA_USD",
+    "Percepcion_Ganancias_ARS",
+    "Gastos_Locales_ARS",
+    "Costos_Salida_ARS",
+    "FOB_USD",
+    "Freight_USD",
+    "Insurance_USD",
+    "CIF_ARS",
+    "DI_ARS",
+    "Tasa_Estadistica_ARS",
+    "IVA_ARS",
+    "Percepcion_IVA_ARS",
+    "Additional_Taxes_ARS",
+)
+BREAKDOWN_KEYS = LANDED_KEYS + ("Comision_MP_ARS", "IVA_Comision_MP_ARS", "MP_Fee_Total_ARS", "Utilidad_ARS", "Margen")
+TOTALS_KEYS = ("costo_puesto_total", "precio_neto_total", "precio_final_total", "utilidad_total")
+UNITARY_KEYS = ("costo_puesto_unitario", "precio_neto_unitario", "precio_final_unitario", "utilidad_unitaria")
+# Layout of ``CalculationResult.values``.
+RESULT_KEYS = BREAKDOWN_KEYS + TOTALS_KEYS + UNITARY_KEYS + ("costo_puesto_ars", "precio_neto_ars", "precio_final_ars")
+
+_INDEX = {key: index for index, key in enumerate(RESULT_KEYS)}
+_TOTALS_START = len(BREAKDOWN_KEYS)
+_UNITARY_START = _TOTALS_START + len(TOTALS_KEYS)
+_UNITARY_END = _UNITARY_START + len(UNITARY_KEYS)
+
+
+def _field(key: str) -> property:
+    index = _INDEX[key]
+    return property(lambda self: self.values[index], doc=f"``{key}`` entry of ``values``.")
+
 
-@dataclass
 class CalculationResult:
+    """A calculation held as one tuple of Decimals laid out as ``RESULT_KEYS``.
+
+    Batch, grid and tier workloads create results by the thousand, so the
+    values live in a single tuple on a slotted object rather than in three
+    dicts. ``breakdown``, ``totals`` and ``unitary`` build a new dict on each
+    access (callers may mutate it freely); ``result[key]`` reads one entry of
+    any of them without building anything.
+    """
+
+    __slots__ = ("values", "additional_taxes", "quantity")
+
+    def __init__(self, values: Tuple[Decimal, ...], additional_taxes: List[Dict[str, Decimal]], quantity: int) -> None:
+        if len(values) != len(RESULT_KEYS):
+            raise ValueError(f"Expected {len(RESULT_KEYS)} result values, got {len(values)}")
+        self.values = values
+        self.additional_taxes = additional_taxes
+        self.quantity = quantity
+
+    costo_puesto_ars = _field("costo_puesto_ars")
+    precio_neto_ars = _field("precio_neto_ars")
+    precio_final_ars = _field("precio_final_ars")
+    utilidad = _field("Utilidad_ARS")
+    margen = _field("Margen")
+    comision_mp = _field("Comision_MP_ARS")
+    iva_comision_mp = _field("IVA_Comision_MP_ARS")
+    mp_fee_total = _field("MP_Fee_Total_ARS")
+
+    @property
+    def breakdown(self) -> Dict[str, Decimal]:
+        return dict(zip(BREAKDOWN_KEYS, self.values))
+
+    @property
+    def totals(self) -> Dict[str, Decimal]:
+        return dict(zip(TOTALS_KEYS, self.values[_TOTALS_START:_UNITARY_START]))
+
+    @property
+    def unitary(self) -> Dict[str, Decimal]:
+        return dict(zip(UNITARY_KEYS, self.values[_UNITARY_START:_UNITARY_END]))
+
+    def __getitem__(self, key: str) -> Decimal:
+        return self.values[_INDEX[key]]
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Every field under the names the former dataclass used, views included."""
+
+        return {
+            "breakdown": self.breakdown,
+            "additional_taxes": self.additional_taxes,
+            "costo_puesto_ars": self.costo_puesto_ars,
+            "precio_neto_ars": self.precio_neto_ars,
+            "precio_final_ars": self.precio_final_ars,
+            "utilidad": self.utilidad,
+            "margen": self.margen,
+            "comision_mp": self.comision_mp,
+            "iva_comision_mp": self.iva_comision_mp,
+            "mp_fee_total": self.mp_fee_total,
+            "quantity": self.quantity,
+            "totals": self.totals,
+            "unitary": self.unitary,
+        }
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, CalculationResult):
+            return NotImplemented
+        return (
+            self.values == other.values
+            and self.additional_taxes == other.additional_taxes
+            and self.quantity == other.quantity
+        )
+
+    __hash__ = None  # type: ignore[assignment]
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{name}={value!r}" for name, value in self.as_dict().items())
+        return f"CalculationResult({fields})"
+
+
+@dataclass(frozen=True)
+class CifStage:
+    """Shipment costs converted to USD.
+
+    Only ``costs``, ``tc_aduana`` and ``fx_rates`` feed this stage, so it can be computed once
+    and shared by every evaluation of the same shipment under different rates.
+    """
+
+    components: Dict[str, Decimal]
+    cif_usd: Decimal
+
+
+@dataclass
+class LandedCost:
+    """Output of the tax chain, before any pricing decision."""
+
     breakdown: Dict[str, Decimal]
     additional_taxes: List[Dict[str, Decimal]]
     costo_puesto_ars: Decimal
+
+
+@dataclass
+class Pricing:
     precio_neto_ars: Decimal
     precio_final_ars: Decimal
     utilidad: Decimal
@@ -23,15 +161,56 @@ class CalculationResult:
     comision_mp: Decimal
     iva_comision_mp: Decimal
     mp_fee_total: Decimal
-    quantity: int
-    totals: Dict[str, Decimal]
-    unitary: Dict[str, Decimal]
 
 
-def _convert_cost_to_usd(amount: Decimal, currency: str, exchange_rate: Decimal) -> Decimal:
+def build_result_payload(result: CalculationResult) -> Dict[str, Any]:
+    """Shape a result the way it is stored in ``Calculation.results``.
+
+    Decimal values are kept as-is; the JSON encoder used by the database layer
+    and the API writes them as strings in a single pass.
+    """
+
+    return {
+        "precio_neto_ars": result.precio_neto_ars,
+        "precio_final_ars": result.precio_final_ars,
+        "utilidad_ars": result.utilidad,
+        "margen": result.margen,
+        "costo_puesto_ars": result.costo_puesto_ars,
+        "breakdown": result.breakdown,
+        "additional_taxes": result.additional_taxes,
+        "totals": result.totals,
+        "unitary": result.unitary,
+    }
+
+
+def usd_rate(currency: str, fx_rates: Mapping[str, Decimal]) -> Decimal:
+    """USD per unit of a currency other than USD and ARS, from ``CalculationParameters.fx_rates``."""
+
+    rate = fx_rates.get(currency)
+    if rate is None:
+        raise ValueError(f"No {currency}/USD rate in fx_rates")
+    return rate
+
+
+def _convert_cost_to_usd(
+    amount: Decimal, currency: str, exchange_rate: Decimal, fx_rates: Mapping[str, Decimal] = EMPTY_RATES
+) -> Decimal:
     if currency == "USD":
         return amount
-    return quantize(amount / exchange_rate, "0.0001")
+    if currency == "ARS":
+        return quantize(amount / exchange_rate, "0.0001")
+    return quantize(amount * usd_rate(currency, fx_rates), "0.0001")
+
+
+def fixed_tax_ars(tax: AdditionalTaxInput, exchange_rate: Decimal, fx_rates: Mapping[str, Decimal]) -> Decimal:
+    """Amount of a ``base="ARS"`` tax in pesos; ``amount`` in another currency goes through USD at ``exchange_rate``."""
+
+    money = tax.amount
+    if money is None:
+        return tax.amount_ars
+    if money.currency == "ARS":
+        return money.amount
+    return quantize(_convert_cost_to_usd(money.amount, money.currency, exchange_rate, fx_rates) * exchange_rate, "0.01")
 
 
 def _calculate_additional_taxes(
@@ -53,13 +232,14 @@ def _calculate_additional_taxes(
             cif_based.append((tax, amount_usd))
         elif tax.base == "BaseIVA":
             base_iva_based.append((tax, Decimal("0")))
-        else:
+        elif tax.base == "ARS":
+            amount_ars = fixed_tax_ars(tax, params.tc_aduana, params.fx_rates)
             taxes_details.append({
                 "name": tax.name,
-                "amount_ars": quantize(tax.amount_ars, "0.01"),
-                "amount_usd": quantize(tax.amount_ars / params.tc_aduana, "0.0001"),
+                "amount_ars": quantize(amount_ars, "0.01"),
+                "amount_usd": quantize(amount_ars / params.tc_aduana, "0.0001"),
             })
-            taxes_total_ars += quantize(tax.amount_ars, "0.01")
+            taxes_total_ars += quantize(amount_ars, "0.01")
 
     subtotal_base_iva = cif_usd + di_usd + tasa_est_usd + sum(amount for _, amount in cif_based)
 
@@ -81,9 +261,56 @@ def _calculate_additional_taxes(
         })
         taxes_total_usd += amount_usd
 
+    formulas = formula_taxes(params.additional_taxes)
+    if formulas:
+        taxes_total_usd += _formula_taxes(
+            params, formulas, taxes_details, cif_usd, di_usd, tasa_est_usd, subtotal_base_iva
+        )
+
     return taxes_details, taxes_total_usd, taxes_total_ars
 
 
+def _formula_amount(identifier: str, value: Decimal) -> Decimal:
+    amount = quantize(value, "0.0001")
+    if amount < 0:
+        raise FormulaError(f"Tax formula for '{identifier}' evaluated to a negative amount ({amount})")
+    return amount
+
+
+def _formula_taxes(
+    params: CalculationParameters,
+    formulas: Tuple[Tuple[str, str], ...],
+    taxes_details: List[Dict[str, Decimal]],
+    cif_usd: Decimal,
+    di_usd: Decimal,
+    tasa_est_usd: Decimal,
+    subtotal_usd: Decimal,
+) -> Decimal:
+    """Append the ``base="formula"`` taxes to ``taxes_details``; returns their USD total.
+
+    They run last, in dependency order, and read the other taxes' USD amounts
+    by identifier; ``Subtotal_USD`` is the VAT base before them.
+    """
+
+    values = {
+        "CIF_USD": cif_usd,
+        "DI_USD": di_usd,
+        "Tasa_Estadistica_USD": tasa_est_usd,
+        "Subtotal_USD": subtotal_usd,
+        "tc_aduana": params.tc_aduana,
+    }
+    values.update((tax_identifier(detail["name"]), detail["amount_usd"]) for detail in taxes_details)
+    amounts = evaluate_formulas(formulas, values, finish=_formula_amount)
+    names = [tax.name for tax in params.additional_taxes if tax.base == "formula"]
+    for name, amount_usd in zip(names, amounts):
+        taxes_details.append({
+            "name": name,
+            "amount_usd": amount_usd,
+            "amount_ars": quantize(amount_usd * params.tc_aduana, "0.01"),
+        })
+    return sum(amounts, Decimal("0"))
+
+
 def _round_price(value: Decimal, rounding_rule) -> Decimal:
     if rounding_rule is None:
         return quantize(value)
@@ -126,22 +353,30 @@ def _round_price(value: Decimal, rounding_rule) -> Decimal:
     return quantize(candidate)
 
 
-def calculate_import_cost(params: CalculationParameters, mp_fee_override: Optional[Decimal] = None) -> CalculationResult:
-    LOGGER.info("Starting calculation", extra={"target": params.target, "order_reference": params.order_reference})
+def compute_cif(
+    costs: CostBreakdownInput, exchange_rate: Decimal, fx_rates: Mapping[str, Decimal] = EMPTY_RATES
+) -> CifStage:
+    components = {
+        "FOB": _convert_cost_to_usd(costs.fob.amount, costs.fob.currency, exchange_rate, fx_rates),
+        "Freight": _convert_cost_to_usd(costs.freight.amount, costs.freight.currency, exchange_rate, fx_rates),
+        "Insurance": _convert_cost_to_usd(costs.insurance.amount, costs.insurance.currency, exchange_rate, fx_rates),
+    }
+    return CifStage(components=components, cif_usd=quantize(sum(components.values()), "0.0001"))
 
-    exchange_rate = params.tc_aduana
 
-    cif_components = {
-        "FOB": _convert_cost_to_usd(params.costs.fob.amount, params.costs.fob.currency, exchange_rate),
-        "Freight": _convert_cost_to_usd(
-            params.costs.freight.amount, params.costs.freight.currency, exchange_rate
-        ),
-        "Insurance": _convert_cost_to_usd(
-            params.costs.insurance.amount, params.costs.insurance.currency, exchange_rate
-        ),
-    }
+def compute_landed_cost(params: CalculationParameters, cif: Optional[CifStage] = None) -> LandedCost:
+    """Run the tax chain: CIF through duties, VAT, perceptions and local expenses.
+
+    ``cif`` may carry a stage precomputed with :func:`compute_cif` for the same
+    ``costs``, ``tc_aduana`` and ``fx_rates``; callers are responsible for that match.
+    """
 
-    cif_usd = quantize(sum(cif_components.values()), "0.0001")
+    exchange_rate = params.tc_aduana
+
+    if cif is None:
+        cif = compute_cif(params.costs, exchange_rate, params.fx_rates)
+    cif_components = cif.components
+    cif_usd = cif.cif_usd
     di_usd = quantize(cif_usd * params.di_rate, "0.0001")
     tasa_est_usd = quantize(cif_usd * Decimal("0.03") if params.apply_tasa_estadistica else Decimal("0"), "0.0001")
 
@@ -192,39 +427,67 @@ def calculate_import_cost(params: CalculationParameters, mp_fee_override: Option
         "0.01",
     )
 
+    breakdown.update(
+        {
+            "CIF_ARS": cif_ars,
+            "DI_ARS": di_ars,
+            "Tasa_Estadistica_ARS": tasa_est_ars,
+            "IVA_ARS": iva_ars,
+            "Percepcion_IVA_ARS": perc_iva_ars,
+            "Additional_Taxes_ARS": additional_taxes_ars,
+        }
+    )
+
+    return LandedCost(
+        breakdown=breakdown,
+        additional_taxes=additional_taxes_details,
+        costo_puesto_ars=costo_puesto_ars,
+    )
+
+
+def _fee_from_override(mp_fee_override: Decimal, mp_iva_rate: Decimal) -> Tuple[Decimal, Decimal, Decimal]:
+    mp_fee_total = quantize(mp_fee_override)
+    if mp_iva_rate > 0:
+        divisor = Decimal("1") + mp_iva_rate
+        comision_mp = quantize(mp_fee_total / divisor)
+        iva_comision = quantize(mp_fee_total - comision_mp)
+    else:
+        comision_mp = mp_fee_total
+        iva_comision = Decimal("0")
+    return comision_mp, iva_comision, mp_fee_total
+
+
+def _simulated_fee(precio_neto: Decimal, mp_rate: Decimal, mp_iva_rate: Decimal) -> Tuple[Decimal, Decimal, Decimal]:
+    comision_mp = quantize(precio_neto * mp_rate)
+    iva_comision = quantize(comision_mp * mp_iva_rate)
+    return comision_mp, iva_comision, comision_mp + iva_comision
+
+
+def compute_pricing(
+    params: CalculationParameters,
+    costo_puesto_ars: Decimal,
+    costos_salida_ars: Decimal,
+    mp_fee_override: Optional[Decimal] = None,
+) -> Pricing:
+    """Solve the sale price (or the margin, for ``target="precio"``) for a landed cost."""
+
     mp_rate = params.mp_rate
     mp_iva_rate = params.mp_iva_rate
 
-    precio_neto = Decimal("0")
-    comision_mp = Decimal("0")
-    iva_comision = Decimal("0")
-    mp_fee_total = Decimal("0")
-
     if params.target == "margen":
         denominator = Decimal("1") - (mp_rate * (Decimal("1") + mp_iva_rate)) - params.margen_objetivo
         if denominator <= 0:
             raise ValueError("The provided parameters produce a negative or zero denominator")
-        precio_neto = quantize((costo_puesto_ars + params.costos_salida_ars) / denominator)
-        comision_mp = quantize(precio_neto * mp_rate)
-        iva_comision = quantize(comision_mp * mp_iva_rate)
-        mp_fee_total = comision_mp + iva_comision
+        precio_neto = quantize((costo_puesto_ars + costos_salida_ars) / denominator)
+        comision_mp, iva_comision, mp_fee_total = _simulated_fee(precio_neto, mp_rate, mp_iva_rate)
     else:
         precio_neto = quantize(params.precio_neto_input_ars)
         if mp_fee_override is not None:
-            mp_fee_total = quantize(mp_fee_override)
-            if mp_iva_rate > 0:
-                divisor = Decimal("1") + mp_iva_rate
-                comision_mp = quantize(mp_fee_total / divisor)
-                iva_comision = quantize(mp_fee_total - comision_mp)
-            else:
-                comision_mp = mp_fee_total
-                iva_comision = Decimal("0")
+            comision_mp, iva_comision, mp_fee_total = _fee_from_override(mp_fee_override, mp_iva_rate)
         else:
-            comision_mp = quantize(precio_neto * mp_rate)
-            iva_comision = quantize(comision_mp * mp_iva_rate)
-            mp_fee_total = comision_mp + iva_comision
+            comision_mp, iva_comision, mp_fee_total = _simulated_fee(precio_neto, mp_rate, mp_iva_rate)
 
-    utilidad = quantize(precio_neto - costo_puesto_ars - params.costos_salida_ars - mp_fee_total)
+    utilidad = quantize(precio_neto - costo_puesto_ars - costos_salida_ars - mp_fee_total)
     margen = Decimal("0") if precio_neto == 0 else quantize(utilidad / precio_neto, "0.0001")
 
     if precio_neto < 0:
@@ -235,67 +498,61 @@ def calculate_import_cost(params: CalculationParameters, mp_fee_override: Option
     if params.target == "margen" or params.rounding is not None:
         # Recalculate dependent values after rounding or when a real fee must adapt to rounded price
         if mp_fee_override is not None and params.target == "precio":
-            mp_fee_total = quantize(mp_fee_override)
-            if mp_iva_rate > 0:
-                divisor = Decimal("1") + mp_iva_rate
-                comision_mp = quantize(mp_fee_total / divisor)
-                iva_comision = quantize(mp_fee_total - comision_mp)
-            else:
-                comision_mp = mp_fee_total
-                iva_comision = Decimal("0")
+            comision_mp, iva_comision, mp_fee_total = _fee_from_override(mp_fee_override, mp_iva_rate)
         else:
-            comision_mp = quantize(precio_neto * mp_rate)
-            iva_comision = quantize(comision_mp * mp_iva_rate)
-            mp_fee_total = comision_mp + iva_comision
+            comision_mp, iva_comision, mp_fee_total = _simulated_fee(precio_neto, mp_rate, mp_iva_rate)
 
-        utilidad = quantize(precio_neto - costo_puesto_ars - params.costos_salida_ars - mp_fee_total)
+        utilidad = quantize(precio_neto - costo_puesto_ars - costos_salida_ars - mp_fee_total)
         margen = Decimal("0") if precio_neto == 0 else quantize(utilidad / precio_neto, "0.0001")
 
-    precio_final = quantize(precio_neto * (Decimal("1") + params.iva_rate))
-
-    totals = {
-        "costo_puesto_total": quantize(costo_puesto_ars * params.quantity),
-        "precio_neto_total": quantize(precio_neto * params.quantity),
-        "precio_final_total": quantize(precio_final * params.quantity),
-        "utilidad_total": quantize(utilidad * params.quantity),
-    }
-
-    unitary = {
-        "costo_puesto_unitario": quantize(costo_puesto_ars / params.quantity),
-        "precio_neto_unitario": quantize(precio_neto),
-        "precio_final_unitario": quantize(precio_final),
-        "utilidad_unitaria": quantize(utilidad / params.quantity),
-    }
-
-    breakdown.update(
-        {
-            "CIF_ARS": cif_ars,
-            "DI_ARS": di_ars,
-            "Tasa_Estadistica_ARS": tasa_est_ars,
-            "IVA_ARS": iva_ars,
-            "Percepcion_IVA_ARS": perc_iva_ars,
-            "Additional_Taxes_ARS": additional_taxes_ars,
-            "Comision_MP_ARS": comision_mp,
-            "IVA_Comision_MP_ARS": iva_comision,
-            "MP_Fee_Total_ARS": mp_fee_total,
-            "Utilidad_ARS": utilidad,
-            "Margen": margen,
-        }
-    )
-
-    return CalculationResult(
-        breakdown=breakdown,
-        additional_taxes=additional_taxes_details,
-        costo_puesto_ars=costo_puesto_ars,
+    return Pricing(
         precio_neto_ars=precio_neto,
-        precio_final_ars=precio_final,
+        precio_final_ars=quantize(precio_neto * (Decimal("1") + params.iva_rate)),
         utilidad=utilidad,
         margen=margen,
         comision_mp=comision_mp,
         iva_comision_mp=iva_comision,
         mp_fee_total=mp_fee_total,
-        quantity=params.quantity,
-        totals=totals,
-        unitary=unitary,
     )
 
+
+def calculate_import_cost(
+    params: CalculationParameters,
+    mp_fee_override: Optional[Decimal] = None,
+    cif: Optional[CifStage] = None,
+) -> CalculationResult:
+    """Compute the full breakdown for ``params``; ``cif`` is forwarded to :func:`compute_landed_cost`."""
+
+    LOGGER.info("Starting calculation", extra={"target": params.target, "order_reference": params.order_reference})
+
+    landed = compute_landed_cost(params, cif)
+    costo_puesto_ars = landed.costo_puesto_ars
+    pricing = compute_pricing(params, costo_puesto_ars, params.costos_salida_ars, mp_fee_override)
+    precio_neto = pricing.precio_neto_ars
+    precio_final = pricing.precio_final_ars
+    utilidad = pricing.utilidad
+
+    quantity = params.quantity
+    breakdown = landed.breakdown
+    values = (
+        *[breakdown[key] for key in LANDED_KEYS],
+        pricing.comision_mp,
+        pricing.iva_comision_mp,
+        pricing.mp_fee_total,
+        utilidad,
+        pricing.margen,
+        # totals
+        quantize(costo_puesto_ars * quantity),
+        quantize(precio_neto * quantity),
+        quantize(precio_final * quantity),
+        quantize(utilidad * quantity),
+        # unitary
+        quantize(costo_puesto_ars / quantity),
+        quantize(precio_neto),
+        quantize(precio_final),
+        quantize(utilidad / quantity),
+        costo_puesto_ars,
+        precio_neto,
+        precio_final,
+    )
+    return CalculationResult(values, landed.additional_taxes, quantity)
@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+import logging
+from typing import Any, Dict, List, Optional
+
+from pydantic import ValidationError
+
+from ..schemas import CalculationParameters, PresetComparisonRequest
+from ..storage.models import Preset
+from ..utils.decimal_utils import quantize
+from .calculator import calculate_import_cost, compute_cif
+from .presets import list_presets
+
+LOGGER = logging.getLogger(__name__)
+
+# Metrics where a higher value ranks first; every other metric is a cost or a price.
+_DESCENDING_METRICS = {"utilidad_ars", "margen"}
+
+
+def _load_presets(names: Optional[List[str]]) -> List[Preset]:
+    presets = sorted(list_presets(), key=lambda preset: preset.name)
+    if names is None:
+        return presets
+    wanted = set(names)
+    return [preset for preset in presets if preset.name in wanted]
+
+
+def compare_presets(request: PresetComparisonRequest) -> Dict[str, Any]:
+    """Price one shipment under every preset and rank the outcomes.
+
+    The shipment (``costs``, ``tc_aduana`` and ``fx_rates``) is pinned from the request, so the
+    USD conversion and CIF are computed once and handed to each evaluation; only
+    the rate-dependent steps run per preset. Presets whose merged parameters are
+    invalid are reported under ``skipped`` instead of failing the comparison.
+    """
+
+    cif = compute_cif(request.costs, request.tc_aduana, request.fx_rates)
+    shipment = {"costs": request.costs, "tc_aduana": request.tc_aduana, "fx_rates": request.fx_rates}
+
+    rows: List[Dict[str, Any]] = []
+    skipped: List[Dict[str, str]] = []
+    for preset in _load_presets(request.preset_names):
+        try:
+            params = CalculationParameters.model_validate({**request.parameters, **preset.parameters, **shipment})
+            result = calculate_import_cost(params, cif=cif)
+        except (ValidationError, ValueError) as exc:
+            skipped.append({"preset_name": preset.name, "error": str(exc)})
+            continue
+        except ArithmeticError as exc:  # amounts beyond the Decimal precision
+            skipped.append({"preset_name": preset.name, "error": f"Calculation failed: {exc.__class__.__name__}"})
+            continue
+        rows.append(
+            {
+                "preset_name": preset.name,
+                "description": preset.description,
+                "costo_puesto_ars": result.costo_puesto_ars,
+                "precio_neto_ars": result.precio_neto_ars,
+                "precio_final_ars": result.precio_final_ars,
+                "utilidad_ars": result.utilidad,
+                "margen": result.margen,
+                "mp_fee_total_ars": result.mp_fee_total,
+                "tributos_ars": {
+                    key: result[key]
+                    for key in (
+                        "DI_ARS",
+                        "Tasa_Estadistica_ARS",
+                        "IVA_ARS",
+                        "Percepcion_IVA_ARS",
+                        "Percepcion_Ganancias_ARS",
+                        "Additional_Taxes_ARS",
+                    )
+                },
+            }
+        )
+
+    rows.sort(key=lambda row: row[request.rank_by], reverse=request.rank_by in _DESCENDING_METRICS)
+    for position, row in enumerate(rows, start=1):
+        row["rank"] = position
+
+    LOGGER.info("Presets compared", extra={"evaluated": len(rows), "skipped": len(skipped)})
+    return {
+        "rank_by": request.rank_by,
+        "cif": {
+            **{f"{key}_USD": quantize(value, "0.0001") for key, value in cif.components.items()},
+            "CIF_USD": cif.cif_usd,
+        },
+        "results": rows,
+        "skipped": skipped,
+    }
@@ -0,0 +1,352 @@
+from __future__ import annotations
+
+import argparse
+import csv
+import io
+import logging
+import re
+from bisect import bisect_right
+from dataclasses import dataclass
+from datetime import date, datetime
+from decimal import Decimal
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Optional, Tuple
+
+import pytz
+from sqlalchemy import func
+from sqlmodel import select
+
+from ..config import get_settings
+from ..storage.database import get_session, init_db, upsert_statement
+from ..storage.models import ExchangeRate
+from ..storage.snapshot import TableSnapshot
+from ..utils.decimal_utils import to_decimal
+from ..utils.serialization import dumps_json
+
+LOGGER = logging.getLogger(__name__)
+
+_KEY_PATTERN = re.compile(r"^[a-z0-9_.-]{1,64}$")
+# Currency pairs are ordinary sources named ``fx.<base>_<quote>``: units of quote per unit of base.
+_PAIR_PATTERN = re.compile(r"^fx\.([a-z]{3})_([a-z]{3})$")
+# Cross-rate matrices kept per snapshot, one per requested day.
+_MATRICES_PER_SNAPSHOT = 64
+_DATE_FORMATS = ("%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y")
+_UPSERT_CHUNK = 5000
+
+_KEY_COLUMNS = {"source_key", "source", "fuente", "key"}
+_DATE_COLUMNS = {"date", "fecha", "rate_date"}
+_RATE_COLUMNS = {"rate", "tc", "valor", "cotizacion", "value"}
+
+
+class ExchangeRateImportError(ValueError):
+    """A rates file could not be loaded; nothing was written."""
+
+
+def normalize_source_key(value: Any) -> str:
+    key = str(value).strip().lower()
+    if not _KEY_PATTERN.match(key):
+        raise ValueError(f"Invalid exchange-rate source key '{value}'")
+    return key
+
+
+@dataclass(frozen=True)
+class RatePoint:
+    source_key: str
+    rate_date: date
+    rate: Decimal
+
+
+class RateSeries:
+    """Observations of one source, sorted by day, searched with :func:`bisect.bisect_right`."""
+
+    __slots__ = ("ordinals", "rates")
+
+    def __init__(self) -> None:
+        self.ordinals: List[int] = []
+        self.rates: List[Decimal] = []
+
+    def as_of(self, day: date) -> Optional[int]:
+        """Index of the latest observation on or before ``day``, or ``None``."""
+
+        index = bisect_right(self.ordinals, day.toordinal()) - 1
+        return index if index >= 0 else None
+
+
+def _build_series() -> Dict[str, RateSeries]:
+    series: Dict[str, RateSeries] = {}
+    statement = select(ExchangeRate.source_key, ExchangeRate.rate_date, ExchangeRate.rate).order_by(
+        ExchangeRate.source_key, ExchangeRate.rate_date
+    )
+    with get_session() as session:
+        for source_key, rate_date, rate in session.exec(statement):
+            entry = series.get(source_key)
+            if entry is None:
+                entry = series[source_key] = RateSeries()
+            entry.ordinals.append(rate_date.toordinal())
+            entry.rates.append(Decimal(rate))
+    return series
+
+
+class CrossRateMatrix:
+    """Every cross rate between the currencies quoted on ``day``, for O(1) conversions.
+
+    Built once per snapshot and day from the ``fx.*`` sources: each pair is
+    usable in both directions, and currencies linked only through others
+    (EUR→USD→CNY) get their chained rate precomputed, so a lookup never walks
+    the chain.
+    """
+
+    __slots__ = ("day", "rates")
+
+    def __init__(self, day: date, rates: Dict[Tuple[str, str], Decimal]) -> None:
+        self.day = day
+        self.rates = rates
+
+    @classmethod
+    def from_quotes(cls, day: date, quotes: Mapping[Tuple[str, str], Decimal]) -> "CrossRateMatrix":
+        edges: Dict[str, Dict[str, Decimal]] = {}
+        for (base, quote), rate in quotes.items():
+            edges.setdefault(quote, {})[base] = Decimal(1) / rate
+            edges.setdefault(base, {})
+        # Direct quotes win over the inverse of the opposite pair.
+        for (base, quote), rate in quotes.items():
+            edges[base][quote] = rate
+
+        rates: Dict[Tuple[str, str], Decimal] = {}
+        for origin in sorted(edges):
+            # Breadth-first, so each rate goes through the fewest conversions.
+            reached = {origin: Decimal(1)}
+            frontier = [origin]
+            while frontier:
+                following = []
+                for currency in frontier:
+                    for target, rate in sorted(edges[currency].items()):
+                        if target not in reached:
+                            reached[target] = reached[currency] * rate
+                            following.append(target)
+                frontier = following
+            for target, rate in reached.items():
+                rates[(origin, target)] = rate
+        return cls(day, rates)
+
+    def currencies(self) -> List[str]:
+        return sorted({base for base, _ in self.rates})
+
+    def rate(self, base: str, quote: str) -> Decimal:
+        """Units of ``quote`` per unit of ``base``; raises ``ValueError`` when they are not linked."""
+
+        rate = self.rates.get((base.lower(), quote.lower()))
+        if rate is None:
+            raise ValueError(f"No {base.upper()}/{quote.upper()} exchange rate on or before {self.day}")
+        return rate
+
+    def as_dict(self) -> Dict[str, Any]:
+        table: Dict[str, Dict[str, Decimal]] = {}
+        for (base, quote), rate in sorted(self.rates.items()):
+            table.setdefault(base.upper(), {})[quote.upper()] = rate
+        return {"date": self.day, "rates": table}
+
+
+class ExchangeRateIndex:
+    """Per-source sorted arrays over ``exchange_rates``, refreshed like the NCM index."""
+
+    def __init__(self, refresh_seconds: float) -> None:
+        self._snapshot = TableSnapshot(ExchangeRate, _build_series, refresh_seconds)
+        self._matrices: Dict[int, CrossRateMatrix] = {}
+        self._matrices_of: Optional[Dict[str, RateSeries]] = None
+
+    def invalidate(self) -> None:
+        self._snapshot.invalidate()
+
+    def as_of(self, source_key: str, day: date) -> Optional[RatePoint]:
+        key = normalize_source_key(source_key)
+        series = self._snapshot.get().get(key)
+        if series is None:
+            return None
+        index = series.as_of(day)
+        if index is None:
+            return None
+        return RatePoint(key, date.fromordinal(series.ordinals[index]), series.rates[index])
+
+    def sources(self) -> Dict[str, int]:
+        return {key: len(series.ordinals) for key, series in sorted(self._snapshot.get().items())}
+
+    def cross_rates(self, day: date) -> CrossRateMatrix:
+        """Cross-rate matrix of ``day``, shared by every request that asks for it until the table changes."""
+
+        snapshot = self._snapshot.get()
+        if snapshot is not self._matrices_of:
+            self._matrices, self._matrices_of = {}, snapshot
+        matrices = self._matrices
+        matrix = matrices.get(day.toordinal())
+        if matrix is None:
+            quotes = {}
+            for key, series in snapshot.items():
+                pair = _PAIR_PATTERN.match(key)
+                index = series.as_of(day) if pair else None
+                if index is not None:
+                    quotes[pair.groups()] = series.rates[index]
+            matrix = CrossRateMatrix.from_quotes(day, quotes)
+            if len(matrices) >= _MATRICES_PER_SNAPSHOT:
+                matrices.clear()
+            matrices[day.toordinal()] = matrix
+        return matrix
+
+
+@lru_cache()
+def get_exchange_rate_index() -> ExchangeRateIndex:
+    return ExchangeRateIndex(get_settings().exchange_rate_refresh_seconds)
+
+
+def local_today() -> date:
+    return datetime.now(pytz.timezone(get_settings().default_timezone)).date()
+
+
+def rate_as_of(source_key: str, day: Optional[date] = None) -> Optional[RatePoint]:
+    """Latest published rate of ``source_key`` on or before ``day`` (default: today, local time)."""
+
+    return get_exchange_rate_index().as_of(source_key, day or local_today())
+
+
+def cross_rates_as_of(day: Optional[date] = None) -> CrossRateMatrix:
+    """Cross rates from the latest ``fx.*`` quotes on or before ``day`` (default: today, local time)."""
+
+    return get_exchange_rate_index().cross_rates(day or local_today())
+
+
+def usd_rates(currencies: Iterable[str], day: Optional[date] = None) -> Dict[str, Decimal]:
+    """USD per unit of each of ``currencies``, all read from one cross-rate matrix."""
+
+    matrix = cross_rates_as_of(day)
+    return {currency: matrix.rate(currency, "USD") for currency in sorted(set(currencies))}
+
+
+def _column(key: Any) -> str:
+    return str(key or "").strip().lower()
+
+
+def _parse_date(value: str) -> date:
+    text = value.strip()
+    for pattern in _DATE_FORMATS:
+        try:
+            return datetime.strptime(text, pattern).date()
+        except ValueError:
+            continue
+    raise ValueError(f"Unrecognized date '{value}' (use YYYY-MM-DD or DD/MM/YYYY)")
+
+
+def _parse_rate(value: str) -> str:
+    rate = to_decimal(value)
+    if rate <= 0:
+        raise ValueError(f"Exchange rate {value} must be positive")
+    return str(rate)
+
+
+def _find(header: List[str], aliases: set) -> Optional[int]:
+    return next((index for index, name in enumerate(header) if name in aliases), None)
+
+
+def _observations(rows: Iterable[List[str]], source_key: Optional[str]) -> Iterator[Dict[str, Any]]:
+    """Yield rows in one of three layouts, chosen from the header.
+
+    * long: ``source_key,date,rate`` — one observation per line;
+    * single: ``date,rate`` plus the ``source_key`` argument;
+    * wide: ``date,aduana,mep,...`` — one column per source, blanks skipped.
+    """
+
+    iterator = enumerate(rows, start=1)
+    header: Optional[List[str]] = None
+    for line, row in iterator:
+        if any(cell.strip() for cell in row):
+            header = [_column(cell) for cell in row]
+            break
+    if header is None:
+        raise ExchangeRateImportError("The file has no header row")
+    date_index = _find(header, _DATE_COLUMNS)
+    if date_index is None:
+        raise ExchangeRateImportError("The header must name a date column (date or fecha)")
+    key_index = _find(header, _KEY_COLUMNS)
+    rate_index = _find(header, _RATE_COLUMNS)
+    if key_index is not None and rate_index is not None:
+        layout = None
+    elif rate_index is not None and source_key:
+        layout = {rate_index: normalize_source_key(source_key)}
+    else:
+        try:
+            layout = {index: normalize_source_key(name) for index, name in enumerate(header) if index != date_index}
+        except ValueError as exc:
+            raise ExchangeRateImportError(f"Header: {exc}") from exc
+        if not layout:
+            raise ExchangeRateImportError("The header names no rate column")
+
+    for line, row in iterator:
+        if not any(cell.strip() for cell in row):
+            continue
+        try:
+            rate_date = _parse_date(row[date_index])
+            if layout is None:
+                yield {
+                    "source_key": normalize_source_key(row[key_index]),
+                    "rate_date": rate_date,
+                    "rate": _parse_rate(row[rate_index]),
+                }
+                continue
+            for index, key in layout.items():
+                value = row[index].strip() if index < len(row) else ""
+                if value:
+                    yield {"source_key": key, "rate_date": rate_date, "rate": _parse_rate(value)}
+        except (ValueError, IndexError) as exc:
+            raise ExchangeRateImportError(f"Row {line}: {exc}") from exc
+
+
+def read_observations(data: bytes, source_key: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    text = data.decode("utf-8-sig")
+    try:
+        dialect = csv.Sniffer().sniff(text[:4096], delimiters=",;\t")
+    except csv.Error:
+        dialect = csv.excel
+    return _observations(csv.reader(io.StringIO(text), dialect), source_key)
+
+
+def load_observations(observations: Iterable[Dict[str, Any]]) -> Dict[str, int]:
+    """Upsert observations in one transaction; a later row for the same source and day wins."""
+
+    statement = upsert_statement(ExchangeRate.__table__, ["source_key", "rate_date"], ["rate", "updated_at"])
+    stamp = datetime.utcnow()
+    loaded = 0
+    with get_session() as session:
+        connection = session.connection()
+        chunk: List[Dict[str, Any]] = []
+        for observation in observations:
+            chunk.append({**observation, "updated_at": stamp})
+            if len(chunk) >= _UPSERT_CHUNK:
+                connection.execute(statement, chunk)
+                loaded += len(chunk)
+                chunk = []
+        if chunk:
+            connection.execute(statement, chunk)
+            loaded += len(chunk)
+        session.commit()
+        total = session.exec(select(func.count(ExchangeRate.id))).one()
+    get_exchange_rate_index().invalidate()
+    LOGGER.info("Exchange rates loaded", extra={"loaded": loaded, "total": total})
+    return {"loaded": loaded, "total": total}
+
+
+def import_csv(data: bytes, source_key: Optional[str] = None) -> Dict[str, int]:
+    return load_observations(read_observations(data, source_key))
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Load exchange-rate history from CSV")
+    parser.add_argument("path", type=Path)
+    parser.add_argument("--source-key", default=None, help="source of a two-column date,rate file")
+    args = parser.parse_args(argv)
+
+    init_db()
+    print(dumps_json(import_csv(args.path.read_bytes(), args.source_key)))
+
+
+if __name__ == "__main__":
+    main()
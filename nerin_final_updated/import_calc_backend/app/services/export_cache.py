@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from pathlib import Path
+from typing import BinaryIO, Optional
+
+from ..config import get_settings
+
+LOGGER = logging.getLogger(__name__)
+
+
+class ExportArtifactCache:
+    """Size-bounded on-disk LRU of rendered exports.
+
+    Artifacts are keyed by ``(calculation_id, revision, format)``. Because a
+    revision never changes content, stale entries can only be evicted, never
+    served; ``invalidate`` drops every revision of a calculation eagerly so the
+    disk budget is not spent on superseded files.
+
+    Recency is tracked in memory and mirrored into the file mtime, so a restart
+    (or another worker sharing the directory) rebuilds the same LRU order.
+    ``put`` re-reads the directory before evicting, so ``max_bytes`` bounds
+    the directory as a whole, not just what this process wrote.
+    """
+
+    def __init__(self, directory: Path, max_bytes: int) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._total_bytes = 0
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._load_index()
+
+    @staticmethod
+    def artifact_name(calculation_id: int, revision: int, fmt: str) -> str:
+        return f"{calculation_id}-r{revision}.{fmt}"
+
+    def _load_index(self) -> None:
+        # mtimes written within one clock tick tie; this process's own order breaks the tie.
+        known = {name: position for position, name in enumerate(self._entries)}
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.name.startswith(".") or not entry.is_file():
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                # Evicted by another worker while the directory was listed.
+                continue
+            files.append((stat.st_mtime_ns, known.get(entry.name, -1), entry.name, stat.st_size))
+        files.sort()
+        self._entries.clear()
+        self._total_bytes = 0
+        for _, _, name, size in files:
+            self._track(name, size)
+
+    def get(self, calculation_id: int, revision: int, fmt: str) -> Optional[Path]:
+        name = self.artifact_name(calculation_id, revision, fmt)
+        path = self.directory / name
+        with self._lock:
+            if name not in self._entries:
+                if not path.exists():
+                    return None
+                # Written by another worker sharing the directory.
+                self._track(name, path.stat().st_size)
+            self._entries.move_to_end(name)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self._forget(name)
+            return None
+        return path
+
+    def open(self, calculation_id: int, revision: int, fmt: str) -> Optional[BinaryIO]:
+        """The cached artifact opened for reading, or ``None`` on a miss.
+
+        Eviction by this or another worker may unlink the file at any time;
+        an already opened handle keeps reading it, so serve from the handle
+        rather than reopening the path.
+        """
+
+        path = self.get(calculation_id, revision, fmt)
+        if path is None:
+            return None
+        try:
+            return path.open("rb")
+        except FileNotFoundError:
+            with self._lock:
+                self._forget(path.name)
+            return None
+
+    def put(self, calculation_id: int, revision: int, fmt: str, content: bytes) -> Path:
+        name = self.artifact_name(calculation_id, revision, fmt)
+        path = self.directory / name
+        # Write to a temporary file and rename so concurrent readers never see a partial artifact.
+        descriptor, temp_name = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+        with os.fdopen(descriptor, "wb") as handle:
+            handle.write(content)
+        os.replace(temp_name, path)
+        with self._lock:
+            self._forget(name)
+            self._track(name, len(content))
+            # Other workers write to and evict from the same directory; start from what is there now.
+            self._load_index()
+            if name in self._entries:
+                self._entries.move_to_end(name)
+            self._evict()
+        return path
+
+    def invalidate(self, calculation_id: int) -> int:
+        with self._lock:
+            # Look at the directory, not the index: another worker may have rendered these.
+            names = [path.name for path in self.directory.glob(f"{calculation_id}-r*")]
+            for name in names:
+                self._forget(name)
+                (self.directory / name).unlink(missing_ok=True)
+        if names:
+            LOGGER.info("Export artifacts invalidated", extra={"calculation_id": calculation_id, "count": len(names)})
+        return len(names)
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total_bytes
+
+    def _track(self, name: str, size: int) -> None:
+        self._entries[name] = size
+        self._total_bytes += size
+
+    def _forget(self, name: str) -> None:
+        size = self._entries.pop(name, None)
+        if size is not None:
+            self._total_bytes -= size
+
+    def _evict(self) -> None:
+        # Keep the most recent artifact even when it alone exceeds the budget.
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            name, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            (self.directory / name).unlink(missing_ok=True)
+
+
+@lru_cache()
+def get_export_cache() -> ExportArtifactCache:
+    settings = get_settings()
+    return ExportArtifactCache(Path(settings.export_cache_dir), settings.export_cache_max_bytes)
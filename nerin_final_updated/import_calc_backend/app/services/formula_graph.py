@@ -0,0 +1,482 @@
+from __future__ import annotations
+
+import heapq
+import inspect
+import logging
+from dataclasses import dataclass, is_dataclass
+from decimal import Decimal
+from types import SimpleNamespace
+from operator import attrgetter
+from typing import Any, Callable, Dict, List, Mapping, Optional, Sequence, Set, Tuple
+
+from pydantic import BaseModel, ValidationError
+
+from ..schemas import CalculationParameters, MoneyInput
+from ..utils.decimal_utils import quantize
+from .calculator import (
+    BREAKDOWN_KEYS,
+    TOTALS_KEYS,
+    UNITARY_KEYS,
+    CalculationResult,
+    Pricing,
+    _calculate_additional_taxes,
+    _convert_cost_to_usd,
+    build_result_payload,
+    compute_pricing,
+)
+
+LOGGER = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Node:
+    name: str
+    inputs: Tuple[str, ...]
+    formula: Callable[..., Any]
+
+
+# Leaves of the graph, read straight from ``CalculationParameters``. Fields
+# that do not feed any formula (``order_reference``, ``ncm_code``...) are not
+# inputs, so changing them never invalidates anything.
+INPUTS: Dict[str, Callable[[CalculationParameters], Any]] = {
+    "fob": attrgetter("costs.fob"),
+    "freight": attrgetter("costs.freight"),
+    "insurance": attrgetter("costs.insurance"),
+    "tc_aduana": attrgetter("tc_aduana"),
+    "fx_rates": attrgetter("fx_rates"),
+    "di_rate": attrgetter("di_rate"),
+    "apply_tasa_estadistica": attrgetter("apply_tasa_estadistica"),
+    "iva_rate": attrgetter("iva_rate"),
+    "perc_iva_rate": attrgetter("perc_iva_rate"),
+    "perc_ganancias_rate": attrgetter("perc_ganancias_rate"),
+    "additional_taxes": attrgetter("additional_taxes"),
+    "gastos_locales_ars": attrgetter("gastos_locales_ars"),
+    "costos_salida_ars": attrgetter("costos_salida_ars"),
+    "mp_rate": attrgetter("mp_rate"),
+    "mp_iva_rate": attrgetter("mp_iva_rate"),
+    "target": attrgetter("target"),
+    "margen_objetivo": attrgetter("margen_objetivo"),
+    "precio_neto_input_ars": attrgetter("precio_neto_input_ars"),
+    "quantity": attrgetter("quantity"),
+    "rounding": attrgetter("rounding"),
+}
+MP_FEE_OVERRIDE = "mp_fee_override"
+
+NODES: Dict[str, Node] = {}
+
+
+def formula(function: Optional[Callable[..., Any]] = None, *, name: Optional[str] = None, inputs: Sequence[str] = ()):
+    """Register a node; its inputs are the function's parameter names unless given.
+
+    Inputs are passed positionally, in the order they are declared.
+    """
+
+    def register(function: Callable[..., Any]) -> Callable[..., Any]:
+        node = Node(name or function.__name__, tuple(inputs or inspect.signature(function).parameters), function)
+        if node.name in NODES or node.name in INPUTS:
+            raise ValueError(f"Duplicate formula node '{node.name}'")
+        NODES[node.name] = node
+        return function
+
+    return register(function) if function is not None else register
+
+
+# Each formula below is one step of :func:`~app.services.calculator.compute_landed_cost`
+# or :func:`~app.services.calculator.calculate_import_cost`, with the same operand
+# order and quantization, so a session reproduces the reference result exactly.
+
+
+def _to_usd(money: MoneyInput, tc_aduana: Decimal, fx_rates: Dict[str, Decimal]) -> Decimal:
+    return _convert_cost_to_usd(money.amount, money.currency, tc_aduana, fx_rates)
+
+
+def _to_ars(amount_usd: Decimal, tc_aduana: Decimal) -> Decimal:
+    return quantize(amount_usd * tc_aduana, "0.01")
+
+
+def _component_usd(component_usd: Decimal) -> Decimal:
+    return quantize(component_usd, "0.0001")
+
+
+for _money, _label in (("fob", "FOB"), ("freight", "Freight"), ("insurance", "Insurance")):
+    formula(_to_usd, name=f"{_money}_usd", inputs=(_money, "tc_aduana", "fx_rates"))
+    formula(_component_usd, name=f"{_label}_USD", inputs=(f"{_money}_usd",))
+
+
+@formula
+def CIF_USD(fob_usd: Decimal, freight_usd: Decimal, insurance_usd: Decimal) -> Decimal:
+    return quantize(sum((fob_usd, freight_usd, insurance_usd)), "0.0001")
+
+
+@formula
+def DI_USD(CIF_USD: Decimal, di_rate: Decimal) -> Decimal:
+    return quantize(CIF_USD * di_rate, "0.0001")
+
+
+@formula
+def Tasa_Estadistica_USD(CIF_USD: Decimal, apply_tasa_estadistica: bool) -> Decimal:
+    return quantize(CIF_USD * Decimal("0.03") if apply_tasa_estadistica else Decimal("0"), "0.0001")
+
+
+@formula
+def additional_taxes_stage(
+    additional_taxes: List[Any],
+    tc_aduana: Decimal,
+    fx_rates: Dict[str, Decimal],
+    CIF_USD: Decimal,
+    DI_USD: Decimal,
+    Tasa_Estadistica_USD: Decimal,
+) -> Tuple[List[Dict[str, Decimal]], Decimal, Decimal]:
+    """``(details, total_usd, fixed_ars)`` as returned by the calculator's helper."""
+
+    params = SimpleNamespace(additional_taxes=additional_taxes, tc_aduana=tc_aduana, fx_rates=fx_rates)
+    return _calculate_additional_taxes(params, CIF_USD, DI_USD, Tasa_Estadistica_USD)
+
+
+@formula
+def Base_IVA_USD(
+    CIF_USD: Decimal, DI_USD: Decimal, Tasa_Estadistica_USD: Decimal, additional_taxes_stage: Tuple
+) -> Decimal:
+    return CIF_USD + DI_USD + Tasa_Estadistica_USD + additional_taxes_stage[1]
+
+
+@formula
+def IVA_USD(Base_IVA_USD: Decimal, iva_rate: Decimal) -> Decimal:
+    return quantize(Base_IVA_USD * iva_rate, "0.0001")
+
+
+@formula
+def Percepcion_IVA_USD(Base_IVA_USD: Decimal, perc_iva_rate: Decimal) -> Decimal:
+    return quantize(Base_IVA_USD * perc_iva_rate, "0.0001")
+
+
+@formula
+def tributos_ars_base(
+    Base_IVA_USD: Decimal,
+    IVA_USD: Decimal,
+    Percepcion_IVA_USD: Decimal,
+    DI_USD: Decimal,
+    Tasa_Estadistica_USD: Decimal,
+    tc_aduana: Decimal,
+) -> Decimal:
+    return quantize((Base_IVA_USD + IVA_USD + Percepcion_IVA_USD + DI_USD + Tasa_Estadistica_USD) * tc_aduana, "0.01")
+
+
+@formula
+def Percepcion_Ganancias_ARS(tributos_ars_base: Decimal, perc_ganancias_rate: Decimal) -> Decimal:
+    return quantize(tributos_ars_base * perc_ganancias_rate, "0.01")
+
+
+@formula
+def Gastos_Locales_ARS(gastos_locales_ars: Decimal) -> Decimal:
+    return quantize(gastos_locales_ars, "0.01")
+
+
+@formula
+def Costos_Salida_ARS(costos_salida_ars: Decimal) -> Decimal:
+    return quantize(costos_salida_ars, "0.01")
+
+
+for _usd in ("CIF", "DI", "Tasa_Estadistica", "IVA", "Percepcion_IVA"):
+    formula(_to_ars, name=f"{_usd}_ARS", inputs=(f"{_usd}_USD", "tc_aduana"))
+
+
+@formula
+def Additional_Taxes_ARS(additional_taxes_stage: Tuple, tc_aduana: Decimal) -> Decimal:
+    _, taxes_usd, fixed_ars = additional_taxes_stage
+    return fixed_ars + quantize(taxes_usd * tc_aduana, "0.01")
+
+
+@formula
+def costo_puesto_ars(
+    CIF_ARS: Decimal,
+    DI_ARS: Decimal,
+    Tasa_Estadistica_ARS: Decimal,
+    IVA_ARS: Decimal,
+    Percepcion_IVA_ARS: Decimal,
+    Percepcion_Ganancias_ARS: Decimal,
+    Additional_Taxes_ARS: Decimal,
+    gastos_locales_ars: Decimal,
+) -> Decimal:
+    return quantize(
+        CIF_ARS
+        + DI_ARS
+        + Tasa_Estadistica_ARS
+        + IVA_ARS
+        + Percepcion_IVA_ARS
+        + Percepcion_Ganancias_ARS
+        + Additional_Taxes_ARS
+        + gastos_locales_ars,
+        "0.01",
+    )
+
+
+@formula
+def pricing(
+    costo_puesto_ars: Decimal,
+    costos_salida_ars: Decimal,
+    mp_fee_override: Optional[Decimal],
+    mp_rate: Decimal,
+    mp_iva_rate: Decimal,
+    iva_rate: Decimal,
+    target: str,
+    margen_objetivo: Optional[Decimal],
+    precio_neto_input_ars: Optional[Decimal],
+    rounding: Any,
+) -> Pricing:
+    # The price solve and its rounding pass are a single step of the reference
+    # calculator, so they stay one node; its fields are exposed as views below.
+    rates = SimpleNamespace(
+        mp_rate=mp_rate,
+        mp_iva_rate=mp_iva_rate,
+        iva_rate=iva_rate,
+        target=target,
+        margen_objetivo=margen_objetivo,
+        precio_neto_input_ars=precio_neto_input_ars,
+        rounding=rounding,
+    )
+    return compute_pricing(rates, costo_puesto_ars, costos_salida_ars, mp_fee_override)
+
+
+# Outputs read straight off the ``pricing`` node instead of being nodes of their own.
+PRICING_VIEWS = {
+    "precio_neto_ars": "precio_neto_ars",
+    "precio_final_ars": "precio_final_ars",
+    "Comision_MP_ARS": "comision_mp",
+    "IVA_Comision_MP_ARS": "iva_comision_mp",
+    "MP_Fee_Total_ARS": "mp_fee_total",
+    "Utilidad_ARS": "utilidad",
+    "Margen": "margen",
+}
+
+
+@formula
+def totals(costo_puesto_ars: Decimal, pricing: Pricing, quantity: int) -> Dict[str, Decimal]:
+    return {
+        "costo_puesto_total": quantize(costo_puesto_ars * quantity),
+        "precio_neto_total": quantize(pricing.precio_neto_ars * quantity),
+        "precio_final_total": quantize(pricing.precio_final_ars * quantity),
+        "utilidad_total": quantize(pricing.utilidad * quantity),
+    }
+
+
+@formula
+def unitary(costo_puesto_ars: Decimal, pricing: Pricing, quantity: int) -> Dict[str, Decimal]:
+    return {
+        "costo_puesto_unitario": quantize(costo_puesto_ars / quantity),
+        "precio_neto_unitario": quantize(pricing.precio_neto_ars),
+        "precio_final_unitario": quantize(pricing.precio_final_ars),
+        "utilidad_unitaria": quantize(pricing.utilidad / quantity),
+    }
+
+
+def _topological_order() -> Tuple[str, ...]:
+    order: List[str] = []
+    state: Dict[str, int] = {}
+
+    def visit(name: str, path: Tuple[str, ...]) -> None:
+        if state.get(name) == 2 or name in INPUTS or name == MP_FEE_OVERRIDE:
+            return
+        if state.get(name) == 1:
+            raise ValueError(f"Formula cycle: {' -> '.join(path + (name,))}")
+        if name not in NODES:
+            raise ValueError(f"Formula '{path[-1]}' depends on unknown node '{name}'")
+        state[name] = 1
+        for dependency in NODES[name].inputs:
+            visit(dependency, path + (name,))
+        state[name] = 2
+        order.append(name)
+
+    for name in NODES:
+        visit(name, ())
+    return tuple(order)
+
+
+ORDER = _topological_order()
+_ORDERED_NODES = tuple(NODES[name] for name in ORDER)
+# Dependents are kept as positions in ``ORDER`` so stale nodes can be popped
+# from a heap in evaluation order without scanning the whole graph.
+DEPENDENTS: Dict[str, Tuple[int, ...]] = {
+    name: tuple(index for index, node in enumerate(_ORDERED_NODES) if name in node.inputs)
+    for name in (*INPUTS, MP_FEE_OVERRIDE, *ORDER)
+}
+
+
+def _identical(old: Any, new: Any) -> bool:
+    """Equality that also tells ``Decimal("1.0")`` from ``Decimal("1.00")``.
+
+    Early cut-off keeps the old value when a node recomputes to an equal one,
+    so "equal" must mean "renders the same", not just numerically equal.
+    """
+
+    if old is new:
+        return True
+    kind = type(old)
+    if kind is not type(new):
+        return False
+    if kind is Decimal:
+        return old == new and old.same_quantum(new) and old.is_signed() == new.is_signed()
+    if kind is dict:
+        return list(old) == list(new) and all(_identical(value, new[key]) for key, value in old.items())
+    if kind is list or kind is tuple:
+        return len(old) == len(new) and all(_identical(left, right) for left, right in zip(old, new))
+    if isinstance(old, BaseModel) or is_dataclass(old):
+        return _identical(vars(old), vars(new))
+    return old == new
+
+
+def merge_changes(base: Dict[str, Any], changes: Mapping[str, Any]) -> Dict[str, Any]:
+    """Deep-merge a partial update into dumped parameters; nested objects merge, lists are replaced."""
+
+    merged = dict(base)
+    for key, value in changes.items():
+        current = merged.get(key)
+        if isinstance(value, Mapping) and isinstance(current, dict):
+            merged[key] = merge_changes(current, value)
+        else:
+            merged[key] = value
+    return merged
+
+
+class CalculationSession:
+    """Incremental evaluation of the formula graph for one evolving set of parameters.
+
+    Parameter changes mark the inputs that actually moved; :meth:`result`
+    then re-evaluates, in topological order, only the nodes reachable from
+    them, and stops wherever a node recomputes to an identical value. The
+    result always equals :func:`~app.services.calculator.calculate_import_cost`
+    for the current parameters and fee override.
+    """
+
+    def __init__(self, params: CalculationParameters, mp_fee_override: Optional[Decimal] = None) -> None:
+        self._params = params
+        self._values: Dict[str, Any] = {name: read(params) for name, read in INPUTS.items()}
+        self._values[MP_FEE_OVERRIDE] = mp_fee_override
+        self._stale: Set[int] = set(range(len(ORDER)))
+        self.recomputed: Tuple[str, ...] = ()
+
+    @property
+    def params(self) -> CalculationParameters:
+        return self._params
+
+    def set_parameters(self, params: CalculationParameters, mp_fee_override: Any = ...) -> Set[str]:
+        """Switch to ``params`` (and optionally a new fee override); returns the inputs that changed."""
+
+        current = self._values
+        values = {name: read(params) for name, read in INPUTS.items()}
+        if mp_fee_override is not ...:
+            values[MP_FEE_OVERRIDE] = mp_fee_override
+        # ``model_copy`` and patches keep untouched sub-objects, so identity settles most inputs.
+        changed = {
+            name for name, value in values.items() if value is not current[name] and not _identical(current[name], value)
+        }
+        self._params = params
+        for name in changed:
+            current[name] = values[name]
+            self._stale.update(DEPENDENTS[name])
+        return changed
+
+    def patch(self, changes: Mapping[str, Any], mp_fee_override: Any = ...) -> Set[str]:
+        """Apply a partial update such as ``{"costs": {"freight": {"amount": "7"}}}``.
+
+        Nested objects are merged and lists replaced; the merged parameters go
+        through the regular validation, so a rejected patch leaves the session untouched.
+        """
+
+        merged = merge_changes(self._params.model_dump(), changes)
+        return self.set_parameters(CalculationParameters.model_validate(merged), mp_fee_override)
+
+    def value(self, name: str) -> Any:
+        """Current value of any input or formula node, evaluating what is stale first."""
+
+        self._evaluate()
+        if name in PRICING_VIEWS:
+            return getattr(self._values["pricing"], PRICING_VIEWS[name])
+        return self._values[name]
+
+    def _evaluate(self) -> None:
+        stale = self._stale
+        if not stale:
+            self.recomputed = ()
+            return
+        values = self._values
+        heap = list(stale)
+        heapq.heapify(heap)
+        recomputed: List[str] = []
+        while heap:
+            index = heapq.heappop(heap)
+            node = _ORDERED_NODES[index]
+            value = node.formula(*[values[dependency] for dependency in node.inputs])
+            # Discarded only after success: a failing node (e.g. an impossible
+            # margin) stays stale and is retried after the next change.
+            stale.discard(index)
+            recomputed.append(node.name)
+            dependents = DEPENDENTS[node.name]
+            # Sinks have nothing to spare, so only nodes with dependents pay for the comparison.
+            if dependents and node.name in values and _identical(values[node.name], value):
+                continue
+            values[node.name] = value
+            for dependent in dependents:
+                if dependent not in stale:
+                    stale.add(dependent)
+                    heapq.heappush(heap, dependent)
+        self.recomputed = tuple(recomputed)
+
+    def result(self) -> CalculationResult:
+        self._evaluate()
+        values = self._values
+        pricing_value = values["pricing"]
+        totals_value, unitary_value = values["totals"], values["unitary"]
+        return CalculationResult(
+            (
+                *[
+                    getattr(pricing_value, PRICING_VIEWS[key]) if key in PRICING_VIEWS else values[key]
+                    for key in BREAKDOWN_KEYS
+                ],
+                *[totals_value[key] for key in TOTALS_KEYS],
+                *[unitary_value[key] for key in UNITARY_KEYS],
+                values["costo_puesto_ars"],
+                pricing_value.precio_neto_ars,
+                pricing_value.precio_final_ars,
+            ),
+            [dict(detail) for detail in values["additional_taxes_stage"][0]],
+            values["quantity"],
+        )
+
+
+def evaluate_scenarios(params: CalculationParameters, scenarios: Sequence[Mapping[str, Any]]) -> Dict[str, Any]:
+    """Price ``params`` and each what-if variation of it with a single session.
+
+    Every scenario is a partial update relative to ``params`` (not to the
+    previous scenario); moving between scenarios only recomputes the nodes
+    fed by the inputs in which they differ, which ``changed_inputs`` lists. Raises ``ValidationError`` for an
+    invalid scenario and ``ValueError`` when one cannot be priced.
+    """
+
+    session = CalculationSession(params)
+    base_result = build_result_payload(session.result())
+    base = params.model_dump()
+    rows: List[Dict[str, Any]] = []
+    for index, changes in enumerate(scenarios):
+        try:
+            scenario = CalculationParameters.model_validate(merge_changes(base, changes))
+        except ValidationError as exc:
+            raise ValidationError.from_exception_data(
+                f"scenarios[{index}]", [dict(error, loc=("scenarios", index, *error["loc"])) for error in exc.errors()]
+            ) from None
+        changed = session.set_parameters(scenario)
+        try:
+            result = session.result()
+        except ValueError as exc:
+            # Keep the type: a failing tax formula is reported like one in the base parameters.
+            raise exc.__class__(f"Scenario {index}: {exc}") from exc
+        rows.append(
+            {
+                "changes": changes,
+                "changed_inputs": sorted(changed),
+                "recomputed_nodes": len(session.recomputed),
+                "results": build_result_payload(result),
+            }
+        )
+    LOGGER.info("What-if scenarios evaluated", extra={"scenarios": len(rows), "nodes": len(ORDER)})
+    return {"results": base_result, "scenarios": rows}
@@ -0,0 +1,217 @@
+from __future__ import annotations
+
+import hashlib
+import logging
+import threading
+import time
+from dataclasses import dataclass, replace
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Generic, Optional, Tuple, TypeVar
+
+from sqlalchemy import delete, update
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import select
+
+from ..config import get_settings
+from ..storage.database import get_session
+from ..storage.models import IdempotencyRecord
+
+LOGGER = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+_POLL_INTERVAL = 0.05
+MAX_KEY_LENGTH = 255
+
+
+class IdempotencyConflict(Exception):
+    """The key was already used for a different request body."""
+
+
+class IdempotencyInProgress(Exception):
+    """Another worker still holds the key after the configured wait."""
+
+
+@dataclass(frozen=True)
+class StoredResponse:
+    status_code: int
+    body: str
+    etag: Optional[str] = None
+    calculation_id: Optional[int] = None
+    replayed: bool = False
+
+
+class _Call(Generic[T]):
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Optional[T] = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight(Generic[T]):
+    """Coalesce concurrent calls sharing a key onto the first one in flight.
+
+    Followers block until the leader finishes and receive its result (or its
+    exception); nothing is cached once the call completes. Like Go's
+    ``singleflight``, ``do`` also reports whether the result was shared.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call[T]] = {}
+
+    def do(self, key: str, fn: Callable[[], T]) -> Tuple[T, bool]:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+        try:
+            call.result = fn()
+            return call.result, False
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+_FLIGHTS: SingleFlight[StoredResponse] = SingleFlight()
+
+
+def request_fingerprint(body: bytes) -> str:
+    """Hash of the request body exactly as the client sent it."""
+
+    return hashlib.sha256(body).hexdigest()
+
+
+def _stored(record: IdempotencyRecord, fingerprint: str) -> StoredResponse:
+    if record.request_hash != fingerprint:
+        raise IdempotencyConflict("Idempotency-Key reused with a different request body")
+    return StoredResponse(
+        status_code=record.status_code,
+        body=record.response_body,
+        etag=record.etag,
+        calculation_id=record.calculation_id,
+        replayed=True,
+    )
+
+
+def _claim(key: str, fingerprint: str) -> Optional[StoredResponse]:
+    """Insert an in-flight marker for ``key``, or return the response another request stored.
+
+    Returns ``None`` once this process owns the key. A marker left behind by a
+    worker that died mid-request is taken over after ``idempotency_wait_seconds``.
+    """
+
+    settings = get_settings()
+    deadline = time.monotonic() + settings.idempotency_wait_seconds
+    while True:
+        now = datetime.utcnow()
+        with get_session() as session:
+            record = session.exec(select(IdempotencyRecord).where(IdempotencyRecord.key == key)).first()
+            if record is not None and record.expires_at <= now:
+                session.delete(record)
+                session.commit()
+                record = None
+            if record is None:
+                session.add(
+                    IdempotencyRecord(
+                        key=key,
+                        request_hash=fingerprint,
+                        expires_at=now + timedelta(seconds=settings.idempotency_ttl_seconds),
+                    )
+                )
+                try:
+                    session.commit()
+                    return None
+                except IntegrityError:
+                    session.rollback()
+                    continue
+            if record.status_code is not None:
+                return _stored(record, fingerprint)
+            if record.request_hash != fingerprint:
+                raise IdempotencyConflict("Idempotency-Key reused with a different request body")
+            stale = now - record.created_at > timedelta(seconds=settings.idempotency_wait_seconds)
+            if stale:
+                # Conditional update: another worker may take over the same marker first.
+                taken = session.exec(
+                    update(IdempotencyRecord)
+                    .where(
+                        IdempotencyRecord.key == key,
+                        IdempotencyRecord.created_at == record.created_at,
+                        IdempotencyRecord.status_code.is_(None),
+                    )
+                    .values(created_at=now)
+                )
+                session.commit()
+                if taken.rowcount:
+                    LOGGER.warning("Taking over abandoned idempotency key", extra={"idempotency_key": key})
+                    return None
+                continue
+        if time.monotonic() >= deadline:
+            raise IdempotencyInProgress("A request with this Idempotency-Key is still being processed")
+        time.sleep(_POLL_INTERVAL)
+
+
+def _complete(key: str, response: StoredResponse) -> None:
+    with get_session() as session:
+        record = session.exec(select(IdempotencyRecord).where(IdempotencyRecord.key == key)).one()
+        record.status_code = response.status_code
+        record.response_body = response.body
+        record.etag = response.etag
+        record.calculation_id = response.calculation_id
+        session.add(record)
+        session.commit()
+
+
+def _release(key: str) -> None:
+    with get_session() as session:
+        session.exec(
+            delete(IdempotencyRecord).where(IdempotencyRecord.key == key, IdempotencyRecord.status_code.is_(None))
+        )
+        session.commit()
+
+
+def run_idempotent(key: str, fingerprint: str, compute: Callable[[], StoredResponse]) -> StoredResponse:
+    """Run ``compute`` at most once per ``key`` within the TTL.
+
+    Duplicates arriving while the first request runs in this process share its
+    result through single-flight; duplicates in other workers poll the claim
+    row; later replays are answered from the stored response without calling
+    ``compute``. Failures release the key so the client can retry.
+    """
+
+    def lead() -> StoredResponse:
+        existing = _claim(key, fingerprint)
+        if existing is not None:
+            return existing
+        try:
+            response = compute()
+        except BaseException:
+            _release(key)
+            raise
+        _complete(key, response)
+        return response
+
+    # The body is part of the flight key: a concurrent request reusing the key
+    # with another body must not share this result but fail in ``_claim``.
+    response, shared = _FLIGHTS.do(f"{key}\0{fingerprint}", lead)
+    return replace(response, replayed=True) if shared else response
+
+
+def purge_expired(now: Optional[datetime] = None) -> int:
+    with get_session() as session:
+        cutoff = now or datetime.utcnow()
+        result = session.exec(delete(IdempotencyRecord).where(IdempotencyRecord.expires_at <= cutoff))
+        session.commit()
+    return result.rowcount
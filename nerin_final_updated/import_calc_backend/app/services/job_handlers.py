@@ -0,0 +1,117 @@
+"""Built-in background job kinds. Importing this module registers them."""
+
+from __future__ import annotations
+
+import logging
+from typing import Any, Dict, List
+
+from pydantic import ValidationError
+
+from ..schemas import CalculationParameters, RepriceJobPayload, RevalueJobPayload
+from .archival import load_calculation_snapshot
+from .calculator import calculate_import_cost
+from .jobs import JobContext, job_handler
+from .presets import get_preset
+
+LOGGER = logging.getLogger(__name__)
+
+# Items are persisted together with the checkpoint covering them, once per batch.
+CHECKPOINT_EVERY = 50
+
+
+def _summary(result) -> Dict[str, Any]:
+    return {
+        "costo_puesto_ars": result.costo_puesto_ars,
+        "precio_neto_ars": result.precio_neto_ars,
+        "precio_final_ars": result.precio_final_ars,
+        "utilidad_ars": result.utilidad,
+        "margen": result.margen,
+    }
+
+
+def _run_batches(context: JobContext, total: int, evaluate) -> Dict[str, Any]:
+    checkpoint = context.checkpoint or {}
+    start = checkpoint.get("next_index", 0)
+    failed = checkpoint.get("failed", 0)
+    if start:
+        LOGGER.info("Resuming job from checkpoint", extra={"job_id": context.job_id, "next_index": start})
+    context.report(start, total)
+
+    batch: List[Dict[str, Any]] = []
+    for index in range(start, total):
+        item = evaluate(index)
+        if "error" in item:
+            failed += 1
+        batch.append(item)
+        if len(batch) >= CHECKPOINT_EVERY or index == total - 1:
+            context.report(index + 1, total, batch, checkpoint={"next_index": index + 1, "failed": failed})
+            batch = []
+    return {"items": total, "failed": failed}
+
+
+@job_handler("reprice", RepriceJobPayload)
+def reprice_supplier_sheet(context: JobContext, payload: RepriceJobPayload) -> Dict[str, Any]:
+    """Price every row of a supplier sheet with shared parameters (and optional preset)."""
+
+    base = dict(payload.parameters)
+    if payload.preset_name:
+        preset = get_preset(payload.preset_name)
+        if preset is None:
+            raise ValueError(f"Preset '{payload.preset_name}' not found")
+        base = {**preset.parameters, **base}
+    base_costs = base.get("costs") or {}
+
+    def evaluate(index: int) -> Dict[str, Any]:
+        row = payload.items[index]
+        costs = {
+            "fob": row.fob,
+            "freight": row.freight or base_costs.get("freight") or {"amount": "0"},
+            "insurance": row.insurance or base_costs.get("insurance") or {"amount": "0"},
+        }
+        overrides: Dict[str, Any] = {"costs": costs, "order_reference": row.reference}
+        if row.quantity is not None:
+            overrides["quantity"] = row.quantity
+        try:
+            params = CalculationParameters.model_validate({**base, **overrides})
+            return {"index": index, "reference": row.reference, **_summary(calculate_import_cost(params))}
+        except (ValidationError, ValueError) as exc:
+            return {"index": index, "reference": row.reference, "error": str(exc)}
+        except ArithmeticError as exc:  # amounts beyond the Decimal precision
+            error = f"Calculation failed: {exc.__class__.__name__}"
+            return {"index": index, "reference": row.reference, "error": error}
+
+    return _run_batches(context, len(payload.items), evaluate)
+
+
+@job_handler("revalue", RevalueJobPayload)
+def revalue_at_exchange_rate(context: JobContext, payload: RevalueJobPayload) -> Dict[str, Any]:
+    """Recompute stored calculations at a new ``tc_aduana`` and report the price change.
+
+    The stored calculations are left untouched; the job only reports what they
+    would be at the new rate.
+    """
+
+    def evaluate(index: int) -> Dict[str, Any]:
+        calculation_id = payload.calculation_ids[index]
+        stored = load_calculation_snapshot(calculation_id)
+        if stored is None:
+            return {"index": index, "calculation_id": calculation_id, "error": "Calculation not found"}
+        parameters, results = stored
+        try:
+            params = CalculationParameters.model_validate({**parameters, "tc_aduana": payload.tc_aduana})
+            summary = _summary(calculate_import_cost(params))
+        except (ValidationError, ValueError) as exc:
+            return {"index": index, "calculation_id": calculation_id, "error": str(exc)}
+        except ArithmeticError as exc:
+            error = f"Calculation failed: {exc.__class__.__name__}"
+            return {"index": index, "calculation_id": calculation_id, "error": error}
+        previous = results.get("precio_final_ars")
+        return {
+            "index": index,
+            "calculation_id": calculation_id,
+            "tc_aduana_anterior": parameters.get("tc_aduana"),
+            "precio_final_anterior_ars": previous,
+            **summary,
+        }
+
+    return _run_batches(context, len(payload.calculation_ids), evaluate)
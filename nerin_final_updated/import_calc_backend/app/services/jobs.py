@@ -0,0 +1,265 @@
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from pydantic import BaseModel
+from sqlalchemy import update
+from sqlmodel import select
+
+from ..storage.database import get_session
+from ..storage.models import Job, JobItem
+from ..utils.serialization import to_serializable
+
+LOGGER = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+TERMINAL_STATUSES = frozenset({SUCCEEDED, FAILED})
+
+
+class JobInterrupted(Exception):
+    """The job was requeued and claimed by another worker; this run must stop."""
+
+
+class JobContext:
+    """Handle given to a job handler to report progress, partial results and checkpoints."""
+
+    def __init__(self, job_id: int, checkpoint: Optional[Dict[str, Any]], worker_id: str) -> None:
+        self.job_id = job_id
+        self.checkpoint = checkpoint
+        self.worker_id = worker_id
+
+    def report(
+        self,
+        done: int,
+        total: Optional[int] = None,
+        items: Sequence[Dict[str, Any]] = (),
+        checkpoint: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        """Persist progress, ``items`` and ``checkpoint`` in one transaction.
+
+        Items are only durable together with the checkpoint that covers them,
+        so a job resumed from that checkpoint never emits an item twice. Each
+        call also refreshes the heartbeat that keeps the job from being
+        considered abandoned, and raises :class:`JobInterrupted` if another
+        worker has taken the job over meanwhile.
+        """
+
+        with get_session() as session:
+            job = session.get(Job, self.job_id)
+            if job.status != RUNNING or job.worker_id != self.worker_id:
+                raise JobInterrupted(f"Job {self.job_id} is now owned by {job.worker_id}")
+            next_seq = job.items_count
+            for offset, item in enumerate(items, start=1):
+                session.add(JobItem(job_id=self.job_id, seq=next_seq + offset, data=to_serializable(item)))
+            job.items_count = next_seq + len(items)
+            job.progress_done = done
+            if total is not None:
+                job.progress_total = total
+            if checkpoint is not None:
+                job.checkpoint = to_serializable(checkpoint)
+                self.checkpoint = job.checkpoint
+            job.heartbeat_at = datetime.utcnow()
+            session.add(job)
+            session.commit()
+
+
+JobFunction = Callable[[JobContext, Any], Optional[Dict[str, Any]]]
+
+
+@dataclass(frozen=True)
+class JobHandler:
+    function: JobFunction
+    payload_model: type
+
+
+JOB_HANDLERS: Dict[str, JobHandler] = {}
+
+
+def job_handler(kind: str, payload_model: type) -> Callable[[JobFunction], JobFunction]:
+    """Register ``function`` as the handler for jobs of ``kind``.
+
+    The payload is validated with ``payload_model`` on submission and handed
+    to the handler as a model instance on every (re)start.
+    """
+
+    def decorator(function: JobFunction) -> JobFunction:
+        JOB_HANDLERS[kind] = JobHandler(function, payload_model)
+        return function
+
+    return decorator
+
+
+def submit_job(kind: str, payload: Dict[str, Any]) -> Job:
+    handler = JOB_HANDLERS.get(kind)
+    if handler is None:
+        raise ValueError(f"Unknown job kind '{kind}'")
+    validated: BaseModel = handler.payload_model.model_validate(payload)
+    job = Job(kind=kind, payload=validated.model_dump(mode="json"))
+    with get_session() as session:
+        session.add(job)
+        session.commit()
+        session.refresh(job)
+    LOGGER.info("Job submitted", extra={"job_id": job.id, "kind": kind})
+    _WAKE_UP.set()
+    return job
+
+
+def get_job(job_id: int) -> Optional[Job]:
+    with get_session() as session:
+        return session.get(Job, job_id)
+
+
+def list_job_items(job_id: int, after: int = 0, limit: int = 100) -> List[JobItem]:
+    with get_session() as session:
+        statement = (
+            select(JobItem).where(JobItem.job_id == job_id, JobItem.seq > after).order_by(JobItem.seq).limit(limit)
+        )
+        return list(session.exec(statement).all())
+
+
+def requeue_stale_jobs(stale_after: timedelta, now: Optional[datetime] = None) -> int:
+    """Put running jobs whose worker stopped heartbeating back in the queue; they resume from their checkpoint."""
+
+    cutoff = (now or datetime.utcnow()) - stale_after
+    with get_session() as session:
+        result = session.exec(
+            update(Job)
+            .where(Job.status == RUNNING, Job.heartbeat_at < cutoff)
+            .values(status=QUEUED, worker_id=None)
+        )
+        session.commit()
+    if result.rowcount:
+        LOGGER.warning("Requeued stale jobs", extra={"count": result.rowcount})
+    return result.rowcount
+
+
+def _claim_next(worker_id: str) -> Optional[Job]:
+    with get_session() as session:
+        while True:
+            candidate = session.exec(
+                select(Job.id).where(Job.status == QUEUED).order_by(Job.id).limit(1)
+            ).first()
+            if candidate is None:
+                return None
+            now = datetime.utcnow()
+            # Conditional update: another worker (or process) may claim the same row first.
+            claimed = session.exec(
+                update(Job)
+                .where(Job.id == candidate, Job.status == QUEUED)
+                .values(
+                    status=RUNNING,
+                    worker_id=worker_id,
+                    attempts=Job.attempts + 1,
+                    started_at=now,
+                    heartbeat_at=now,
+                )
+            )
+            session.commit()
+            if claimed.rowcount:
+                return session.get(Job, candidate)
+
+
+def _finish(
+    job_id: int,
+    worker_id: str,
+    status: str,
+    result: Optional[Dict[str, Any]] = None,
+    error: Optional[str] = None,
+) -> None:
+    now = datetime.utcnow()
+    with get_session() as session:
+        session.exec(
+            update(Job)
+            .where(Job.id == job_id, Job.worker_id == worker_id, Job.status == RUNNING)
+            .values(
+                status=status,
+                result=to_serializable(result) if result is not None else None,
+                error=error,
+                finished_at=now,
+                heartbeat_at=now,
+            )
+        )
+        session.commit()
+
+
+def run_job(job: Job, worker_id: str) -> None:
+    handler = JOB_HANDLERS.get(job.kind)
+    if handler is None:
+        _finish(job.id, worker_id, FAILED, error=f"Unknown job kind '{job.kind}'")
+        return
+    context = JobContext(job.id, job.checkpoint, worker_id)
+    LOGGER.info("Job started", extra={"job_id": job.id, "kind": job.kind, "attempt": job.attempts})
+    try:
+        result = handler.function(context, handler.payload_model.model_validate(job.payload))
+    except JobInterrupted:
+        LOGGER.warning("Job taken over by another worker", extra={"job_id": job.id, "kind": job.kind})
+        return
+    except Exception as exc:
+        LOGGER.exception("Job failed", extra={"job_id": job.id, "kind": job.kind})
+        _finish(job.id, worker_id, FAILED, error=str(exc) or exc.__class__.__name__)
+        return
+    _finish(job.id, worker_id, SUCCEEDED, result=result)
+    LOGGER.info("Job finished", extra={"job_id": job.id, "kind": job.kind})
+
+
+_WAKE_UP = threading.Event()
+
+
+class JobWorkerPool:
+    """Fixed set of worker threads pulling queued jobs from the ``jobs`` table.
+
+    Claiming is a conditional UPDATE, so several processes can run pools over
+    the same database. Each pool also requeues jobs whose heartbeat went stale
+    (for instance after a crash or restart) so they resume from their last
+    checkpoint.
+    """
+
+    def __init__(self, workers: int, poll_interval: float, stale_after: float) -> None:
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.stale_after = timedelta(seconds=stale_after)
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._prefix = f"{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+    def start(self) -> None:
+        if self.workers <= 0 or self._threads:
+            return
+        self._stop.clear()
+        requeue_stale_jobs(self.stale_after)
+        for index in range(self.workers):
+            thread = threading.Thread(
+                target=self._run, args=(f"{self._prefix}-{index}",), name=f"job-worker-{index}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        _WAKE_UP.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _run(self, worker_id: str) -> None:
+        while not self._stop.is_set():
+            try:
+                requeue_stale_jobs(self.stale_after)
+                job = _claim_next(worker_id)
+            except Exception:  # pragma: no cover - keep the worker alive on transient DB errors
+                LOGGER.exception("Job worker poll failed")
+                job = None
+            if job is not None:
+                run_job(job, worker_id)
+                continue
+            _WAKE_UP.wait(self.poll_interval)
+            _WAKE_UP.clear()
@@ -0,0 +1,197 @@
+from __future__ import annotations
+
+import logging
+import math
+import time
+from decimal import Decimal
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from ..schemas import CalculationParameters, DistributionInput, MoneyInput, MonteCarloRequest
+from .calculator import calculate_import_cost, usd_rate
+from .tax_formulas import ARRAYS, evaluate_formulas, formula_taxes, tax_identifier
+
+LOGGER = logging.getLogger(__name__)
+
+_TASA_ESTADISTICA_RATE = 0.03
+# Normal draws can cross zero; a customs rate is floored at one cent so ARS costs stay finite.
+_MIN_EXCHANGE_RATE = 0.01
+
+
+def _sample(rng: np.random.Generator, spec: DistributionInput, quoted: float, size: int) -> np.ndarray:
+    mean = float(spec.mean) if spec.mean is not None else quoted
+    if spec.kind == "normal":
+        values = rng.normal(mean, float(spec.std), size)
+    elif spec.kind == "lognormal":
+        if mean <= 0:
+            raise ValueError("A lognormal distribution needs a positive mean")
+        # Parameterized by the mean and std of the variable itself, not of its log.
+        sigma2 = math.log1p((float(spec.std) / mean) ** 2)
+        values = rng.lognormal(math.log(mean) - sigma2 / 2, math.sqrt(sigma2), size)
+    elif spec.kind == "uniform":
+        values = rng.uniform(float(spec.low), float(spec.high), size)
+    else:
+        mode = float(spec.mode) if spec.mode is not None else mean
+        low, high = float(spec.low), float(spec.high)
+        values = rng.triangular(low, min(max(mode, low), high), high, size) if high > low else np.full(size, low)
+    return np.maximum(values, 0.0)
+
+
+def _to_usd(money: MoneyInput, amount: Any, exchange_rate: np.ndarray, fx_rates: Dict[str, Decimal]) -> Any:
+    if money.currency == "ARS":
+        return amount / exchange_rate
+    if money.currency == "USD":
+        return amount
+    return amount * float(usd_rate(money.currency, fx_rates))
+
+
+def _valid_amount(identifier: str, amount: np.ndarray) -> np.ndarray:
+    # The calculator rejects these amounts; NaN carries the rejection through the sums.
+    return np.where(np.isfinite(amount) & (amount >= 0), amount, np.nan)
+
+
+def landed_cost_batch(
+    params: CalculationParameters, exchange_rate: np.ndarray, freight: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """Vectorized :func:`~app.services.calculator.compute_landed_cost` over scenarios.
+
+    Mirrors the Decimal tax chain step by step in float64 without the
+    intermediate quantization, so each scenario lands within cents of the
+    reference calculator. ``freight`` overrides the freight amount per
+    scenario, in the currency the shipment was quoted in. Scenarios the
+    calculator would reject, where a formula tax divides by zero or goes
+    negative, come back as NaN.
+    """
+
+    costs, fx_rates = params.costs, params.fx_rates
+    freight_amount = float(costs.freight.amount) if freight is None else freight
+    cif = (
+        _to_usd(costs.fob, float(costs.fob.amount), exchange_rate, fx_rates)
+        + _to_usd(costs.freight, freight_amount, exchange_rate, fx_rates)
+        + _to_usd(costs.insurance, float(costs.insurance.amount), exchange_rate, fx_rates)
+        + np.zeros_like(exchange_rate)
+    )
+    di = cif * float(params.di_rate)
+    tasa = cif * _TASA_ESTADISTICA_RATE if params.apply_tasa_estadistica else np.zeros_like(cif)
+
+    cif_taxes = np.zeros_like(cif)
+    fixed_ars = 0.0
+    # USD amount of each tax, which formula taxes read by identifier.
+    amounts: Dict[str, Any] = {}
+    for tax in params.additional_taxes:
+        if tax.base == "CIF":
+            amount = amounts[tax_identifier(tax.name)] = cif * float(tax.rate)
+            cif_taxes = cif_taxes + amount
+        elif tax.base == "ARS":
+            money = tax.amount
+            if money is None or money.currency == "ARS":
+                amount_ars = float(tax.amount_ars if money is None else money.amount)
+            else:
+                # Quoted in another currency, so the peso amount moves with the customs rate.
+                amount_ars = _to_usd(money, float(money.amount), exchange_rate, fx_rates) * exchange_rate
+            fixed_ars = fixed_ars + amount_ars
+            amounts[tax_identifier(tax.name)] = amount_ars / exchange_rate
+    # BaseIVA taxes compound on each other in declaration order, as in the calculator.
+    subtotal = cif + di + tasa + cif_taxes
+    chained = np.zeros_like(cif)
+    for tax in params.additional_taxes:
+        if tax.base == "BaseIVA":
+            amount = amounts[tax_identifier(tax.name)] = subtotal * float(tax.rate)
+            chained = chained + amount
+            subtotal = subtotal + amount
+    taxes_usd = cif_taxes + chained
+    formulas = formula_taxes(params.additional_taxes)
+    if formulas:
+        values = {"CIF_USD": cif, "DI_USD": di, "Tasa_Estadistica_USD": tasa, "Subtotal_USD": subtotal}
+        values.update(amounts, tc_aduana=exchange_rate)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            results = evaluate_formulas(formulas, values, ARRAYS, finish=_valid_amount)
+        taxes_usd = taxes_usd + sum(results)
+
+    base_iva = cif + di + tasa + taxes_usd
+    iva = base_iva * float(params.iva_rate)
+    perc_iva = base_iva * float(params.perc_iva_rate)
+    perc_ganancias = (base_iva + iva + perc_iva + di + tasa) * exchange_rate * float(params.perc_ganancias_rate)
+    return (
+        (cif + di + tasa + iva + perc_iva + taxes_usd) * exchange_rate
+        + perc_ganancias
+        + fixed_ars
+        + float(params.gastos_locales_ars)
+    )
+
+
+def _round(value: float, digits: str) -> Decimal:
+    return Decimal(repr(float(value))).quantize(Decimal(digits))
+
+
+def _distribution(values: np.ndarray, percentiles: List[float], digits: str) -> Dict[str, Any]:
+    points = np.percentile(values, percentiles)
+    return {
+        "mean": _round(values.mean(), digits),
+        "std": _round(values.std(), digits),
+        "min": _round(values.min(), digits),
+        "max": _round(values.max(), digits),
+        "percentiles": {f"p{value:g}": _round(point, digits) for value, point in zip(percentiles, points)},
+    }
+
+
+def simulate_margin_risk(params: CalculationParameters, request: MonteCarloRequest) -> Dict[str, Any]:
+    """Simulate ``utilidad``/``margen`` when ``tc_aduana`` (and optionally freight) move after quoting.
+
+    The sale price and the Mercado Pago fee are fixed by the quote, computed
+    once with the Decimal calculator at the quoted rate; only the landed cost is
+    re-evaluated, for all scenarios at once.
+    """
+
+    started = time.perf_counter()
+    quote = calculate_import_cost(params)
+    rng = np.random.default_rng(request.seed)
+    size = request.scenarios
+
+    exchange_rate = np.maximum(_sample(rng, request.tc_aduana, float(params.tc_aduana), size), _MIN_EXCHANGE_RATE)
+    freight = None
+    if request.freight is not None:
+        freight = _sample(rng, request.freight, float(params.costs.freight.amount), size)
+
+    costo = landed_cost_batch(params, exchange_rate, freight)
+    # Left out rather than priced with a zero tax the calculator would never produce.
+    invalid = np.isnan(costo)
+    invalid_scenarios = int(np.count_nonzero(invalid))
+    if invalid_scenarios == size:
+        raise ValueError("A tax formula fails in every scenario")
+    if invalid_scenarios:
+        valid = ~invalid
+        exchange_rate, costo = exchange_rate[valid], costo[valid]
+        if freight is not None:
+            freight = freight[valid]
+
+    precio_neto = float(quote.precio_neto_ars)
+    utilidad = precio_neto - costo - float(params.costos_salida_ars) - float(quote.mp_fee_total)
+    margen = utilidad / precio_neto if precio_neto else np.zeros_like(utilidad)
+
+    percentiles = request.percentiles
+    summary: Dict[str, Any] = {
+        "scenarios": size,
+        "invalid_scenarios": invalid_scenarios,
+        "seed": request.seed,
+        "quote": {
+            "tc_aduana": params.tc_aduana,
+            "costo_puesto_ars": quote.costo_puesto_ars,
+            "precio_neto_ars": quote.precio_neto_ars,
+            "utilidad_ars": quote.utilidad,
+            "margen": quote.margen,
+        },
+        "tc_aduana": _distribution(exchange_rate, percentiles, "0.0001"),
+        "costo_puesto_ars": _distribution(costo, percentiles, "0.01"),
+        "utilidad_ars": _distribution(utilidad, percentiles, "0.01"),
+        "margen": _distribution(margen, percentiles, "0.0001"),
+        "probability_of_loss": _round(np.count_nonzero(utilidad < 0) / utilidad.size, "0.0001"),
+    }
+    if freight is not None:
+        summary["freight"] = _distribution(freight, percentiles, "0.0001")
+    LOGGER.info(
+        "Monte Carlo simulation finished",
+        extra={"scenarios": size, "elapsed_ms": round((time.perf_counter() - started) * 1000, 2)},
+    )
+    return summary
@@ -0,0 +1,317 @@
+from __future__ import annotations
+
+import argparse
+import csv
+import io
+import logging
+import re
+import unicodedata
+from dataclasses import dataclass
+from datetime import datetime
+from decimal import Decimal
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from openpyxl import load_workbook
+from sqlalchemy import delete, func
+from sqlmodel import select
+
+from ..config import get_settings
+from ..storage.database import get_session, init_db, upsert_statement
+from ..storage.models import NcmPosition
+from ..storage.snapshot import TableSnapshot
+from ..utils.decimal_utils import to_decimal
+from ..utils.serialization import dumps_json
+
+LOGGER = logging.getLogger(__name__)
+
+# NCM positions have 2 to 8 digits; the SIM opening adds three more and a check letter.
+_CODE_PATTERN = re.compile(r"^\d{2,11}[A-Z]?$")
+_CODE_SEPARATORS = re.compile(r"[.\s-]")
+
+_UPSERT_CHUNK = 5000
+
+# Header aliases, compared after lower-casing and stripping accents. ``di_rate``
+# is a fraction like the API field; the other DI columns are percentages as
+# printed in the tariff schedule.
+_CODE_COLUMNS = {"ncm", "codigo", "code", "posicion", "codigo_ncm"}
+_DESCRIPTION_COLUMNS = {"descripcion", "description"}
+_RATE_COLUMNS = {"di_rate"}
+_PERCENT_COLUMNS = {"di", "aec", "di_percent", "derecho_importacion"}
+_TASA_COLUMNS = {"apply_tasa_estadistica", "tasa_estadistica", "te"}
+
+_TRUE_VALUES = {"1", "true", "si", "s", "x", "yes", "y"}
+_FALSE_VALUES = {"0", "false", "no", "n"}
+
+
+class NcmImportError(ValueError):
+    """A tariff file could not be loaded; nothing was written."""
+
+
+def normalize_ncm_code(code: Any) -> str:
+    """Return ``code`` without separators ("8507.60.00" -> "85076000") or raise ``ValueError``."""
+
+    cleaned = _CODE_SEPARATORS.sub("", str(code)).upper()
+    if not _CODE_PATTERN.match(cleaned):
+        raise ValueError(f"Invalid NCM code '{code}'")
+    return cleaned
+
+
+@dataclass(frozen=True)
+class NcmEntry:
+    code: str
+    di_rate: Decimal
+    apply_tasa_estadistica: bool
+    description: Optional[str] = None
+
+
+# Key holding a node's entry; child nodes are keyed by single characters.
+_VALUE = ""
+
+
+class NcmTrie:
+    """Character trie over normalized codes answering longest-prefix queries.
+
+    A chapter or heading entry ("85", "8507") is the default for every more
+    specific code below it, so a lookup walks the code once and keeps the
+    deepest entry seen: O(len(code)) regardless of how many positions exist.
+    """
+
+    __slots__ = ("_root", "size")
+
+    def __init__(self) -> None:
+        self._root: Dict[str, Any] = {}
+        self.size = 0
+
+    def insert(self, code: str, entry: NcmEntry) -> None:
+        node = self._root
+        for char in code:
+            node = node.setdefault(char, {})
+        if _VALUE not in node:
+            self.size += 1
+        node[_VALUE] = entry
+
+    def longest_prefix(self, code: str) -> Optional[NcmEntry]:
+        node = self._root
+        best = None
+        for char in code:
+            node = node.get(char)
+            if node is None:
+                break
+            best = node.get(_VALUE, best)
+        return best
+
+
+def _build_trie() -> NcmTrie:
+    trie = NcmTrie()
+    columns = (NcmPosition.code, NcmPosition.di_rate, NcmPosition.apply_tasa_estadistica, NcmPosition.description)
+    with get_session() as session:
+        for code, di_rate, apply_tasa, description in session.exec(select(*columns)):
+            trie.insert(code, NcmEntry(code, Decimal(di_rate), apply_tasa, description))
+    return trie
+
+
+class NcmIndex:
+    """Process-wide trie over ``ncm_positions``; see :class:`TableSnapshot` for how it stays current."""
+
+    def __init__(self, refresh_seconds: float) -> None:
+        self._snapshot = TableSnapshot(NcmPosition, _build_trie, refresh_seconds)
+
+    def invalidate(self) -> None:
+        self._snapshot.invalidate()
+
+    def lookup(self, code: str) -> Optional[NcmEntry]:
+        return self._snapshot.get().longest_prefix(normalize_ncm_code(code))
+
+    @property
+    def size(self) -> int:
+        return self._snapshot.get().size
+
+
+@lru_cache()
+def get_ncm_index() -> NcmIndex:
+    return NcmIndex(get_settings().ncm_refresh_seconds)
+
+
+def lookup_ncm(code: str) -> Optional[NcmEntry]:
+    """Most specific tariff position covering ``code``, or ``None``."""
+
+    return get_ncm_index().lookup(code)
+
+
+def _header_key(value: Any) -> str:
+    text = unicodedata.normalize("NFKD", str(value or "")).encode("ascii", "ignore").decode()
+    return re.sub(r"[\s-]+", "_", text.strip().lower())
+
+
+def _column_map(header: List[Any]) -> Dict[str, int]:
+    columns: Dict[str, int] = {}
+    for index, cell in enumerate(header):
+        key = _header_key(cell)
+        for field, aliases in (
+            ("code", _CODE_COLUMNS),
+            ("description", _DESCRIPTION_COLUMNS),
+            ("di_rate", _RATE_COLUMNS),
+            ("di_percent", _PERCENT_COLUMNS),
+            ("tasa", _TASA_COLUMNS),
+        ):
+            if key in aliases and field not in columns:
+                columns[field] = index
+    if "code" not in columns or ("di_rate" not in columns and "di_percent" not in columns):
+        raise NcmImportError("The header must name an NCM code column and a DI column (di_rate, di or aec)")
+    return columns
+
+
+def _parse_code(value: Any) -> str:
+    if isinstance(value, (int, float)):
+        # Spreadsheets store codes as numbers and drop the leading zero of
+        # chapters 01-09; positions always have an even number of digits.
+        number = Decimal(str(value))
+        if number == number.to_integral_value():
+            digits = str(int(number))
+            return normalize_ncm_code(digits if len(digits) % 2 == 0 else "0" + digits)
+        # A dotted number is a heading and its subheading, which also loses
+        # its trailing zero: 101.2 is 0101.20 and 8507.6 is 8507.60.
+        heading, _, subheading = format(number, "f").partition(".")
+        if len(heading) > 4:
+            raise ValueError(f"Invalid NCM code '{value}'")
+        return normalize_ncm_code(heading.zfill(4) + subheading + "0" * (len(subheading) % 2))
+    return normalize_ncm_code(value)
+
+
+def _parse_rate(value: Any, percent: bool) -> Decimal:
+    if isinstance(value, str) and value.strip().endswith("%"):
+        value, percent = value.strip()[:-1], True
+    if value in (None, ""):
+        raise ValueError("DI rate is missing")
+    rate = to_decimal(value)
+    if percent:
+        rate = rate / Decimal("100")
+    if not (Decimal("0") <= rate <= Decimal("1")):
+        raise ValueError(f"DI rate {value} is outside 0-100%")
+    return rate
+
+
+def _parse_flag(value: Any) -> bool:
+    if value is None or isinstance(value, bool):
+        return True if value is None else value
+    text = _header_key(value)
+    if not text or text in _TRUE_VALUES:
+        return True
+    if text in _FALSE_VALUES:
+        return False
+    raise ValueError(f"Unrecognized tasa estadistica flag '{value}'")
+
+
+def _positions(rows: Iterable[List[Any]]) -> Iterator[Dict[str, Any]]:
+    iterator = iter(rows)
+    columns: Optional[Dict[str, int]] = None
+    for line, row in enumerate(iterator, start=1):
+        if not any(cell not in (None, "") for cell in row):
+            continue
+        if columns is None:
+            columns = _column_map(list(row))
+            continue
+
+        def cell(field: str) -> Any:
+            index = columns.get(field)
+            value = row[index] if index is not None and index < len(row) else None
+            return value.strip() if isinstance(value, str) else value
+
+        try:
+            percent = "di_rate" not in columns
+            description = cell("description")
+            yield {
+                "code": _parse_code(cell("code")),
+                "description": str(description) if description not in (None, "") else None,
+                "di_rate": str(_parse_rate(cell("di_percent" if percent else "di_rate"), percent)),
+                "apply_tasa_estadistica": _parse_flag(cell("tasa")),
+            }
+        except ValueError as exc:
+            raise NcmImportError(f"Row {line}: {exc}") from exc
+    if columns is None:
+        raise NcmImportError("The file has no header row")
+
+
+def _csv_rows(data: bytes) -> Iterator[List[str]]:
+    text = data.decode("utf-8-sig")
+    try:
+        dialect = csv.Sniffer().sniff(text[:4096], delimiters=",;\t")
+    except csv.Error:
+        dialect = csv.excel
+    return csv.reader(io.StringIO(text), dialect)
+
+
+def _xlsx_rows(data: bytes) -> Iterator[List[Any]]:
+    workbook = load_workbook(io.BytesIO(data), read_only=True, data_only=True)
+    try:
+        for row in workbook.worksheets[0].iter_rows(values_only=True):
+            yield list(row)
+    finally:
+        workbook.close()
+
+
+def read_positions(data: bytes, filename: str) -> Iterator[Dict[str, Any]]:
+    """Parse a CSV (comma, semicolon or tab separated) or XLSX tariff file."""
+
+    suffix = Path(filename).suffix.lower()
+    if suffix == ".xlsx":
+        return _positions(_xlsx_rows(data))
+    if suffix in (".csv", ".txt", ""):
+        return _positions(_csv_rows(data))
+    raise NcmImportError(f"Unsupported tariff file type '{suffix}'")
+
+
+def load_positions(positions: Iterable[Dict[str, Any]], replace: bool = False) -> Dict[str, int]:
+    """Upsert ``positions`` in one transaction; ``replace`` also drops codes missing from them.
+
+    A single ``INSERT ... ON CONFLICT`` statement is compiled once and run with
+    ``executemany`` over chunks of rows, so a full schedule of tens of
+    thousands of positions loads in about a second. A parsing error anywhere
+    rolls the whole load back. Codes repeated in the file keep their last row.
+    """
+
+    statement = upsert_statement(
+        NcmPosition.__table__, ["code"], ["description", "di_rate", "apply_tasa_estadistica", "updated_at"]
+    )
+    stamp = datetime.utcnow()
+    loaded = 0
+    with get_session() as session:
+        connection = session.connection()
+        chunk: List[Dict[str, Any]] = []
+        for position in positions:
+            chunk.append({**position, "updated_at": stamp})
+            if len(chunk) >= _UPSERT_CHUNK:
+                connection.execute(statement, chunk)
+                loaded += len(chunk)
+                chunk = []
+        if chunk:
+            connection.execute(statement, chunk)
+            loaded += len(chunk)
+        removed = 0
+        if replace:
+            removed = session.exec(delete(NcmPosition).where(NcmPosition.updated_at != stamp)).rowcount
+        session.commit()
+        total = session.exec(select(func.count(NcmPosition.id))).one()
+    get_ncm_index().invalidate()
+    LOGGER.info("NCM positions loaded", extra={"loaded": loaded, "removed": removed, "total": total})
+    return {"loaded": loaded, "removed": removed, "total": total}
+
+
+def import_file(data: bytes, filename: str, replace: bool = False) -> Dict[str, int]:
+    return load_positions(read_positions(data, filename), replace=replace)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Load an NCM tariff schedule from CSV or XLSX")
+    parser.add_argument("path", type=Path)
+    parser.add_argument("--replace", action="store_true", help="drop positions missing from the file")
+    args = parser.parse_args(argv)
+
+    init_db()
+    print(dumps_json(import_file(args.path.read_bytes(), args.path.name, args.replace)))
+
+
+if __name__ == "__main__":
+    main()
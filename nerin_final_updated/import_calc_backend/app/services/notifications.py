@@ -4,6 +4,7 @@ import logging
 from decimal import Decimal
 from typing import Optional, Tuple
 
+from sqlalchemy import update
 from sqlalchemy.exc import IntegrityError
 from sqlmodel import select
 
@@ -12,12 +13,20 @@ from ..storage.database import get_session
 from ..storage.models import Calculation, PaymentNotification
 from ..utils.decimal_utils import to_decimal
 from ..utils.serialization import to_serializable
-from .calculator import calculate_import_cost
+from .archival import find_archived_payment
+from .calculator import build_result_payload, calculate_import_cost
+from .export_cache import get_export_cache
 
 LOGGER = logging.getLogger(__name__)
 
 
 def save_payment_notification(payload: PaymentNotificationRequest) -> PaymentNotification:
+    archived = find_archived_payment(payload.payment_id)
+    if archived is not None:
+        # Archived rows no longer hold the unique constraint; keep redeliveries idempotent.
+        LOGGER.info("Payment notification already archived", extra={"payment_id": payload.payment_id})
+        return PaymentNotification.model_validate(archived)
+
     notification = PaymentNotification(
         payment_id=payload.payment_id,
         order_reference=payload.order_reference,
@@ -68,24 +77,21 @@ def apply_real_fee_to_calculation(
 
         result = calculate_import_cost(params, mp_fee_override=to_decimal(fee_total))
 
-        calculation.results = to_serializable(
-            {
-                "precio_neto_ars": str(result.precio_neto_ars),
-                "precio_final_ars": str(result.precio_final_ars),
-                "utilidad_ars": str(result.utilidad),
-                "margen": str(result.margen),
-                "costo_puesto_ars": str(result.costo_puesto_ars),
-                "breakdown": to_serializable(result.breakdown),
-                "additional_taxes": to_serializable(result.additional_taxes),
-                "totals": to_serializable(result.totals),
-                "unitary": to_serializable(result.unitary),
-            }
+        # Bump the revision in SQL: a read-modify-write here could hand two
+        # concurrent notifications the same revision, and with it the same ETag.
+        session.exec(
+            update(Calculation)
+            .where(Calculation.id == calculation.id)
+            .values(
+                results=build_result_payload(result),
+                mp_fee_applied=float(fee_total),
+                mp_fee_details=to_serializable(fee_breakdown or {}),
+                revision=Calculation.revision + 1,
+            )
         )
-        calculation.mp_fee_applied = float(fee_total)
-        calculation.mp_fee_details = to_serializable(fee_breakdown or {})
-        session.add(calculation)
         session.commit()
         session.refresh(calculation)
+        get_export_cache().invalidate(calculation.id)
         LOGGER.info(
             "Calculation updated with real fee",
             extra={"order_reference": order_reference, "fee_total": float(fee_total)},
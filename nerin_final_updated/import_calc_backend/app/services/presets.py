@@ -1,12 +1,20 @@
 from __future__ import annotations
 
+import hashlib
 import logging
-from typing import List, Optional
+import threading
+import time
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
 
 import yaml
+from pydantic import ValidationError
+from sqlalchemy.exc import IntegrityError
 from sqlmodel import select
 
-from ..config import DefaultRates, get_defaults_path
+from ..config import DefaultRates, get_defaults_path, get_settings
+from ..storage.cache import get_cache
 from ..storage.database import get_session, init_db
 from ..storage.models import Preset
 from ..utils.serialization import to_serializable
@@ -14,16 +22,9 @@ from ..utils.serialization import to_serializable
 LOGGER = logging.getLogger(__name__)
 
 
-def load_default_presets() -> List[Preset]:
-    path = get_defaults_path()
-    if not path.exists():
-        return []
-
-    with path.open("r", encoding="utf-8") as file:
-        payload = yaml.safe_load(file) or []
-
+def _parse_presets(payload: Optional[List[Dict[str, Any]]]) -> List[Preset]:
     presets: List[Preset] = []
-    for item in payload:
+    for item in payload or []:
         model = DefaultRates(**item)
         params = {
             "di_rate": model.di_rate,
@@ -46,30 +47,166 @@ def load_default_presets() -> List[Preset]:
     return presets
 
 
-def ensure_default_presets() -> None:
-    init_db()
-    defaults = load_default_presets()
-    if not defaults:
-        return
+def load_default_presets() -> List[Preset]:
+    path = get_defaults_path()
+    if not path.exists():
+        return []
+
+    with path.open("r", encoding="utf-8") as file:
+        return _parse_presets(yaml.safe_load(file))
 
+
+def _upsert(presets: List[Preset]) -> Dict[str, int]:
+    inserted = updated = 0
     with get_session() as session:
-        for preset in defaults:
-            exists = session.exec(select(Preset).where(Preset.name == preset.name)).first()
-            if exists:
-                continue
-            session.add(preset)
+        names = [preset.name for preset in presets]
+        existing = {preset.name: preset for preset in session.exec(select(Preset).where(Preset.name.in_(names)))}
+        for preset in presets:
+            current = existing.get(preset.name)
+            if current is None:
+                session.add(Preset(name=preset.name, description=preset.description, parameters=preset.parameters))
+                inserted += 1
+            elif current.parameters != preset.parameters or current.description != preset.description:
+                current.parameters = preset.parameters
+                current.description = preset.description
+                session.add(current)
+                updated += 1
         session.commit()
+    return {"inserted": inserted, "updated": updated, "unchanged": len(presets) - inserted - updated}
+
+
+def sync_presets(presets: List[Preset]) -> Dict[str, int]:
+    """Insert new presets and update changed ones in a single transaction.
+
+    Existing rows are read with one ``IN`` query and only those whose
+    parameters or description differ are written. Presets missing from
+    ``presets`` are left alone, since they may have been created through the API.
+    """
+
+    try:
+        return _upsert(presets)
+    except IntegrityError:
+        # Another worker inserted one of the new presets first; on retry it is an update.
+        return _upsert(presets)
+
+
+class DefaultsWatcher:
+    """Reloads ``defaults.yaml`` into the ``presets`` table when the file changes.
+
+    :meth:`check` is cheap enough for the request path: it does nothing until
+    ``interval`` seconds have passed, then compares the file's mtime and size,
+    and only hashes the content when those moved. A new hash triggers a parse,
+    one upsert transaction and an invalidation of the shared preset cache.
+    Every worker runs its own watcher; whichever applies a change first makes
+    the others drop their cached presets too.
+    """
+
+    def __init__(self, path: Path, interval: float) -> None:
+        self.path = path
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._checked_at = float("-inf")
+        self._stat: Optional[Tuple[int, int]] = None
+        self._digest: Optional[str] = None
+
+    def check(self) -> Optional[Dict[str, int]]:
+        if self.interval <= 0 or time.monotonic() - self._checked_at < self.interval:
+            return None
+        return self.reload()
+
+    def reload(self, force: bool = False) -> Optional[Dict[str, int]]:
+        """Apply the file if its content changed (or always, with ``force``); returns the upsert summary."""
+
+        with self._lock:
+            self._checked_at = time.monotonic()
+            try:
+                stat = self.path.stat()
+            except FileNotFoundError:
+                return None
+            key = (stat.st_mtime_ns, stat.st_size)
+            if key == self._stat and not force:
+                return None
+            data = self.path.read_bytes()
+            digest = hashlib.sha256(data).hexdigest()
+            if digest == self._digest and not force:
+                self._stat = key
+                return None
+            try:
+                presets = _parse_presets(yaml.safe_load(data))
+            except (yaml.YAMLError, ValidationError, TypeError):
+                # Keep serving the last good presets; these bytes never parse, so
+                # only the next edit is looked at.
+                LOGGER.exception("Ignoring invalid defaults file", extra={"path": str(self.path)})
+                self._stat, self._digest = key, digest
+                return None
+            # A failed sync records nothing, so the next check retries the same file.
+            summary = sync_presets(presets)
+            self._stat, self._digest = key, digest
+        # When another worker already applied this file, its rows are unchanged here.
+        if summary["inserted"] or summary["updated"]:
+            _invalidate_cache()
+        LOGGER.info("Default presets reloaded", extra={"path": str(self.path), **summary})
+        return summary
+
+
+@lru_cache()
+def get_defaults_watcher() -> DefaultsWatcher:
+    return DefaultsWatcher(get_defaults_path(), get_settings().presets_reload_seconds)
+
+
+# Presets by name, shared by every request of this process and tagged with
+# the generation of the ``presets`` namespace of the shared cache they were
+# read at. Any worker that changes presets bumps that generation, so the
+# other workers notice on their next lookup. The objects are detached from
+# their session and must be treated as read-only.
+_NAMESPACE = "presets"
+_CACHE_LOCK = threading.Lock()
+_CACHE: Optional[Tuple[int, Dict[str, Preset]]] = None
+
+
+def _invalidate_cache() -> None:
+    global _CACHE
+    get_cache().invalidate(_NAMESPACE)
+    with _CACHE_LOCK:
+        _CACHE = None
+
+
+def _remember(generation: int, presets: List[Preset]) -> Dict[str, Preset]:
+    global _CACHE
+    cache = {preset.name: preset for preset in presets}
+    with _CACHE_LOCK:
+        _CACHE = (generation, cache)
+    return cache
+
+
+def _cached_presets() -> Dict[str, Preset]:
+    shared = get_cache()
+    generation = shared.generation(_NAMESPACE)
+    cached = _CACHE
+    if cached is not None and cached[0] == generation:
+        return cached[1]
+    rows = shared.get_json(_NAMESPACE, "all")
+    if rows is not None:
+        return _remember(generation, [Preset(**row) for row in rows])
+    with get_session() as session:
+        presets = list(session.exec(select(Preset).order_by(Preset.id)))
+    shared.set_json(_NAMESPACE, "all", [preset.model_dump() for preset in presets], generation)
+    return _remember(generation, presets)
+
+
+def ensure_default_presets() -> None:
+    init_db()
+    get_defaults_watcher().reload(force=True)
 
 
 def list_presets() -> List[Preset]:
-    with get_session() as session:
-        results = session.exec(select(Preset)).all()
-        return list(results)
+    get_defaults_watcher().check()
+    return list(_cached_presets().values())
 
 
 def get_preset(name: str) -> Optional[Preset]:
-    with get_session() as session:
-        return session.exec(select(Preset).where(Preset.name == name)).first()
+    get_defaults_watcher().check()
+    return _cached_presets().get(name)
 
 
 def create_preset(name: str, description: Optional[str], parameters: dict) -> Preset:
@@ -79,6 +216,6 @@ def create_preset(name: str, description: Optional[str], parameters: dict) -> Pr
         session.add(preset)
         session.commit()
         session.refresh(preset)
-    LOGGER.info("Preset created", extra={"name": name})
+    _invalidate_cache()
+    LOGGER.info("Preset created", extra={"preset_name": name})
     return preset
-
@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Any, Callable, Dict, List, Literal, Optional
+
+from sqlmodel import select
+
+from ..storage.models import Calculation
+from ..storage.replica import get_reporting_session
+
+GroupBy = Literal["day", "month", "preset"]
+
+_GROUP_KEYS: Dict[str, Callable[[datetime, Optional[str]], Optional[str]]] = {
+    "day": lambda created_at, preset_name: created_at.date().isoformat(),
+    "month": lambda created_at, preset_name: created_at.strftime("%Y-%m"),
+    "preset": lambda created_at, preset_name: preset_name,
+}
+# Rows decoded per round trip while a report streams the table.
+_REPORT_BATCH = 1000
+
+
+def _naive_utc(value: datetime) -> datetime:
+    # ``created_at`` is stored as naive UTC.
+    return value if value.tzinfo is None else value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def _filters(
+    since: Optional[datetime],
+    until: Optional[datetime],
+    order_reference: Optional[str] = None,
+    preset_name: Optional[str] = None,
+) -> List[Any]:
+    conditions = []
+    if since is not None:
+        conditions.append(Calculation.created_at >= _naive_utc(since))
+    if until is not None:
+        conditions.append(Calculation.created_at < _naive_utc(until))
+    if order_reference is not None:
+        conditions.append(Calculation.order_reference == order_reference)
+    if preset_name is not None:
+        conditions.append(Calculation.preset_name == preset_name)
+    return conditions
+
+
+def list_calculations(
+    before: Optional[int] = None,
+    limit: int = 50,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    order_reference: Optional[str] = None,
+    preset_name: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Newest calculations first, ``limit`` per page; pass ``next_before`` back as ``before`` for the next page."""
+
+    conditions = _filters(since, until, order_reference, preset_name)
+    if before is not None:
+        conditions.append(Calculation.id < before)
+    statement = (
+        select(
+            Calculation.id,
+            Calculation.created_at,
+            Calculation.order_reference,
+            Calculation.preset_name,
+            Calculation.revision,
+            Calculation.mp_fee_applied,
+            Calculation.results,
+        )
+        .where(*conditions)
+        .order_by(Calculation.id.desc())
+        .limit(limit)
+    )
+    with get_reporting_session() as session:
+        rows = session.exec(statement).all()
+    items = [
+        {
+            "id": row[0],
+            "created_at": row[1].isoformat(),
+            "order_reference": row[2],
+            "preset_name": row[3],
+            "revision": row[4],
+            "mp_fee_applied": row[5],
+            "precio_final_ars": row[6].get("precio_final_ars"),
+            "utilidad_ars": row[6].get("utilidad_ars"),
+            "margen": row[6].get("margen"),
+        }
+        for row in rows
+    ]
+    return {"items": items, "next_before": items[-1]["id"] if len(items) == limit else None}
+
+
+def summarize_calculations(
+    group_by: GroupBy = "day",
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+) -> Dict[str, Any]:
+    """Count, price, profit and fee totals and the mean margin of calculations per ``group_by`` bucket."""
+
+    key_of = _GROUP_KEYS[group_by]
+    statement = (
+        select(Calculation.created_at, Calculation.preset_name, Calculation.mp_fee_applied, Calculation.results)
+        .where(*_filters(since, until))
+        .execution_options(yield_per=_REPORT_BATCH)
+    )
+    groups: Dict[Optional[str], Dict[str, Any]] = {}
+    with get_reporting_session() as session:
+        for created_at, preset_name, fee, results in session.exec(statement):
+            key = key_of(created_at, preset_name)
+            group = groups.get(key)
+            if group is None:
+                group = groups[key] = {
+                    "count": 0,
+                    "precio_final_total": Decimal(0),
+                    "utilidad_total": Decimal(0),
+                    "mp_fee_total": Decimal(0),
+                    "margen_sum": Decimal(0),
+                }
+            group["count"] += 1
+            group["precio_final_total"] += Decimal(str(results.get("precio_final_ars", 0)))
+            group["utilidad_total"] += Decimal(str(results.get("utilidad_ars", 0)))
+            group["margen_sum"] += Decimal(str(results.get("margen", 0)))
+            if fee is not None:
+                group["mp_fee_total"] += Decimal(str(fee))
+
+    rows = []
+    # Buckets without a preset sort first; ``str`` keeps days and months in calendar order.
+    for key in sorted(groups, key=lambda value: (value is not None, value or "")):
+        group = groups.pop(key)
+        margen_sum = group.pop("margen_sum")
+        rows.append(
+            {
+                group_by: key,
+                **group,
+                "margen_promedio": (margen_sum / group["count"]).quantize(Decimal("0.0001")),
+            }
+        )
+    return {"group_by": group_by, "groups": rows}
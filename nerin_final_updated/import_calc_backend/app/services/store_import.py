@@ -0,0 +1,447 @@
+"""Consolidate the Node ``import-calculator-store.json`` into the database.
+
+The Node backend (``backend/data/importCalcStore.js``) keeps every
+calculation and payment notification in one JSON document::
+
+    {"lastCalculationId": 42, "calculations": [...], "notifications": [...]}
+
+That file is read here as a stream: :class:`StoreReader` walks the top-level
+object by hand and decodes one array element at a time with
+:meth:`json.JSONDecoder.raw_decode`, so memory stays bounded by the largest
+single record rather than by the file. Records are validated and written in
+chunks, one transaction per chunk, and re-running an import is harmless.
+"""
+
+from __future__ import annotations
+
+import argparse
+import codecs
+import json
+import logging
+import os
+import re
+import shutil
+import sys
+import tempfile
+from datetime import datetime, timezone
+from decimal import Decimal
+from pathlib import Path
+from typing import Any, BinaryIO, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy import insert, select, text
+
+from ..config import get_settings
+from ..schemas import StoreCalculationRecord, StoreImportJobPayload, StoreNotificationRecord
+from ..storage.database import engine, get_session, init_db, insert_ignore_statement
+from ..storage.models import ArchivedRecord, Calculation, PaymentNotification
+from ..utils.serialization import dumps_json, to_serializable
+from .archival import PAYMENT_NOTIFICATIONS, find_archived_calculations
+from .jobs import JobContext, job_handler
+
+LOGGER = logging.getLogger(__name__)
+
+SECTIONS = ("calculations", "notifications")
+READ_SIZE = 64 * 1024
+# A record this large is not a record; most likely the file is truncated or corrupt.
+MAX_RECORD_CHARS = 32 * 1024 * 1024
+# Rejected rows are reported individually up to this many per run, then only counted.
+MAX_REPORTED_ERRORS = 1000
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+Progress = Callable[[Dict[str, Any], List[Dict[str, Any]]], None]
+
+
+class StoreImportError(ValueError):
+    """The file is not a readable store document; rows committed so far are kept."""
+
+
+class StoreReader:
+    """Yield ``(section, element)`` for every element of the store's arrays, in file order.
+
+    Other top-level keys are decoded whole (``lastCalculationId`` is kept in
+    :attr:`last_calculation_id`). Numbers are decoded as ``Decimal`` so
+    amounts keep the digits the Node side wrote.
+    """
+
+    def __init__(self, stream: BinaryIO, read_size: int = READ_SIZE) -> None:
+        self._stream = stream
+        self._read_size = read_size
+        self._text = codecs.getincrementaldecoder("utf-8-sig")()
+        self._json = json.JSONDecoder(parse_float=Decimal)
+        self._buffer = ""
+        self._pos = 0
+        self._eof = False
+        self.bytes_read = 0
+        self.last_calculation_id: Any = None
+
+    def _fill(self, size: int) -> bool:
+        """Append about ``size`` more bytes to the buffer, dropping what was consumed."""
+
+        if self._eof:
+            return False
+        data = self._stream.read(size)
+        self.bytes_read += len(data)
+        chunk = self._text.decode(data, final=not data)
+        self._eof = not data
+        self._buffer = self._buffer[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def _peek(self) -> str:
+        """Next non-whitespace character, or ``""`` at the end of the file."""
+
+        while True:
+            self._pos = _WHITESPACE.match(self._buffer, self._pos).end()
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill(self._read_size):
+                return ""
+
+    def _expect(self, allowed: str) -> str:
+        char = self._peek()
+        if not char or char not in allowed:
+            found = repr(char) if char else "end of file"
+            raise StoreImportError(f"Expected one of {allowed!r} near byte {self.bytes_read}, found {found}")
+        self._pos += 1
+        return char
+
+    def _value(self) -> Any:
+        self._peek()
+        while True:
+            try:
+                value, end = self._json.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError as exc:
+                error = exc
+            else:
+                # A number at the very end of the buffer may continue in the next read.
+                if end < len(self._buffer) or self._eof:
+                    self._pos = end
+                    return value
+                error = None
+            pending = len(self._buffer) - self._pos
+            if pending > MAX_RECORD_CHARS:
+                raise StoreImportError(f"Record near byte {self.bytes_read} exceeds {MAX_RECORD_CHARS} characters")
+            # Growing geometrically keeps re-decoding a large record linear overall.
+            if not self._fill(max(self._read_size, pending)):
+                raise StoreImportError(f"Invalid JSON near byte {self.bytes_read}: {error}") from error
+
+    def __iter__(self) -> Iterator[Tuple[str, Any]]:
+        self._expect("{")
+        if self._peek() == "}":
+            self._pos += 1
+        else:
+            while True:
+                key = self._value()
+                if not isinstance(key, str):
+                    raise StoreImportError(f"Expected an object key near byte {self.bytes_read}")
+                self._expect(":")
+                if key in SECTIONS and self._peek() == "[":
+                    self._pos += 1
+                    if self._peek() == "]":
+                        self._pos += 1
+                    else:
+                        while True:
+                            yield key, self._value()
+                            if self._expect(",]") == "]":
+                                break
+                else:
+                    value = self._value()
+                    if key == "lastCalculationId":
+                        self.last_calculation_id = value
+                if self._expect(",}") == "}":
+                    break
+        if self._peek():
+            raise StoreImportError(f"Unexpected data after the store object near byte {self.bytes_read}")
+
+
+def _utc_naive(value: Optional[datetime]) -> datetime:
+    if value is None:
+        return datetime.utcnow()
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _calculation_row(record: StoreCalculationRecord) -> Dict[str, Any]:
+    parameters = record.parameters
+    return {
+        "id": record.id,
+        "created_at": _utc_naive(record.created_at),
+        "parameters": parameters.model_dump(mode="json"),
+        "results": record.results,
+        "order_reference": record.order_reference or parameters.order_reference,
+        "preset_name": record.preset_name,
+        "mp_fee_applied": record.mp_fee_applied,
+        "mp_fee_details": to_serializable(record.mp_fee_details) if record.mp_fee_details else None,
+        "revision": 1,
+    }
+
+
+def _notification_row(record: StoreNotificationRecord) -> Dict[str, Any]:
+    return {**record.model_dump(), "received_at": _utc_naive(record.received_at)}
+
+
+class _Importer:
+    """Chunked validation and deduplicating inserts, with running counters."""
+
+    def __init__(self, chunk_size: int, progress: Optional[Progress]) -> None:
+        self.chunk_size = chunk_size
+        self.progress = progress
+        self.stats: Dict[str, Any] = {
+            "records": 0,
+            "calculations_inserted": 0,
+            "calculations_renumbered": 0,
+            "calculations_duplicates": 0,
+            "notifications_inserted": 0,
+            "notifications_duplicates": 0,
+            "rejected": 0,
+        }
+        self._errors: List[Dict[str, Any]] = []
+        self._calculations: List[Dict[str, Any]] = []
+        self._notifications: List[Dict[str, Any]] = []
+        self._positions = {section: 0 for section in SECTIONS}
+        self.pending = 0
+        self._notification_insert = insert_ignore_statement(PaymentNotification.__table__, ["payment_id"])
+
+    def add(self, section: str, element: Any) -> None:
+        index = self._positions[section]
+        self._positions[section] = index + 1
+        self.pending += 1
+        try:
+            if section == "calculations":
+                self._calculations.append(_calculation_row(StoreCalculationRecord.model_validate(element)))
+            else:
+                self._notifications.append(_notification_row(StoreNotificationRecord.model_validate(element)))
+        except (ValidationError, ValueError) as exc:
+            self.stats["rejected"] += 1
+            if self.stats["rejected"] <= MAX_REPORTED_ERRORS:
+                identifier = element.get("id", element.get("payment_id")) if isinstance(element, dict) else None
+                self._errors.append({"section": section, "index": index, "id": identifier, "error": str(exc)})
+
+    def skip(self, section: str) -> None:
+        self._positions[section] += 1
+
+    def flush(self, reader: StoreReader) -> None:
+        """Write the pending chunk in one transaction, then report progress."""
+
+        with get_session() as session:
+            connection = session.connection()
+            if self._calculations:
+                self._insert_calculations(connection, self._calculations)
+            if self._notifications:
+                self._insert_notifications(connection, self._notifications)
+            session.commit()
+        self.stats["records"] = sum(self._positions.values())
+        self.stats["bytes_read"] = reader.bytes_read
+        errors, self._errors = self._errors, []
+        self._calculations, self._notifications = [], []
+        self.pending = 0
+        if self.progress is not None:
+            self.progress(dict(self.stats), errors)
+
+    def _insert_notifications(self, connection: Any, rows: List[Dict[str, Any]]) -> None:
+        """Insert notifications whose ``payment_id`` is new, live or archived; the first occurrence wins."""
+
+        column = PaymentNotification.__table__.c.payment_id
+        payment_ids = {row["payment_id"] for row in rows}
+        seen = set(connection.execute(select(column).where(column.in_(payment_ids))).scalars())
+        archived = ArchivedRecord.__table__
+        seen.update(
+            connection.execute(
+                select(archived.c.payment_id).where(
+                    archived.c.table_name == PAYMENT_NOTIFICATIONS, archived.c.payment_id.in_(payment_ids)
+                )
+            ).scalars()
+        )
+        fresh = []
+        for row in rows:
+            if row["payment_id"] not in seen:
+                seen.add(row["payment_id"])
+                fresh.append(row)
+        if fresh:
+            # A webhook may store the same payment meanwhile; the conflict clause skips it.
+            connection.execute(self._notification_insert, fresh)
+        self.stats["notifications_inserted"] += len(fresh)
+        self.stats["notifications_duplicates"] += len(rows) - len(fresh)
+
+    def _insert_calculations(self, connection: Any, rows: List[Dict[str, Any]]) -> None:
+        """Insert keeping the Node ids where possible.
+
+        A row is a duplicate when its id already holds a calculation with the
+        same ``order_reference`` and ``created_at`` (a re-run), or when the same
+        ``order_reference`` was already stored with the same ``created_at`` (a
+        re-run after the row had to be renumbered). Archived calculations count
+        as stored. An id taken by a different calculation, live or archived, is
+        renumbered by the database.
+        """
+
+        table = Calculation.__table__
+        ids = {row["id"] for row in rows if row["id"] is not None}
+        references = {row["order_reference"] for row in rows if row["order_reference"]}
+        taken: Dict[int, Tuple[Optional[str], datetime]] = {}
+        if ids:
+            statement = select(table.c.id, table.c.order_reference, table.c.created_at).where(table.c.id.in_(ids))
+            taken = {found[0]: (found[1], found[2]) for found in connection.execute(statement)}
+        stored: Set[Tuple[str, datetime]] = set()
+        if references:
+            statement = select(table.c.order_reference, table.c.created_at).where(
+                table.c.order_reference.in_(references)
+            )
+            stored = {tuple(found) for found in connection.execute(statement)}
+        for archived in find_archived_calculations(ids, references):
+            created_at = datetime.fromisoformat(archived["created_at"])
+            if archived["id"] in ids:
+                taken[archived["id"]] = (archived["order_reference"], created_at)
+            if archived["order_reference"] in references:
+                stored.add((archived["order_reference"], created_at))
+
+        keep_id: List[Dict[str, Any]] = []
+        renumber: List[Dict[str, Any]] = []
+        for row in rows:
+            reference = row["order_reference"]
+            if reference and (reference, row["created_at"]) in stored:
+                self.stats["calculations_duplicates"] += 1
+                continue
+            identifier = row["id"]
+            if identifier is not None and identifier in taken:
+                if taken[identifier] == (reference, row["created_at"]):
+                    self.stats["calculations_duplicates"] += 1
+                    continue
+                renumber.append({key: value for key, value in row.items() if key != "id"})
+            elif identifier is not None:
+                taken[identifier] = (reference, row["created_at"])
+                keep_id.append(row)
+            else:
+                renumber.append({key: value for key, value in row.items() if key != "id"})
+            if reference:
+                stored.add((reference, row["created_at"]))
+        if keep_id:
+            connection.execute(insert(table), keep_id)
+        if renumber:
+            connection.execute(insert(table), renumber)
+        self.stats["calculations_inserted"] += len(keep_id) + len(renumber)
+        self.stats["calculations_renumbered"] += len(renumber)
+
+
+def _sync_id_sequence() -> None:
+    """Explicit ids bypass PostgreSQL's sequence; move it past them. SQLite needs nothing."""
+
+    if engine.dialect.name != "postgresql":
+        return
+    with engine.begin() as connection:
+        connection.execute(
+            text(
+                "SELECT setval(pg_get_serial_sequence('calculations', 'id'), "
+                "COALESCE((SELECT MAX(id) FROM calculations), 0) + 1, false)"
+            )
+        )
+
+
+def import_store(
+    stream: BinaryIO,
+    *,
+    chunk_size: int = 500,
+    skip_records: int = 0,
+    progress: Optional[Progress] = None,
+) -> Dict[str, Any]:
+    """Stream a Node store document into ``calculations`` and ``payment_notifications``.
+
+    Every ``chunk_size`` records are validated and committed together and
+    ``progress(stats, rejected_rows)`` is called. The first ``skip_records``
+    records are parsed but not written, which is how a resumed job continues
+    after its last committed chunk. Invalid rows are counted and reported,
+    never fatal; a malformed document raises :class:`StoreImportError`.
+    """
+
+    reader = StoreReader(stream)
+    importer = _Importer(chunk_size, progress)
+    position = 0
+    for section, element in reader:
+        position += 1
+        if position <= skip_records:
+            importer.skip(section)
+            continue
+        importer.add(section, element)
+        if importer.pending >= chunk_size:
+            importer.flush(reader)
+    importer.flush(reader)
+    _sync_id_sequence()
+
+    summary = dict(importer.stats, last_calculation_id=to_serializable(reader.last_calculation_id))
+    LOGGER.info("Node store imported", extra=summary)
+    return summary
+
+
+def _file_size(stream: BinaryIO) -> Optional[int]:
+    try:
+        return os.fstat(stream.fileno()).st_size
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+def spool_upload(source: BinaryIO) -> Path:
+    """Copy an uploaded store file into ``store_import_dir``, where its import job reads it."""
+
+    directory = Path(get_settings().store_import_dir)
+    directory.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile("wb", dir=directory, prefix="store-", suffix=".json", delete=False) as target:
+        shutil.copyfileobj(source, target, READ_SIZE)
+    return Path(target.name)
+
+
+@job_handler("store_import", StoreImportJobPayload)
+def import_store_job(context: JobContext, payload: StoreImportJobPayload) -> Dict[str, Any]:
+    """Background import of a store file; progress is measured in bytes and rejected rows become job items.
+
+    The checkpoint records how many records are committed, so a restarted
+    worker skips them; a chunk committed just before a crash is deduplicated.
+    """
+
+    path = Path(payload.path)
+    checkpoint = context.checkpoint or {}
+    with path.open("rb") as stream:
+        total = _file_size(stream)
+
+        def report(stats: Dict[str, Any], errors: List[Dict[str, Any]]) -> None:
+            context.report(stats["bytes_read"], total, errors, checkpoint={"records": stats["records"]})
+
+        summary = import_store(
+            stream,
+            chunk_size=payload.chunk_size,
+            skip_records=checkpoint.get("records", 0),
+            progress=report,
+        )
+    if payload.remove_when_done:
+        path.unlink(missing_ok=True)
+    return summary
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Import the Node import-calculator-store.json into the database")
+    parser.add_argument("path", type=Path)
+    parser.add_argument("--chunk-size", type=int, default=500)
+    args = parser.parse_args(argv)
+
+    init_db()
+    with args.path.open("rb") as stream:
+        total = _file_size(stream)
+
+        def report(stats: Dict[str, Any], errors: List[Dict[str, Any]]) -> None:
+            for error in errors:
+                print(f"rejected {error['section']}[{error['index']}]: {error['error']}", file=sys.stderr)
+            share = f" ({stats['bytes_read'] * 100 // total}%)" if total else ""
+            print(
+                f"{stats['bytes_read']} bytes{share}, {stats['records']} records, "
+                f"{stats['calculations_inserted']} calculations and "
+                f"{stats['notifications_inserted']} notifications inserted, {stats['rejected']} rejected",
+                file=sys.stderr,
+            )
+
+        summary = import_store(stream, chunk_size=args.chunk_size, progress=report)
+    print(dumps_json(summary))
+
+
+if __name__ == "__main__":
+    main()
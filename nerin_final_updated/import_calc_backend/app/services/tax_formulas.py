@@ -0,0 +1,358 @@
+"""Safe expression language for user-defined additional taxes.
+
+A formula is a single Python-syntax expression over named values, for
+example ``min(CIF_USD * 0.035, 250 / tc_aduana * 1000)`` or
+``Subtotal_USD * (0.02 if CIF_USD > 5000 else 0.015)``. Only arithmetic
+(``+ - * /``), conditional expressions, numeric literals, names and the
+functions in ``FUNCTIONS`` are accepted, plus comparisons and
+``and``/``or``/``not`` as the test of a conditional expression; anything
+else (attributes, subscripts, ``**``, lambdas, a bare comparison...) is
+rejected before it runs.
+
+Each distinct text is parsed once and compiled into a tree of closures,
+kept in an LRU cache, so evaluating a formula never touches the parser.
+The same closures run over ``Decimal`` values in the calculator and over
+numpy arrays in the Monte Carlo batch: every operation that differs goes
+through an :class:`Arithmetic`.
+"""
+
+from __future__ import annotations
+
+import ast
+import operator
+import re
+from dataclasses import dataclass
+from decimal import Decimal
+from functools import lru_cache
+from typing import Any, Callable, Dict, FrozenSet, List, Mapping, Sequence, Tuple
+
+import numpy as np
+
+MAX_FORMULA_LENGTH = 500
+_MAX_NODES = 200
+
+# Values every formula can read; other taxes are read by their identifier.
+BASE_NAMES = frozenset({"CIF_USD", "DI_USD", "Tasa_Estadistica_USD", "Subtotal_USD", "tc_aduana"})
+
+_IDENTIFIER = re.compile(r"\W+")
+
+
+class FormulaError(ValueError):
+    """A tax formula is malformed, uses something outside the language or forms a cycle."""
+
+
+def tax_identifier(name: str) -> str:
+    """Name under which a tax's USD amount is visible to formulas: ``Ingresos Brutos`` → ``Ingresos_Brutos``."""
+
+    return _IDENTIFIER.sub("_", name.strip()).strip("_")
+
+
+class Arithmetic:
+    """The operations whose meaning depends on the value type."""
+
+    def number(self, text: str) -> Any:
+        raise NotImplementedError
+
+    def select(self, condition: Any, when_true: Callable[[], Any], when_false: Callable[[], Any]) -> Any:
+        raise NotImplementedError
+
+    def both(self, left: Any, right: Callable[[], Any]) -> Any:
+        raise NotImplementedError
+
+    def either(self, left: Any, right: Callable[[], Any]) -> Any:
+        raise NotImplementedError
+
+    def negate(self, value: Any) -> Any:
+        raise NotImplementedError
+
+    def call(self, name: str, args: List[Any]) -> Any:
+        raise NotImplementedError
+
+
+class DecimalArithmetic(Arithmetic):
+    """Exact evaluation with ``Decimal``; branches and ``and``/``or`` short-circuit."""
+
+    def number(self, text: str) -> Decimal:
+        return Decimal(text)
+
+    def select(self, condition: Any, when_true: Callable[[], Any], when_false: Callable[[], Any]) -> Any:
+        return when_true() if condition else when_false()
+
+    def both(self, left: Any, right: Callable[[], Any]) -> Any:
+        return bool(left) and bool(right())
+
+    def either(self, left: Any, right: Callable[[], Any]) -> Any:
+        return bool(left) or bool(right())
+
+    def negate(self, value: Any) -> bool:
+        return not value
+
+    def call(self, name: str, args: List[Any]) -> Any:
+        if name == "min":
+            return min(args)
+        if name == "max":
+            return max(args)
+        if name == "abs":
+            return abs(args[0])
+        return args[0].quantize(Decimal(1).scaleb(-int(args[1])))
+
+
+class ArrayArithmetic(Arithmetic):
+    """Element-wise float64 evaluation over numpy arrays; both branches are computed."""
+
+    def number(self, text: str) -> float:
+        return float(text)
+
+    def select(self, condition: Any, when_true: Callable[[], Any], when_false: Callable[[], Any]) -> Any:
+        return np.where(condition, when_true(), when_false())
+
+    def both(self, left: Any, right: Callable[[], Any]) -> Any:
+        return np.logical_and(left, right())
+
+    def either(self, left: Any, right: Callable[[], Any]) -> Any:
+        return np.logical_or(left, right())
+
+    def negate(self, value: Any) -> Any:
+        return np.logical_not(value)
+
+    def call(self, name: str, args: List[Any]) -> Any:
+        if name == "min":
+            return np.minimum.reduce(np.broadcast_arrays(*args))
+        if name == "max":
+            return np.maximum.reduce(np.broadcast_arrays(*args))
+        if name == "abs":
+            return np.abs(args[0])
+        return np.round(args[0], int(args[1]))
+
+
+DECIMAL = DecimalArithmetic()
+ARRAYS = ArrayArithmetic()
+
+# name -> (minimum, maximum) number of arguments
+FUNCTIONS: Dict[str, Tuple[int, int]] = {"min": (2, 16), "max": (2, 16), "abs": (1, 1), "round": (2, 2)}
+
+_BINARY = {ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul, ast.Div: operator.truediv}
+_COMPARE = {
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+}
+
+Evaluator = Callable[[Mapping[str, Any], Arithmetic], Any]
+
+
+@dataclass(frozen=True)
+class CompiledFormula:
+    text: str
+    names: FrozenSet[str]
+    evaluate: Evaluator
+
+
+def _is_condition(node: ast.AST) -> bool:
+    # These yield booleans, which only make sense as the test of ``a if ... else b``.
+    return isinstance(node, (ast.Compare, ast.BoolOp)) or (
+        isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not)
+    )
+
+
+class _Compiler:
+    def __init__(self, text: str) -> None:
+        self.text = text
+        self.names: set = set()
+
+    def fail(self, node: ast.AST, message: str) -> FormulaError:
+        return FormulaError(f"{message} at column {getattr(node, 'col_offset', 0) + 1} of '{self.text}'")
+
+    def compile(self, node: ast.AST) -> Evaluator:
+        """Compile ``node`` where an amount is expected."""
+
+        if _is_condition(node):
+            raise self.fail(node, "A comparison or and/or/not is not an amount; use it as 'a if condition else b'")
+        if isinstance(node, ast.Constant):
+            if isinstance(node.value, bool) or not isinstance(node.value, (int, float)):
+                raise self.fail(node, "Only numeric literals are allowed")
+            # The source text, not the float the parser produced, so 0.1 stays exact.
+            literal = ast.get_source_segment(self.text, node)
+            return lambda values, arithmetic: arithmetic.number(literal)
+        if isinstance(node, ast.Name):
+            name = node.id
+            self.names.add(name)
+            return lambda values, arithmetic: values[name]
+        if isinstance(node, ast.BinOp) and type(node.op) in _BINARY:
+            function = _BINARY[type(node.op)]
+            left, right = self.compile(node.left), self.compile(node.right)
+            return lambda values, arithmetic: function(left(values, arithmetic), right(values, arithmetic))
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+            operand = self.compile(node.operand)
+            if isinstance(node.op, ast.USub):
+                return lambda values, arithmetic: -operand(values, arithmetic)
+            return operand
+        if isinstance(node, ast.IfExp):
+            test, body, orelse = self.condition(node.test), self.compile(node.body), self.compile(node.orelse)
+            return lambda values, arithmetic: arithmetic.select(
+                test(values, arithmetic), lambda: body(values, arithmetic), lambda: orelse(values, arithmetic)
+            )
+        if isinstance(node, ast.Call):
+            return self._call(node)
+        raise self.fail(node, f"'{type(node).__name__}' is not allowed in a tax formula")
+
+    def condition(self, node: ast.AST) -> Evaluator:
+        """Compile the test of a conditional expression or an operand of ``and``/``or``/``not``."""
+
+        if isinstance(node, ast.Compare):
+            return self._compare(node)
+        if isinstance(node, ast.BoolOp):
+            return self._boolean(node)
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+            operand = self.condition(node.operand)
+            return lambda values, arithmetic: arithmetic.negate(operand(values, arithmetic))
+        return self.compile(node)
+
+    def _compare(self, node: ast.Compare) -> Evaluator:
+        if any(type(op) not in _COMPARE for op in node.ops):
+            raise self.fail(node, "Only < <= > >= == != comparisons are allowed")
+        functions = [_COMPARE[type(op)] for op in node.ops]
+        operands = [self.compile(node.left)] + [self.compile(item) for item in node.comparators]
+
+        def compare(values: Mapping[str, Any], arithmetic: Arithmetic) -> Any:
+            left = operands[0](values, arithmetic)
+            result = None
+            for function, operand in zip(functions, operands[1:]):
+                right = operand(values, arithmetic)
+                outcome = function(left, right)
+                result = outcome if result is None else arithmetic.both(result, lambda outcome=outcome: outcome)
+                left = right
+            return result
+
+        return compare
+
+    def _boolean(self, node: ast.BoolOp) -> Evaluator:
+        operands = [self.condition(item) for item in node.values]
+        combine = "both" if isinstance(node.op, ast.And) else "either"
+
+        def boolean(values: Mapping[str, Any], arithmetic: Arithmetic) -> Any:
+            function = getattr(arithmetic, combine)
+            result = operands[0](values, arithmetic)
+            for operand in operands[1:]:
+                result = function(result, lambda operand=operand: operand(values, arithmetic))
+            return result
+
+        return boolean
+
+    def _call(self, node: ast.Call) -> Evaluator:
+        name = node.func.id if isinstance(node.func, ast.Name) else None
+        if name not in FUNCTIONS or node.keywords:
+            raise self.fail(node, f"Unknown function; use {', '.join(sorted(FUNCTIONS))}")
+        low, high = FUNCTIONS[name]
+        if not low <= len(node.args) <= high:
+            expected = f"{low} to {high}" if low != high else str(low)
+            raise self.fail(node, f"{name}() takes {expected} arguments")
+        if name == "round" and not (
+            isinstance(node.args[1], ast.Constant) and type(node.args[1].value) is int and 0 <= node.args[1].value <= 6
+        ):
+            raise self.fail(node, "round() needs a literal number of places between 0 and 6")
+        args = [self.compile(item) for item in node.args]
+        return lambda values, arithmetic: arithmetic.call(name, [arg(values, arithmetic) for arg in args])
+
+
+@lru_cache(maxsize=1024)
+def compile_formula(text: str) -> CompiledFormula:
+    """Parse and compile ``text`` once; later calls with the same text return the cached closures."""
+
+    if len(text) > MAX_FORMULA_LENGTH:
+        raise FormulaError(f"Tax formulas are limited to {MAX_FORMULA_LENGTH} characters")
+    try:
+        tree = ast.parse(text.strip(), mode="eval")
+    except SyntaxError as exc:
+        raise FormulaError(f"Invalid tax formula '{text}': {exc.msg}") from exc
+    if sum(1 for _ in ast.walk(tree)) > _MAX_NODES:
+        raise FormulaError(f"Tax formula '{text}' is too complex")
+    compiler = _Compiler(text.strip())
+    evaluate = compiler.compile(tree.body)
+    return CompiledFormula(text, frozenset(compiler.names), evaluate)
+
+
+@lru_cache(maxsize=256)
+def evaluation_order(formulas: Tuple[Tuple[str, str], ...], known: FrozenSet[str]) -> Tuple[int, ...]:
+    """Indices of ``formulas`` (``(identifier, text)`` pairs) so each runs after the formulas it reads.
+
+    ``known`` are the other names available. Raises :class:`FormulaError` for
+    an unknown name or a cycle, naming the taxes on it.
+    """
+
+    index = {identifier: position for position, (identifier, _) in enumerate(formulas)}
+    dependencies: List[List[int]] = []
+    for identifier, text in formulas:
+        compiled = compile_formula(text)
+        unknown = sorted(compiled.names - known - set(index))
+        if unknown:
+            raise FormulaError(f"Tax formula for '{identifier}' uses unknown name(s): {', '.join(unknown)}")
+        dependencies.append(sorted(index[name] for name in compiled.names if name in index))
+
+    order: List[int] = []
+    state: Dict[int, int] = {}
+
+    def visit(position: int, path: Tuple[int, ...]) -> None:
+        if state.get(position) == 2:
+            return
+        if state.get(position) == 1:
+            cycle = path[path.index(position):] + (position,)
+            raise FormulaError(f"Tax formula cycle: {' -> '.join(formulas[item][0] for item in cycle)}")
+        state[position] = 1
+        for dependency in dependencies[position]:
+            visit(dependency, path + (position,))
+        state[position] = 2
+        order.append(position)
+
+    for position in range(len(formulas)):
+        visit(position, ())
+    return tuple(order)
+
+
+def formula_taxes(taxes: Sequence[Any]) -> Tuple[Tuple[str, str], ...]:
+    """``(identifier, formula)`` of every ``base="formula"`` tax, in declaration order."""
+
+    return tuple((tax_identifier(tax.name), tax.formula) for tax in taxes if tax.base == "formula")
+
+
+def check_tax_formulas(taxes: Sequence[Any]) -> None:
+    """Reject duplicate or reserved tax identifiers, unknown names and cycles before anything runs."""
+
+    formulas = formula_taxes(taxes)
+    if not formulas:
+        return
+    identifiers = [tax_identifier(tax.name) for tax in taxes]
+    for identifier in identifiers:
+        if not identifier or identifier in BASE_NAMES or identifier in FUNCTIONS:
+            raise FormulaError(f"Tax name '{identifier}' cannot be used when taxes have formulas")
+        if identifiers.count(identifier) > 1:
+            raise FormulaError(f"Tax names must be unique when taxes have formulas; '{identifier}' repeats")
+    evaluation_order(formulas, BASE_NAMES | frozenset(identifiers))
+
+
+def evaluate_formulas(
+    formulas: Sequence[Tuple[str, str]],
+    values: Dict[str, Any],
+    arithmetic: Arithmetic = DECIMAL,
+    finish: Callable[[str, Any], Any] = lambda identifier, value: value,
+) -> List[Any]:
+    """Evaluate every formula in dependency order and return the results in the order of ``formulas``.
+
+    ``finish`` turns each raw result into the tax amount (rounding, checks);
+    that amount is what later formulas read under the tax's identifier.
+    """
+
+    formulas = tuple(formulas)
+    results: List[Any] = [None] * len(formulas)
+    for position in evaluation_order(formulas, frozenset(values) - {identifier for identifier, _ in formulas}):
+        identifier, text = formulas[position]
+        try:
+            # ``finish`` rounds, which fails for results beyond the Decimal precision.
+            result = finish(identifier, compile_formula(text).evaluate(values, arithmetic))
+        except ArithmeticError as exc:
+            raise FormulaError(f"Tax formula for '{identifier}' failed: {exc.__class__.__name__}") from exc
+        values[identifier] = results[position] = result
+    return results
@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import logging
+from decimal import Decimal
+from typing import Any, Dict, List, Tuple
+
+from ..schemas import CalculationParameters, CostBreakdownInput, MoneyInput, TierPricingInput
+from ..utils.decimal_utils import quantize
+from .calculator import compute_landed_cost, compute_pricing
+
+LOGGER = logging.getLogger(__name__)
+
+_ZERO = Decimal("0")
+
+
+def _split_parameters(
+    params: CalculationParameters, per_shipment: List[str]
+) -> Tuple[CalculationParameters, CalculationParameters]:
+    """Split ``params`` into the costs of one unit and the costs paid once per shipment.
+
+    Rate-based additional taxes stay in both halves because they scale with the
+    CIF they are applied to; fixed ARS taxes follow ``additional_taxes_ars``.
+    """
+
+    def part(money: MoneyInput, keep: bool) -> MoneyInput:
+        return money if keep else MoneyInput(amount=_ZERO, currency=money.currency)
+
+    def split(unit: bool) -> CalculationParameters:
+        def keep(component: str) -> bool:
+            return (component in per_shipment) is not unit
+
+        costs = params.costs
+        return params.model_copy(
+            update={
+                "costs": CostBreakdownInput(
+                    fob=part(costs.fob, unit),
+                    freight=part(costs.freight, keep("freight")),
+                    insurance=part(costs.insurance, keep("insurance")),
+                ),
+                "gastos_locales_ars": params.gastos_locales_ars if keep("gastos_locales_ars") else _ZERO,
+                "additional_taxes": [
+                    tax for tax in params.additional_taxes if tax.base != "ARS" or keep("additional_taxes_ars")
+                ],
+            }
+        )
+
+    return split(unit=True), split(unit=False)
+
+
+def calculate_price_tiers(params: CalculationParameters, tiers: TierPricingInput) -> Dict[str, Any]:
+    """Price every quantity breakpoint from a single run of the tax chain.
+
+    Duties, VAT and perceptions are linear in the costs they apply to, so the
+    chain is evaluated once for one unit and once for the per-shipment costs.
+    Each tier then only amortizes the shipment part over its quantity and solves
+    the price, instead of recalculating the whole chain per tier. ``quantity``
+    in ``params`` is ignored; per-unit amounts are taken as the cost of one unit
+    and per-shipment amounts as the cost of the whole shipment.
+    """
+
+    if any(tax.base == "formula" for tax in params.additional_taxes):
+        # A formula may cap or tier its amount, so the unit/shipment split would not add up.
+        raise ValueError("Price tiers do not support formula taxes; price each quantity with /api/calculations")
+    unit_params, shipment_params = _split_parameters(params, tiers.per_shipment)
+    unit_landed = compute_landed_cost(unit_params)
+    shipment_landed = compute_landed_cost(shipment_params)
+
+    salida_shipment = params.costos_salida_ars if "costos_salida_ars" in tiers.per_shipment else _ZERO
+    salida_unit = params.costos_salida_ars - salida_shipment
+
+    rows: List[Dict[str, Any]] = []
+    for quantity in tiers.quantities:
+        costo_puesto = quantize(unit_landed.costo_puesto_ars + shipment_landed.costo_puesto_ars / quantity)
+        costos_salida = quantize(salida_unit + salida_shipment / quantity)
+        pricing = compute_pricing(params, costo_puesto, costos_salida)
+        rows.append(
+            {
+                "quantity": quantity,
+                "costo_puesto_unitario": costo_puesto,
+                "costos_salida_unitario": costos_salida,
+                "precio_neto_unitario": pricing.precio_neto_ars,
+                "precio_final_unitario": pricing.precio_final_ars,
+                "mp_fee_unitario": pricing.mp_fee_total,
+                "utilidad_unitaria": pricing.utilidad,
+                "margen": pricing.margen,
+                "totals": {
+                    "costo_puesto_total": quantize(costo_puesto * quantity),
+                    "precio_neto_total": quantize(pricing.precio_neto_ars * quantity),
+                    "precio_final_total": quantize(pricing.precio_final_ars * quantity),
+                    "utilidad_total": quantize(pricing.utilidad * quantity),
+                },
+            }
+        )
+
+    LOGGER.info("Price tiers calculated", extra={"tiers": len(rows), "order_reference": params.order_reference})
+    return {
+        "per_shipment": tiers.per_shipment,
+        "landed": {
+            "per_unit": {"costo_puesto_ars": unit_landed.costo_puesto_ars, "breakdown": unit_landed.breakdown},
+            "per_shipment": {
+                "costo_puesto_ars": shipment_landed.costo_puesto_ars,
+                "breakdown": shipment_landed.breakdown,
+            },
+        },
+        "tiers": rows,
+    }
@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+import gzip
+import json
+import os
+import threading
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+_SEGMENT_GLOB = "segment-*.ndjson.gz"
+
+
+class ArchiveSegmentStore:
+    """Append-only, gzip-compressed NDJSON segments, one directory per table.
+
+    Every ``append`` writes one complete gzip member at the end of the current
+    segment and returns its ``(segment, offset, length)``, so a single record is
+    found by decompressing only the member that holds it. Concatenated members
+    are still a valid gzip stream: ``zcat segment-000001.ndjson.gz`` prints the
+    whole segment. Segments rotate once they reach ``max_segment_bytes`` and are
+    never rewritten.
+    """
+
+    def __init__(self, directory: Path, max_segment_bytes: int) -> None:
+        self.directory = directory
+        self.max_segment_bytes = max_segment_bytes
+        self._lock = threading.Lock()
+        # Members are immutable once written, so decoded ones can be cached safely.
+        self._read_member = lru_cache(maxsize=32)(self._load_member)
+
+    def append(self, table: str, records: List[Dict[str, Any]], encode) -> Tuple[str, int, int]:
+        lines = "".join(encode(record) + "\n" for record in records)
+        member = gzip.compress(lines.encode("utf-8"), mtime=0)
+        with self._lock:
+            path = self._current_segment(table)
+            with path.open("ab") as handle:
+                offset = handle.seek(0, os.SEEK_END)
+                handle.write(member)
+                handle.flush()
+                os.fsync(handle.fileno())
+        return f"{table}/{path.name}", offset, len(member)
+
+    def read(self, segment: str, offset: int, length: int) -> Tuple[Dict[str, Any], ...]:
+        return self._read_member(segment, offset, length)
+
+    def _load_member(self, segment: str, offset: int, length: int) -> Tuple[Dict[str, Any], ...]:
+        with (self.directory / segment).open("rb") as handle:
+            handle.seek(offset)
+            data = handle.read(length)
+        return tuple(json.loads(line) for line in gzip.decompress(data).splitlines() if line)
+
+    def _current_segment(self, table: str) -> Path:
+        directory = self.directory / table
+        directory.mkdir(parents=True, exist_ok=True)
+        segments = sorted(directory.glob(_SEGMENT_GLOB))
+        if segments and segments[-1].stat().st_size < self.max_segment_bytes:
+            return segments[-1]
+        number = int(segments[-1].name.split("-")[1].split(".")[0]) + 1 if segments else 1
+        return directory / f"segment-{number:06d}.ndjson.gz"
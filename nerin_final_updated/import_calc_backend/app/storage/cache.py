@@ -0,0 +1,263 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple, Union
+
+from ..config import get_settings
+from ..utils.serialization import dumps_json
+
+LOGGER = logging.getLogger(__name__)
+
+# Evicting runs at most once per this share of the budget written by a process.
+_EVICT_EVERY_FRACTION = 16
+
+
+class CacheBackend:
+    """Byte-valued cache split into namespaces, each with a generation counter.
+
+    :meth:`invalidate` bumps a namespace's generation, which retires every
+    entry written under an older one in a single write. Entries remember the
+    generation they were computed at, so a value computed before an
+    invalidation is never served after it: read :meth:`generation` before
+    computing and pass it to :meth:`set`.
+    """
+
+    name = "abstract"
+
+    def __init__(self) -> None:
+        self._counters_lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, namespace: str, key: str) -> Optional[bytes]:
+        value = self._get(namespace, key)
+        with self._counters_lock:
+            if value is None:
+                self._misses += 1
+            else:
+                self._hits += 1
+        return value
+
+    def set(self, namespace: str, key: str, value: bytes, generation: Optional[int] = None) -> None:
+        self._set(namespace, key, bytes(value), self.generation(namespace) if generation is None else generation)
+
+    def get_json(self, namespace: str, key: str) -> Any:
+        """Stored JSON value (Decimals come back as strings), or ``None``."""
+
+        blob = self.get(namespace, key)
+        return None if blob is None else json.loads(blob)
+
+    def set_json(self, namespace: str, key: str, value: Any, generation: Optional[int] = None) -> None:
+        # Plain JSON rather than the storage codec: hits must be cheaper than recomputing.
+        self.set(namespace, key, dumps_json(value).encode("utf-8"), generation)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._counters_lock:
+            return {"backend": self.name, "hits": self._hits, "misses": self._misses, **self._usage()}
+
+    def _get(self, namespace: str, key: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    def _set(self, namespace: str, key: str, value: bytes, generation: int) -> None:
+        raise NotImplementedError
+
+    def delete(self, namespace: str, key: str) -> None:
+        raise NotImplementedError
+
+    def generation(self, namespace: str) -> int:
+        raise NotImplementedError
+
+    def invalidate(self, namespace: str) -> int:
+        """Retire every entry of ``namespace``; returns the new generation."""
+
+        raise NotImplementedError
+
+    def _usage(self) -> Dict[str, int]:
+        raise NotImplementedError
+
+
+class MemoryCache(CacheBackend):
+    """Process-local LRU bounded by total value size; for a single worker and for tests."""
+
+    name = "memory"
+
+    def __init__(self, max_bytes: int) -> None:
+        super().__init__()
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[int, bytes]]" = OrderedDict()
+        self._generations: Dict[str, int] = {}
+        self._bytes = 0
+
+    def _get(self, namespace: str, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get((namespace, key))
+            if entry is None or entry[0] != self._generations.get(namespace, 0):
+                return None
+            self._entries.move_to_end((namespace, key))
+            return entry[1]
+
+    def _set(self, namespace: str, key: str, value: bytes, generation: int) -> None:
+        with self._lock:
+            previous = self._entries.pop((namespace, key), None)
+            if previous is not None:
+                self._bytes -= len(previous[1])
+            self._entries[(namespace, key)] = (generation, value)
+            self._bytes += len(value)
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def delete(self, namespace: str, key: str) -> None:
+        with self._lock:
+            previous = self._entries.pop((namespace, key), None)
+            if previous is not None:
+                self._bytes -= len(previous[1])
+
+    def generation(self, namespace: str) -> int:
+        return self._generations.get(namespace, 0)
+
+    def invalidate(self, namespace: str) -> int:
+        with self._lock:
+            generation = self._generations[namespace] = self._generations.get(namespace, 0) + 1
+        return generation
+
+    def _usage(self) -> Dict[str, int]:
+        return {"entries": len(self._entries), "bytes": self._bytes}
+
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS cache_generations (namespace TEXT PRIMARY KEY, generation INTEGER NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS cache_entries ("
+    " namespace TEXT NOT NULL, key TEXT NOT NULL, generation INTEGER NOT NULL,"
+    " value BLOB NOT NULL, size INTEGER NOT NULL, stored_at REAL NOT NULL,"
+    " PRIMARY KEY (namespace, key))",
+    "CREATE INDEX IF NOT EXISTS ix_cache_entries_stored_at ON cache_entries (stored_at)",
+)
+
+
+class SQLiteCache(CacheBackend):
+    """Cache in a SQLite file shared by every worker process on the host.
+
+    The file runs in WAL mode, so readers never wait for a writer. Every
+    write is a single autocommit statement, which makes it atomic: other
+    processes see either the old entry or the new one. Generations live in
+    their own table, so invalidating a namespace is one ``UPDATE``. Entries
+    of older generations are not served and are the first to be evicted.
+    Eviction drops stale generations, then the oldest entries, until the
+    file is within ``max_bytes``. Each process triggers it after writing
+    about 1/16 of the budget.
+
+    Connections are per thread and per process, so a worker forked after the
+    cache was created opens its own.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: Union[str, Path], max_bytes: int) -> None:
+        super().__init__()
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._written = 0
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        connection = self._connection()
+        for statement in _SCHEMA:
+            connection.execute(statement)
+
+    def _connection(self) -> sqlite3.Connection:
+        local = self._local
+        if getattr(local, "pid", None) != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            local.connection, local.pid = connection, os.getpid()
+        return local.connection
+
+    def _get(self, namespace: str, key: str) -> Optional[bytes]:
+        row = self._connection().execute(
+            "SELECT e.value FROM cache_entries e LEFT JOIN cache_generations g ON g.namespace = e.namespace"
+            " WHERE e.namespace = ? AND e.key = ? AND e.generation = COALESCE(g.generation, 0)",
+            (namespace, key),
+        ).fetchone()
+        return None if row is None else row[0]
+
+    def _set(self, namespace: str, key: str, value: bytes, generation: int) -> None:
+        self._connection().execute(
+            "INSERT INTO cache_entries (namespace, key, generation, value, size, stored_at)"
+            " VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (namespace, key) DO UPDATE SET"
+            " generation = excluded.generation, value = excluded.value,"
+            " size = excluded.size, stored_at = excluded.stored_at",
+            (namespace, key, generation, value, len(value), time.time()),
+        )
+        self._written += len(value)
+        if self._written * _EVICT_EVERY_FRACTION >= self.max_bytes:
+            self._written = 0
+            self.evict()
+
+    def delete(self, namespace: str, key: str) -> None:
+        self._connection().execute("DELETE FROM cache_entries WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def generation(self, namespace: str) -> int:
+        row = self._connection().execute(
+            "SELECT generation FROM cache_generations WHERE namespace = ?", (namespace,)
+        ).fetchone()
+        return 0 if row is None else row[0]
+
+    def invalidate(self, namespace: str) -> int:
+        (generation,) = self._connection().execute(
+            "INSERT INTO cache_generations (namespace, generation) VALUES (?, 1)"
+            " ON CONFLICT (namespace) DO UPDATE SET generation = generation + 1 RETURNING generation",
+            (namespace,),
+        ).fetchone()
+        LOGGER.info("Cache namespace invalidated", extra={"namespace": namespace, "generation": generation})
+        return generation
+
+    def evict(self) -> int:
+        """Bring the cache within ``max_bytes``; returns the number of entries removed."""
+
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            removed = connection.execute(
+                "DELETE FROM cache_entries WHERE generation <> COALESCE("
+                " (SELECT generation FROM cache_generations g WHERE g.namespace = cache_entries.namespace), 0)"
+            ).rowcount
+            (total,) = connection.execute("SELECT COALESCE(SUM(size), 0) FROM cache_entries").fetchone()
+            if total > self.max_bytes:
+                cutoff = connection.execute(
+                    "SELECT stored_at FROM (SELECT stored_at, SUM(size) OVER (ORDER BY stored_at DESC) AS kept"
+                    " FROM cache_entries) WHERE kept > ? ORDER BY stored_at DESC LIMIT 1",
+                    (self.max_bytes,),
+                ).fetchone()
+                if cutoff is not None:
+                    removed += connection.execute(
+                        "DELETE FROM cache_entries WHERE stored_at <= ?", (cutoff[0],)
+                    ).rowcount
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return removed
+
+    def _usage(self) -> Dict[str, int]:
+        entries, size = self._connection().execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache_entries"
+        ).fetchone()
+        return {"entries": entries, "bytes": size}
+
+
+@lru_cache()
+def get_cache() -> CacheBackend:
+    settings = get_settings()
+    if settings.cache_backend == "memory":
+        return MemoryCache(settings.cache_max_bytes)
+    return SQLiteCache(Path(settings.cache_path), settings.cache_max_bytes)
@@ -0,0 +1,337 @@
+from __future__ import annotations
+
+import json
+import struct
+import zlib
+from decimal import Decimal, InvalidOperation
+from typing import Any, Dict, List, Tuple, Union
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy.types import LargeBinary, TypeDecorator
+
+from ..utils.serialization import dumps_json
+
+# Compact storage format for the JSON-shaped columns that grow with every
+# calculation and webhook (``Calculation.parameters``/``results``,
+# ``PaymentNotification.fee_breakdown``/``raw_payload``).
+#
+# A blob is one header byte followed by a tagged body:
+#
+# * header: format version in the low bits, ``_DEFLATED`` when the body is
+#   raw-deflate compressed (only when that actually makes it smaller);
+# * ``dict`` keys and ``str`` values are a varint ``n``: even ``n`` is an index
+#   into ``_SYMBOLS``, odd ``n`` is the byte length of the UTF-8 text after it;
+# * ``Decimal`` values, and strings that are exactly ``str(Decimal(text))``,
+#   are a zigzag varint coefficient plus a zigzag varint exponent.
+#
+# Decoding yields what the JSON columns used to return: Decimals come back as
+# their string form. Legacy JSON text (``str``, or bytes starting with ``{``/``[``)
+# is still accepted, so rows written before the migration read transparently.
+
+_VERSION = 1
+_DEFLATED = 0x80
+_MIN_DEFLATE_BYTES = 64
+
+_NULL, _TRUE, _FALSE, _INT, _FLOAT, _STR, _DECIMAL, _LIST, _DICT = range(9)
+
+# Append-only: a symbol's position is its on-disk tag, so entries are never
+# reordered or removed. Keys missing here are simply stored inline.
+_SYMBOLS: Tuple[str, ...] = (
+    # CalculationParameters
+    "costs", "fob", "freight", "insurance", "amount", "currency",
+    "tc_aduana", "tc_aduana_source", "tc_aduana_source_key", "tc_aduana_date", "tc_aduana_rate_date",
+    "ncm_code", "ncm_position", "di_rate", "apply_tasa_estadistica", "iva_rate", "perc_iva_rate",
+    "perc_ganancias_rate", "additional_taxes", "name", "base", "rate", "amount_ars",
+    "gastos_locales_ars", "costos_salida_ars", "mp_rate", "mp_iva_rate", "target", "margen_objetivo",
+    "precio_neto_input_ars", "quantity", "rounding", "order_reference", "step", "mode",
+    "psychological_prices",
+    # Calculation results
+    "precio_neto_ars", "precio_final_ars", "utilidad_ars", "margen", "costo_puesto_ars", "breakdown",
+    "amount_usd", "totals", "unitary",
+    "CIF_USD", "DI_USD", "Tasa_Estadistica_USD", "Base_IVA_USD", "IVA_USD", "Percepcion_IVA_USD",
+    "Percepcion_Ganancias_ARS", "Gastos_Locales_ARS", "Costos_Salida_ARS", "FOB_USD", "Freight_USD",
+    "Insurance_USD", "CIF_ARS", "DI_ARS", "Tasa_Estadistica_ARS", "IVA_ARS", "Percepcion_IVA_ARS",
+    "Additional_Taxes_ARS", "Comision_MP_ARS", "IVA_Comision_MP_ARS", "MP_Fee_Total_ARS",
+    "Utilidad_ARS", "Margen",
+    "costo_puesto_total", "precio_neto_total", "precio_final_total", "utilidad_total",
+    "costo_puesto_unitario", "precio_neto_unitario", "precio_final_unitario", "utilidad_unitaria",
+    # Frequent values
+    "USD", "ARS", "CIF", "BaseIVA", "precio",
+    # Mercado Pago webhooks and fee details
+    "id", "type", "action", "data", "date_created", "live_mode", "api_version", "user_id",
+    "payment", "payment.created", "payment.updated", "fee_details", "mercadopago_fee", "financing_fee",
+    "fee_payer", "collector", "payer", "application_fee", "shipping_fee", "status", "status_detail",
+    "approved", "transaction_amount", "net_received_amount", "total_paid_amount", "external_reference",
+    # Multi-currency costs
+    "fx_date", "fx_rates",
+    # Formula taxes
+    "formula",
+)
+_SYMBOL_CODES: Dict[str, int] = {symbol: index << 1 for index, symbol in enumerate(_SYMBOLS)}
+
+_DOUBLE = struct.Struct("<d")
+_DECIMAL_START = frozenset("-0123456789")
+
+Blob = Union[bytes, bytearray, memoryview, str]
+
+
+class CodecError(ValueError):
+    """A stored blob is truncated or uses an unknown tag."""
+
+
+def _write_varint(out: bytearray, value: int) -> None:
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _write_signed(out: bytearray, value: int) -> None:
+    _write_varint(out, value << 1 if value >= 0 else ((-value) << 1) - 1)
+
+
+def _write_text(out: bytearray, text: str) -> None:
+    code = _SYMBOL_CODES.get(text)
+    if code is not None:
+        _write_varint(out, code)
+        return
+    data = text.encode("utf-8")
+    _write_varint(out, (len(data) << 1) | 1)
+    out += data
+
+
+def _write_decimal(out: bytearray, value: Decimal) -> bool:
+    sign, digits, exponent = value.as_tuple()
+    # NaN/Infinity and negative zero have no scaled-integer form.
+    if not isinstance(exponent, int) or (sign and not any(digits)):
+        return False
+    coefficient = int("".join(map(str, digits)))
+    out.append(_DECIMAL)
+    _write_signed(out, -coefficient if sign else coefficient)
+    _write_signed(out, exponent)
+    return True
+
+
+def _decimal_text(text: str) -> Any:
+    """``Decimal`` for strings that round-trip exactly, else ``None``."""
+
+    if not text or text[0] not in _DECIMAL_START:
+        return None
+    try:
+        value = Decimal(text)
+    except InvalidOperation:
+        return None
+    return value if str(value) == text else None
+
+
+def _write(out: bytearray, value: Any) -> None:
+    if value is None:
+        out.append(_NULL)
+    elif value is True:
+        out.append(_TRUE)
+    elif value is False:
+        out.append(_FALSE)
+    elif isinstance(value, int):
+        out.append(_INT)
+        _write_signed(out, value)
+    elif isinstance(value, float):
+        out.append(_FLOAT)
+        out += _DOUBLE.pack(value)
+    elif isinstance(value, str):
+        decimal = _decimal_text(value)
+        if decimal is None or not _write_decimal(out, decimal):
+            out.append(_STR)
+            _write_text(out, value)
+    elif isinstance(value, Decimal):
+        if not _write_decimal(out, value):
+            out.append(_STR)
+            _write_text(out, str(value))
+    elif isinstance(value, dict):
+        out.append(_DICT)
+        _write_varint(out, len(value))
+        for key, item in value.items():
+            _write_text(out, str(key))
+            _write(out, item)
+    elif isinstance(value, (list, tuple)):
+        out.append(_LIST)
+        _write_varint(out, len(value))
+        for item in value:
+            _write(out, item)
+    else:
+        _write(out, jsonable_encoder(value))
+
+
+def encode(value: Any) -> bytes:
+    """Serialize a JSON-shaped value (Decimals allowed) into a compact blob."""
+
+    body = bytearray()
+    _write(body, value)
+    if len(body) >= _MIN_DEFLATE_BYTES:
+        compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+        deflated = compressor.compress(bytes(body)) + compressor.flush()
+        if len(deflated) < len(body):
+            return bytes((_VERSION | _DEFLATED,)) + deflated
+    return bytes((_VERSION,)) + bytes(body)
+
+
+class _Reader:
+    __slots__ = ("data", "pos")
+
+    def __init__(self, data: bytes) -> None:
+        self.data = data
+        self.pos = 0
+
+    def byte(self) -> int:
+        try:
+            value = self.data[self.pos]
+        except IndexError:
+            raise CodecError("Truncated blob") from None
+        self.pos += 1
+        return value
+
+    def varint(self) -> int:
+        result = shift = 0
+        while True:
+            byte = self.byte()
+            result |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                return result
+            shift += 7
+
+    def signed(self) -> int:
+        value = self.varint()
+        return (value >> 1) ^ -(value & 1)
+
+    def text(self) -> str:
+        code = self.varint()
+        if not code & 1:
+            try:
+                return _SYMBOLS[code >> 1]
+            except IndexError:
+                raise CodecError(f"Unknown symbol {code >> 1}") from None
+        end = self.pos + (code >> 1)
+        if end > len(self.data):
+            raise CodecError("Truncated blob")
+        text = self.data[self.pos:end].decode("utf-8")
+        self.pos = end
+        return text
+
+    def decimal(self) -> str:
+        coefficient = self.signed()
+        return str(Decimal(f"{coefficient}E{self.signed()}"))
+
+    def value(self) -> Any:
+        tag = self.byte()
+        if tag == _STR:
+            return self.text()
+        if tag == _DECIMAL:
+            return self.decimal()
+        if tag == _DICT:
+            return {self.text(): self.value() for _ in range(self.varint())}
+        if tag == _LIST:
+            return [self.value() for _ in range(self.varint())]
+        if tag == _INT:
+            return self.signed()
+        if tag == _NULL:
+            return None
+        if tag == _TRUE:
+            return True
+        if tag == _FALSE:
+            return False
+        if tag == _FLOAT:
+            end = self.pos + _DOUBLE.size
+            (number,) = _DOUBLE.unpack(self.data[self.pos:end])
+            self.pos = end
+            return number
+        raise CodecError(f"Unknown tag {tag}")
+
+    def json(self, parts: List[str]) -> None:
+        """Append the JSON text of the next value to ``parts``, without building it."""
+
+        tag = self.byte()
+        if tag == _STR:
+            parts.append(_json_string(self.text()))
+        elif tag == _DECIMAL:
+            parts.append(f'"{self.decimal()}"')
+        elif tag == _DICT:
+            parts.append("{")
+            for index in range(self.varint()):
+                if index:
+                    parts.append(",")
+                parts.append(_json_string(self.text()))
+                parts.append(":")
+                self.json(parts)
+            parts.append("}")
+        elif tag == _LIST:
+            parts.append("[")
+            for index in range(self.varint()):
+                if index:
+                    parts.append(",")
+                self.json(parts)
+            parts.append("]")
+        else:
+            self.pos -= 1
+            parts.append(dumps_json(self.value()))
+
+
+_json_string = json.encoder.encode_basestring
+
+
+def _legacy_json(blob: Blob) -> Any:
+    if isinstance(blob, str):
+        return blob
+    if blob[:1] in (b"{", b"["):
+        return bytes(blob).decode("utf-8")
+    return None
+
+
+def _body(blob: Union[bytes, bytearray, memoryview]) -> bytes:
+    data = bytes(blob)
+    if not data:
+        raise CodecError("Empty blob")
+    header = data[0]
+    if header & ~_DEFLATED != _VERSION:
+        raise CodecError(f"Unsupported blob version {header & ~_DEFLATED}")
+    if header & _DEFLATED:
+        try:
+            return zlib.decompress(data[1:], -15)
+        except zlib.error as exc:
+            raise CodecError(f"Corrupt blob: {exc}") from exc
+    return data[1:]
+
+
+def decode(blob: Blob) -> Any:
+    """Inverse of :func:`encode`; legacy JSON text is parsed as JSON."""
+
+    legacy = _legacy_json(blob)
+    if legacy is not None:
+        return json.loads(legacy)
+    return _Reader(_body(blob)).value()
+
+
+def decode_json(blob: Blob) -> str:
+    """JSON text of a stored value, as :func:`dumps_json` would render the decoded value."""
+
+    legacy = _legacy_json(blob)
+    if legacy is not None:
+        return legacy
+    parts: List[str] = []
+    _Reader(_body(blob)).json(parts)
+    return "".join(parts)
+
+
+def is_compact(blob: Blob) -> bool:
+    return _legacy_json(blob) is None
+
+
+class CompactJSON(TypeDecorator):
+    """Column type storing JSON-shaped values with :func:`encode`, read back with :func:`decode`."""
+
+    impl = LargeBinary
+    cache_ok = True
+
+    def process_bind_param(self, value: Any, dialect: Any) -> Any:
+        return None if value is None else encode(value)
+
+    def process_result_value(self, value: Any, dialect: Any) -> Any:
+        return None if value is None else decode(value)
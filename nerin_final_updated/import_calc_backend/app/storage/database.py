@@ -1,19 +1,208 @@
 from __future__ import annotations
 
+import argparse
 from contextlib import contextmanager
-from typing import Iterator
+from typing import Any, Dict, Iterator, List, Optional, Sequence
 
-from sqlmodel import Session, SQLModel, create_engine
+from sqlalchemy import LargeBinary, bindparam, inspect, type_coerce
+from sqlmodel import Session, SQLModel, create_engine, select
 
 from ..config import get_settings
+from ..utils.serialization import dumps_json
+from .codec import decode, is_compact
 
 
 settings = get_settings()
-engine = create_engine(settings.database_url, echo=False, future=True)
+engine = create_engine(settings.database_url, echo=False, future=True, json_serializer=dumps_json)
+
+
+# Columns added after a table was first released. ``create_all`` never alters
+# existing tables, so databases created by older versions get them here.
+_ADDED_COLUMNS = {
+    "calculations": {"revision": "INTEGER NOT NULL DEFAULT 1"},
+}
+
+
+def _add_missing_columns() -> None:
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table, columns in _ADDED_COLUMNS.items():
+            if not inspector.has_table(table):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table)}
+            for name, ddl in columns.items():
+                if name not in existing:
+                    connection.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}")
+
+
+# JSON columns stored with ``storage.codec``. SQLite keeps whatever value it is
+# given, so rows written as JSON text by older versions sit next to new blobs
+# and are decoded transparently; PostgreSQL needs the column type changed first.
+_COMPACT_COLUMNS = {
+    "calculations": ("parameters", "results"),
+    "payment_notifications": ("fee_breakdown", "raw_payload"),
+}
+
+
+def _unconverted_compact_columns() -> List[str]:
+    if engine.dialect.name != "postgresql":
+        return []
+    inspector = inspect(engine)
+    pending = []
+    for table, columns in _COMPACT_COLUMNS.items():
+        if not inspector.has_table(table):
+            continue
+        types = {column["name"]: column["type"] for column in inspector.get_columns(table)}
+        pending.extend(
+            f"{table}.{name}" for name in columns if name in types and not isinstance(types[name], LargeBinary)
+        )
+    return pending
+
+
+def convert_compact_columns() -> List[str]:
+    """Change PostgreSQL columns still typed as JSON to ``BYTEA``; returns the columns converted.
+
+    ``ALTER COLUMN ... TYPE`` rewrites the table under an exclusive lock, so it
+    is only run from the maintenance CLI (``python -m app.storage.database``).
+    """
+
+    pending = _unconverted_compact_columns()
+    with engine.begin() as connection:
+        for column in pending:
+            table, name = column.split(".")
+            # The JSON text becomes its UTF-8 bytes, which the codec still reads as legacy JSON.
+            connection.exec_driver_sql(
+                f"ALTER TABLE {table} ALTER COLUMN {name} TYPE BYTEA USING convert_to({name}::text, 'UTF8')"
+            )
+    return pending
+
+
+def compact_json_columns(batch_size: int = 500) -> Dict[str, int]:
+    """Re-encode rows still holding JSON text in the compact format; returns rows rewritten per table."""
+
+    rewritten: Dict[str, int] = {}
+    for name, columns in _COMPACT_COLUMNS.items():
+        table = SQLModel.metadata.tables[name]
+        raw_columns = [type_coerce(table.c[column], LargeBinary) for column in columns]
+        update = (
+            table.update()
+            .where(table.c.id == bindparam("row_id"))
+            .values({column: bindparam(f"new_{column}") for column in columns})
+        )
+        count = last_id = 0
+        while True:
+            with get_session() as session:
+                rows = session.exec(
+                    select(table.c.id, *raw_columns).where(table.c.id > last_id).order_by(table.c.id).limit(batch_size)
+                ).all()
+                if not rows:
+                    break
+                last_id = rows[-1][0]
+                legacy: List[Dict[str, Any]] = [
+                    {"row_id": row[0], **{f"new_{column}": decode(value) for column, value in zip(columns, row[1:])}}
+                    for row in rows
+                    if not all(value is None or is_compact(value) for value in row[1:])
+                ]
+                if legacy:
+                    session.connection().execute(update, legacy)
+                    session.commit()
+                count += len(legacy)
+        rewritten[name] = count
+    return rewritten
+
+
+_SQLITE_AUTO_VACUUM_INCREMENTAL = 2
+
+
+def _auto_vacuum_on_new_database() -> None:
+    # ``auto_vacuum`` can be set for free until the first table is created, so
+    # a new database starts in INCREMENTAL mode. Existing files keep their mode
+    # until ``enable_incremental_vacuum`` is run from the maintenance CLI.
+    if engine.dialect.name != "sqlite":
+        return
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        if connection.exec_driver_sql("SELECT COUNT(*) FROM sqlite_master").scalar() == 0:
+            connection.exec_driver_sql(f"PRAGMA auto_vacuum = {_SQLITE_AUTO_VACUUM_INCREMENTAL}")
+
+
+def enable_incremental_vacuum() -> bool:
+    """Convert an existing SQLite database to ``auto_vacuum=INCREMENTAL``; returns whether it was converted.
+
+    The change needs a full VACUUM, which rewrites the whole file and blocks
+    every writer while it runs, so it is only done on request
+    (``python -m app.services.archival --enable-incremental-vacuum``).
+    """
+
+    if engine.dialect.name != "sqlite":
+        return False
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        if connection.exec_driver_sql("PRAGMA auto_vacuum").scalar() == _SQLITE_AUTO_VACUUM_INCREMENTAL:
+            return False
+        connection.exec_driver_sql(f"PRAGMA auto_vacuum = {_SQLITE_AUTO_VACUUM_INCREMENTAL}")
+        connection.exec_driver_sql("VACUUM")
+    # Pooled connections keep the mode they read when they opened the file.
+    engine.dispose()
+    return True
+
+
+def _enable_wal() -> None:
+    # The reporting replica copies the live file while payments keep committing.
+    # In WAL mode that copy is a plain reader and never holds writers back.
+    if engine.dialect.name != "sqlite" or not settings.reporting_replica:
+        return
+    with engine.connect() as connection:
+        connection.exec_driver_sql("PRAGMA journal_mode=WAL")
+
+
+def incremental_vacuum(pages: int) -> int:
+    """Release up to ``pages`` free pages; returns how many were released."""
+
+    if engine.dialect.name != "sqlite" or pages <= 0:
+        return 0
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        before = connection.exec_driver_sql("PRAGMA freelist_count").scalar()
+        # ``sqlite3.Cursor.execute`` steps this pragma once, which frees a single
+        # page; ``executescript`` runs it to completion.
+        connection.connection.dbapi_connection.executescript(f"PRAGMA incremental_vacuum({int(pages)})")
+        after = connection.exec_driver_sql("PRAGMA freelist_count").scalar()
+    return before - after
+
+
+def upsert_statement(table: Any, conflict_columns: Sequence[str], update_columns: Sequence[str]) -> Any:
+    """``INSERT ... ON CONFLICT DO UPDATE`` for ``table``, meant to run once with many parameter sets."""
+
+    if engine.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    statement = insert(table)
+    return statement.on_conflict_do_update(
+        index_elements=list(conflict_columns),
+        set_={column: statement.excluded[column] for column in update_columns},
+    )
+
+
+def insert_ignore_statement(table: Any, conflict_columns: Sequence[str]) -> Any:
+    """``INSERT ... ON CONFLICT DO NOTHING`` for ``table``: rows clashing on ``conflict_columns`` are skipped."""
+
+    if engine.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(table).on_conflict_do_nothing(index_elements=list(conflict_columns))
 
 
 def init_db() -> None:
+    _auto_vacuum_on_new_database()
+    _enable_wal()
     SQLModel.metadata.create_all(engine)
+    _add_missing_columns()
+    pending = _unconverted_compact_columns()
+    if pending:
+        # Compact blobs cannot be written to JSON columns; refuse rather than fail on every write.
+        raise RuntimeError(
+            f"Columns {', '.join(pending)} are not BYTEA yet; run `python -m app.storage.database` first"
+        )
 
 
 @contextmanager
@@ -21,3 +210,21 @@ def get_session() -> Iterator[Session]:
     with Session(engine) as session:
         yield session
 
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Rewrite JSON-text columns in the compact storage format")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--vacuum-pages", type=int, default=None, help="override IMPORT_CALC_VACUUM_PAGES")
+    args = parser.parse_args(argv)
+
+    from . import models  # noqa: F401  (registers the tables)
+
+    converted = convert_compact_columns()
+    init_db()
+    rewritten = compact_json_columns(args.batch_size)
+    pages = settings.vacuum_pages if args.vacuum_pages is None else args.vacuum_pages
+    print(dumps_json({"converted": converted, "rewritten": rewritten, "released_pages": incremental_vacuum(pages)}))
+
+
+if __name__ == "__main__":
+    main()
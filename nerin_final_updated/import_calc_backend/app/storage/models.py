@@ -1,23 +1,27 @@
 from __future__ import annotations
 
-from datetime import datetime
+from datetime import date, datetime
 from typing import Any, Dict, Optional
 
-from sqlalchemy import Column, DateTime, JSON, UniqueConstraint
+from sqlalchemy import Column, DateTime, JSON, Text, UniqueConstraint
+from sqlalchemy.orm import deferred
 from sqlmodel import Field, SQLModel
 
+from .codec import CompactJSON
+
 
 class Calculation(SQLModel, table=True):
     __tablename__ = "calculations"
 
     id: Optional[int] = Field(default=None, primary_key=True)
     created_at: datetime = Field(default_factory=datetime.utcnow, nullable=False)
-    parameters: Dict[str, Any] = Field(default_factory=dict, sa_column=Column(JSON, nullable=False))
-    results: Dict[str, Any] = Field(default_factory=dict, sa_column=Column(JSON, nullable=False))
+    parameters: Dict[str, Any] = Field(default_factory=dict, sa_column=Column(CompactJSON, nullable=False))
+    results: Dict[str, Any] = Field(default_factory=dict, sa_column=Column(CompactJSON, nullable=False))
     order_reference: Optional[str] = Field(default=None, index=True)
     preset_name: Optional[str] = Field(default=None)
     mp_fee_applied: Optional[float] = Field(default=None, description="Fee total applied in ARS")
     mp_fee_details: Optional[Dict[str, Any]] = Field(default=None, sa_column=Column(JSON, nullable=True))
+    revision: int = Field(default=1, nullable=False, description="Incremented on every update; used for ETags")
 
 
 class Preset(SQLModel, table=True):
@@ -29,9 +33,15 @@ class Preset(SQLModel, table=True):
     parameters: Dict[str, Any] = Field(default_factory=dict, sa_column=Column(JSON, nullable=False))
 
 
+# Only archival and audits read the webhook body; plain ``select(PaymentNotification)``
+# leaves it out and loads it on first attribute access.
+_RAW_PAYLOAD = Column("raw_payload", CompactJSON, nullable=False)
+
+
 class PaymentNotification(SQLModel, table=True):
     __tablename__ = "payment_notifications"
     __table_args__ = (UniqueConstraint("payment_id", name="uq_payment_id"),)
+    __mapper_args__ = {"properties": {"raw_payload": deferred(_RAW_PAYLOAD)}}
 
     id: Optional[int] = Field(default=None, primary_key=True)
     payment_id: str = Field(index=True)
@@ -39,7 +49,100 @@ class PaymentNotification(SQLModel, table=True):
     amount: float
     currency: str
     fee_total: float
-    fee_breakdown: Dict[str, Any] = Field(default_factory=dict, sa_column=Column(JSON, nullable=False))
-    raw_payload: Dict[str, Any] = Field(default_factory=dict, sa_column=Column(JSON, nullable=False))
+    fee_breakdown: Dict[str, Any] = Field(default_factory=dict, sa_column=Column(CompactJSON, nullable=False))
+    raw_payload: Dict[str, Any] = Field(default_factory=dict, sa_column=_RAW_PAYLOAD)
     received_at: datetime = Field(default_factory=datetime.utcnow)
 
+
+class ArchivedRecord(SQLModel, table=True):
+    """Index entry locating one archived row inside a compressed segment member."""
+
+    __tablename__ = "archive_index"
+    __table_args__ = (UniqueConstraint("table_name", "record_id", name="uq_archive_record"),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    table_name: str = Field(index=True)
+    record_id: int
+    order_reference: Optional[str] = Field(default=None, index=True)
+    payment_id: Optional[str] = Field(default=None, index=True)
+    segment: str
+    offset: int
+    length: int
+    archived_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class IdempotencyRecord(SQLModel, table=True):
+    """Outcome of a request sent with an ``Idempotency-Key``; ``status_code`` is NULL while in flight."""
+
+    __tablename__ = "idempotency_keys"
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    key: str = Field(unique=True, index=True, max_length=255)
+    request_hash: str
+    status_code: Optional[int] = None
+    response_body: Optional[str] = Field(default=None, sa_column=Column(Text, nullable=True))
+    etag: Optional[str] = None
+    calculation_id: Optional[int] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow, nullable=False)
+    expires_at: datetime = Field(index=True)
+
+
+class Job(SQLModel, table=True):
+    """Background job; ``checkpoint`` lets a restarted worker resume where the last one stopped."""
+
+    __tablename__ = "jobs"
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    kind: str = Field(index=True)
+    status: str = Field(default="queued", index=True)
+    payload: Dict[str, Any] = Field(default_factory=dict, sa_column=Column(JSON, nullable=False))
+    checkpoint: Optional[Dict[str, Any]] = Field(default=None, sa_column=Column(JSON, nullable=True))
+    progress_done: int = Field(default=0)
+    progress_total: Optional[int] = None
+    items_count: int = Field(default=0)
+    result: Optional[Dict[str, Any]] = Field(default=None, sa_column=Column(JSON, nullable=True))
+    error: Optional[str] = Field(default=None, sa_column=Column(Text, nullable=True))
+    attempts: int = Field(default=0)
+    worker_id: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow, nullable=False)
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    heartbeat_at: Optional[datetime] = None
+
+
+class JobItem(SQLModel, table=True):
+    """Partial result emitted by a job, numbered per job for SSE resumption."""
+
+    __tablename__ = "job_items"
+    __table_args__ = (UniqueConstraint("job_id", "seq", name="uq_job_item_seq"),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    job_id: int = Field(index=True)
+    seq: int
+    data: Dict[str, Any] = Field(default_factory=dict, sa_column=Column(JSON, nullable=False))
+
+
+class NcmPosition(SQLModel, table=True):
+    """Tariff position of the Mercosur nomenclature; shorter codes act as defaults for their subtree."""
+
+    __tablename__ = "ncm_positions"
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    code: str = Field(unique=True, index=True, max_length=16)
+    description: Optional[str] = Field(default=None, sa_column=Column(Text, nullable=True))
+    di_rate: str
+    apply_tasa_estadistica: bool = Field(default=True)
+    updated_at: datetime = Field(default_factory=datetime.utcnow, nullable=False)
+
+
+class ExchangeRate(SQLModel, table=True):
+    """Published value of one exchange-rate source (e.g. ``aduana``, ``mep``) on one day."""
+
+    __tablename__ = "exchange_rates"
+    __table_args__ = (UniqueConstraint("source_key", "rate_date", name="uq_exchange_rate_day"),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    source_key: str = Field(index=True, max_length=64)
+    rate_date: date
+    rate: str
+    updated_at: datetime = Field(default_factory=datetime.utcnow, nullable=False)
@@ -0,0 +1,185 @@
+from __future__ import annotations
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlmodel import Session, create_engine
+
+from ..config import get_settings
+from .database import engine as live_engine
+from .database import get_session
+
+LOGGER = logging.getLogger(__name__)
+
+# Wait between retries while a writer holds the live file, instead of the default 250 ms.
+_BUSY_RETRY_SECONDS = 0.005
+
+
+class ReportingReplica:
+    """Read-only copy of the live SQLite database for listings, exports and reports.
+
+    :meth:`refresh` copies the live file into a temporary file in one pass
+    with SQLite's online backup API, then renames it over the replica, so
+    readers always see a complete file. Replica mode puts the live database
+    in WAL mode (see ``database.init_db``), where the copy is a plain reader
+    and payment and calculation writes commit while it runs.
+
+    Reads go through their own engine opened with ``mode=ro&immutable=1``.
+    The file is replaced on each refresh and never changed in place, so SQLite
+    can skip locking it. The engine is rebuilt when another process replaces
+    the file. The replica's modification time is the start of the copy, which
+    every worker reads as its age.
+    """
+
+    def __init__(self, source: Path, path: Path) -> None:
+        self.source = Path(source)
+        self.path = Path(path)
+        self._refresh_lock = threading.Lock()
+        self._engine_lock = threading.Lock()
+        self._engine: Optional[Engine] = None
+        self._identity: Optional[Tuple[int, int]] = None
+
+    def refresh(self) -> Dict[str, Any]:
+        """Copy the live database into the replica; returns :meth:`status` afterwards."""
+
+        with self._refresh_lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            partial = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+            started = time.time()
+            self._copy(partial)
+            os.utime(partial, (started, started))
+            os.replace(partial, self.path)
+        status = self.status()
+        LOGGER.info(
+            "Reporting replica refreshed",
+            extra={"seconds": round(time.time() - started, 3), "bytes": status["size_bytes"]},
+        )
+        return status
+
+    def _copy(self, target_path: Path) -> None:
+        target_path.unlink(missing_ok=True)
+        source = sqlite3.connect(self.source, timeout=30.0)
+        target = sqlite3.connect(target_path, isolation_level=None)
+        try:
+            source.backup(target, sleep=_BUSY_RETRY_SECONDS)
+            # A WAL header would make readers look for a -wal file next to the replica.
+            target.execute("PRAGMA journal_mode=DELETE")
+        finally:
+            target.close()
+            source.close()
+
+    def refreshed_at(self) -> Optional[float]:
+        try:
+            return self.path.stat().st_mtime
+        except FileNotFoundError:
+            return None
+
+    def status(self) -> Dict[str, Any]:
+        refreshed_at = self.refreshed_at()
+        if refreshed_at is None:
+            return {"source": "replica", "refreshed_at": None, "staleness_seconds": None, "size_bytes": 0}
+        return {
+            "source": "replica",
+            "refreshed_at": datetime.fromtimestamp(refreshed_at, timezone.utc).isoformat(),
+            "staleness_seconds": round(max(time.time() - refreshed_at, 0.0), 3),
+            "size_bytes": self.path.stat().st_size,
+        }
+
+    def _current_engine(self) -> Engine:
+        if self.refreshed_at() is None:
+            self.refresh()
+        stat = self.path.stat()
+        identity = (stat.st_ino, stat.st_mtime_ns)
+        with self._engine_lock:
+            if self._engine is None or identity != self._identity:
+                if self._engine is not None:
+                    # Sessions still open keep reading the file they opened; new ones get the new copy.
+                    self._engine.dispose()
+                self._engine = create_engine(
+                    f"sqlite:///file:{self.path}?mode=ro&immutable=1&uri=true", echo=False, future=True
+                )
+                event.listen(self._engine, "connect", _query_only)
+                self._identity = identity
+            return self._engine
+
+    @contextmanager
+    def session(self) -> Iterator[Session]:
+        with Session(self._current_engine()) as session:
+            yield session
+
+
+def _query_only(dbapi_connection: Any, connection_record: Any) -> None:
+    dbapi_connection.execute("PRAGMA query_only = 1")
+
+
+class ReplicaRefresher:
+    """Daemon thread refreshing the reporting replica every ``interval`` seconds."""
+
+    def __init__(self, replica: Optional[ReportingReplica], interval: float) -> None:
+        self.replica = replica
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self.replica is None or self.interval <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="replica-refresher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.replica.refresh()
+            except Exception:  # pragma: no cover - keep the refresher alive
+                LOGGER.exception("Reporting replica refresh failed")
+
+
+@lru_cache()
+def get_reporting_replica() -> Optional[ReportingReplica]:
+    """The configured replica, or ``None`` when reads go to the live database."""
+
+    settings = get_settings()
+    database = live_engine.url.database
+    if not settings.reporting_replica:
+        return None
+    if live_engine.dialect.name != "sqlite" or not database or database == ":memory:":
+        LOGGER.warning("Reporting replica needs a SQLite database file; reading from the live database")
+        return None
+    return ReportingReplica(Path(database), Path(settings.reporting_replica_path))
+
+
+@contextmanager
+def get_reporting_session() -> Iterator[Session]:
+    """Session for listing, export and analytics reads: on the replica when enabled, else on the live database."""
+
+    replica = get_reporting_replica()
+    if replica is None:
+        with get_session() as session:
+            yield session
+        return
+    with replica.session() as session:
+        yield session
+
+
+def reporting_status() -> Dict[str, Any]:
+    replica = get_reporting_replica()
+    if replica is None:
+        return {"source": "live", "refreshed_at": None, "staleness_seconds": 0.0, "size_bytes": None}
+    return replica.status()
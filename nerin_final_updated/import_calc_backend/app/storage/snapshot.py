@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from typing import Any, Callable, Generic, Optional, Tuple, TypeVar
+
+from sqlalchemy import func
+from sqlmodel import select
+
+from .database import get_session
+
+LOGGER = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class TableSnapshot(Generic[T]):
+    """Process-local structure built from a reference table, rebuilt when the table changes.
+
+    :meth:`get` never queries the database while the snapshot is fresh. At
+    most every ``refresh_seconds`` one ``count``/``max(updated_at)`` query
+    checks whether some process loaded new rows, and only then is ``build``
+    called again. ``model`` must have ``id`` and ``updated_at`` columns that
+    every load bumps.
+    """
+
+    def __init__(self, model: Any, build: Callable[[], T], refresh_seconds: float) -> None:
+        self.model = model
+        self.build = build
+        self.refresh_seconds = refresh_seconds
+        self._lock = threading.Lock()
+        self._value: Optional[T] = None
+        self._version: Optional[Tuple[Any, ...]] = None
+        self._checked_at = float("-inf")
+
+    def _fresh(self) -> bool:
+        return self._value is not None and time.monotonic() - self._checked_at < self.refresh_seconds
+
+    def _table_version(self) -> Tuple[Any, ...]:
+        with get_session() as session:
+            return tuple(session.exec(select(func.count(self.model.id), func.max(self.model.updated_at))).one())
+
+    def get(self) -> T:
+        if self._fresh():
+            return self._value
+        with self._lock:
+            if self._fresh():
+                return self._value
+            # Read the version first: rows loaded meanwhile only cause one extra rebuild.
+            version = self._table_version()
+            if self._value is None or version != self._version:
+                self._value, self._version = self.build(), version
+                LOGGER.info("Table snapshot rebuilt", extra={"table": self.model.__tablename__, "rows": version[0]})
+            self._checked_at = time.monotonic()
+            return self._value
+
+    def invalidate(self) -> None:
+        """Force a version check on the next :meth:`get`; call it after loading rows."""
+
+        self._checked_at = float("-inf")
@@ -1,14 +1,19 @@
 from __future__ import annotations
 
+import json
 from decimal import Decimal
 from typing import Any
 
 from fastapi.encoders import jsonable_encoder
 
+_PRIMITIVES = (str, int, float, bool, type(None))
+
 
 def to_serializable(data: Any) -> Any:
     """Ensure Decimal and other non-JSON types are converted safely."""
 
+    if isinstance(data, _PRIMITIVES):
+        return data
     if isinstance(data, Decimal):
         return str(data)
     if isinstance(data, dict):
@@ -17,3 +22,23 @@ def to_serializable(data: Any) -> Any:
         return [to_serializable(item) for item in data]
     return jsonable_encoder(data)
 
+
+def _encode_default(value: Any) -> Any:
+    if isinstance(value, Decimal):
+        return str(value)
+    return jsonable_encoder(value)
+
+
+# Single encoder shared by the database layer and the API responses. Decimals are
+# written straight to their string form in the same pass that emits the JSON, so
+# results never need a separate ``to_serializable`` walk before being stored or
+# returned.
+_ENCODER = json.JSONEncoder(default=_encode_default, ensure_ascii=False, separators=(",", ":"))
+
+
+def dumps_json(data: Any) -> str:
+    return _ENCODER.encode(data)
+
+
+def encode_json(data: Any) -> bytes:
+    return _ENCODER.encode(data).encode("utf-8")
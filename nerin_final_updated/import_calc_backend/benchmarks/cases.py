@@ -0,0 +1,270 @@
+from __future__ import annotations
+
+import itertools
+import os
+import tempfile
+from decimal import Decimal
+from pathlib import Path
+from typing import Callable, Dict, List
+
+# The end-to-end cases boot the FastAPI app, which binds its engine at import
+# time. Point it at a throwaway database before anything from ``app`` loads so
+# benchmarks never touch ``import_calculator.db`` or the export cache.
+_BENCH_DIR = Path(tempfile.mkdtemp(prefix="import-calc-bench-"))
+os.environ.setdefault("IMPORT_CALC_DATABASE_URL", "sqlite:///" + str(_BENCH_DIR / "bench.db"))
+os.environ.setdefault("IMPORT_CALC_EXPORT_CACHE_DIR", str(_BENCH_DIR / "exports"))
+os.environ.setdefault("IMPORT_CALC_CACHE_PATH", str(_BENCH_DIR / "shared.sqlite3"))
+os.environ.setdefault("IMPORT_CALC_LOG_LEVEL", "WARNING")
+
+from app.schemas import CalculationParameters, MonteCarloRequest, TierPricingInput  # noqa: E402
+from app.services.calculator import calculate_import_cost  # noqa: E402
+from app.services.exporter import export_to_csv, export_to_xlsx  # noqa: E402
+from app.services.formula_graph import CalculationSession  # noqa: E402
+from app.services.montecarlo import simulate_margin_risk  # noqa: E402
+from app.services.tiers import calculate_price_tiers  # noqa: E402
+from app.utils.decimal_utils import to_decimal  # noqa: E402
+from app.utils.serialization import to_serializable  # noqa: E402
+
+from .payloads import base_payload  # noqa: E402
+
+
+BenchmarkCase = Callable[[], object]
+
+CASES: Dict[str, BenchmarkCase] = {}
+
+
+def benchmark(name: str) -> Callable[[Callable[[], BenchmarkCase]], Callable[[], BenchmarkCase]]:
+    """Register a factory returning the zero-argument callable to time."""
+
+    def decorator(factory: Callable[[], BenchmarkCase]) -> Callable[[], BenchmarkCase]:
+        CASES[name] = factory
+        return factory
+
+    return decorator
+
+
+_ROUNDING = {"step": "10", "mode": "nearest", "psychological_endings": [".99"]}
+_TAXES = [
+    {"name": "Imp Interno", "base": "CIF", "rate": "0.10"},
+    {"name": "Ingresos Brutos", "base": "BaseIVA", "rate": "0.03"},
+    {"name": "Eco", "base": "ARS", "amount_ars": "1500"},
+]
+_PRICE_TARGET = {"target": "precio", "precio_neto_input_ars": "250000"}
+# The same three taxes written as formulas, plus a capped one reading another tax.
+_FORMULA_TAXES = [
+    {"name": "Imp Interno", "base": "formula", "formula": "CIF_USD * 0.10"},
+    {"name": "Ingresos Brutos", "base": "formula", "formula": "(Subtotal_USD + Imp_Interno) * 0.03"},
+    {"name": "Eco", "base": "formula", "formula": "1500 / tc_aduana"},
+    {"name": "Sellos", "base": "formula", "formula": "min(Ingresos_Brutos * 0.5, 2)"},
+]
+
+
+def _calculator_case(**overrides) -> Callable[[], BenchmarkCase]:
+    def factory() -> BenchmarkCase:
+        params = CalculationParameters.model_validate(base_payload(**overrides))
+        return lambda: calculate_import_cost(params)
+
+    return factory
+
+
+for _target_name, _target_overrides in (("margen", {}), ("precio", _PRICE_TARGET)):
+    benchmark(f"calculator.{_target_name}.plain")(_calculator_case(**_target_overrides))
+    benchmark(f"calculator.{_target_name}.rounding")(_calculator_case(**_target_overrides, rounding=_ROUNDING))
+    benchmark(f"calculator.{_target_name}.taxes")(_calculator_case(**_target_overrides, additional_taxes=_TAXES))
+    benchmark(f"calculator.{_target_name}.rounding_taxes")(
+        _calculator_case(**_target_overrides, rounding=_ROUNDING, additional_taxes=_TAXES)
+    )
+
+# Formulas are compiled while validating, so this measures evaluation only.
+benchmark("calculator.margen.formula_taxes")(_calculator_case(calculate_import_cost, additional_taxes=_FORMULA_TAXES))
+
+
+def _session_edit_case(field: str, value: object) -> Callable[[], BenchmarkCase]:
+    """Alternate one input of a session and re-read the result; compare with ``calculator.margen.rounding_taxes``."""
+
+    def factory() -> BenchmarkCase:
+        params = CalculationParameters.model_validate(base_payload(additional_taxes=_TAXES, rounding=_ROUNDING))
+        edits = [params.model_copy(update={field: value}), params]
+        session = CalculationSession(params)
+
+        def edit() -> object:
+            edits.reverse()
+            session.set_parameters(edits[0])
+            return session.result()
+
+        return edit
+
+    return factory
+
+
+benchmark("formula_graph.edit.margen_objetivo")(_session_edit_case("margen_objetivo", Decimal("0.30")))
+benchmark("formula_graph.edit.perc_ganancias_rate")(_session_edit_case("perc_ganancias_rate", Decimal("0.03")))
+benchmark("formula_graph.edit.tc_aduana")(_session_edit_case("tc_aduana", Decimal("1015")))
+
+
+@benchmark("tiers.five_breakpoints")
+def _tiers_case() -> BenchmarkCase:
+    params = CalculationParameters.model_validate(base_payload(additional_taxes=_TAXES, rounding=_ROUNDING))
+    tiers = TierPricingInput(quantities=[1, 5, 10, 50, 100])
+    return lambda: calculate_price_tiers(params, tiers)
+
+
+@benchmark("montecarlo.20k_scenarios")
+def _montecarlo_case() -> BenchmarkCase:
+    params = CalculationParameters.model_validate(base_payload(additional_taxes=_TAXES, rounding=_ROUNDING))
+    request = MonteCarloRequest(
+        parameters=params,
+        tc_aduana={"kind": "lognormal", "std": "120"},
+        freight={"kind": "triangular", "low": "4", "high": "9"},
+        scenarios=20000,
+    )
+    return lambda: simulate_margin_risk(params, request)
+
+
+@benchmark("decimal_utils.to_decimal.mixed_locale")
+def _to_decimal_case() -> BenchmarkCase:
+    inputs: List[object] = [
+        "0,25",
+        "1.234,5",
+        "1.234.567,89",
+        "  $ 9,99 ",
+        "USD 1,234.50",
+        "0.25",
+        "980",
+        1500,
+        0.21,
+        Decimal("12.3456"),
+    ]
+
+    def run() -> None:
+        for value in inputs:
+            to_decimal(value)
+
+    return run
+
+
+@benchmark("serialization.to_serializable.result")
+def _to_serializable_case() -> BenchmarkCase:
+    result = calculate_import_cost(CalculationParameters.model_validate(base_payload(additional_taxes=_TAXES)))
+    payload = {
+        "breakdown": result.breakdown,
+        "additional_taxes": result.additional_taxes,
+        "totals": result.totals,
+        "unitary": result.unitary,
+    }
+    return lambda: to_serializable(payload)
+
+
+def _breakdown_strings() -> Dict[str, str]:
+    result = calculate_import_cost(CalculationParameters.model_validate(base_payload(additional_taxes=_TAXES)))
+    return to_serializable(result.breakdown)
+
+
+@benchmark("exporter.csv")
+def _export_csv_case() -> BenchmarkCase:
+    breakdown = _breakdown_strings()
+    return lambda: export_to_csv(breakdown)
+
+
+@benchmark("exporter.xlsx")
+def _export_xlsx_case() -> BenchmarkCase:
+    breakdown = _breakdown_strings()
+    return lambda: export_to_xlsx(breakdown)
+
+
+def _client():
+    from fastapi.testclient import TestClient
+
+    from app.main import app
+
+    client = TestClient(app)
+    client.__enter__()
+    return client
+
+
+@benchmark("api.create_calculation")
+def _api_create_case() -> BenchmarkCase:
+    client = _client()
+    body = {"parameters": base_payload(additional_taxes=_TAXES, rounding=_ROUNDING)}
+
+    def run() -> None:
+        response = client.post("/api/calculations", json=body)
+        response.raise_for_status()
+
+    return run
+
+
+def _created_calculation_id(client) -> int:
+    response = client.post("/api/calculations", json={"parameters": base_payload(order_reference="BENCH-1")})
+    response.raise_for_status()
+    return response.json()["calculation_id"]
+
+
+@benchmark("api.get_calculation")
+def _api_get_case() -> BenchmarkCase:
+    client = _client()
+    calculation_id = _created_calculation_id(client)
+
+    def run() -> None:
+        client.get(f"/api/calculations/{calculation_id}").raise_for_status()
+
+    return run
+
+
+@benchmark("api.export_csv")
+def _api_export_csv_case() -> BenchmarkCase:
+    client = _client()
+    calculation_id = _created_calculation_id(client)
+
+    def run() -> None:
+        client.get(f"/api/calculations/{calculation_id}/export", params={"format": "csv"}).raise_for_status()
+
+    return run
+
+
+@benchmark("api.export_xlsx")
+def _api_export_xlsx_case() -> BenchmarkCase:
+    client = _client()
+    calculation_id = _created_calculation_id(client)
+
+    def run() -> None:
+        client.get(f"/api/calculations/{calculation_id}/export", params={"format": "xlsx"}).raise_for_status()
+
+    return run
+
+
+@benchmark("api.payment_notify")
+def _api_notify_case() -> BenchmarkCase:
+    client = _client()
+    _created_calculation_id(client)
+    counter = itertools.count()
+
+    def run() -> None:
+        client.post(
+            "/api/payments/notify",
+            json={
+                "payment_id": f"bench-{next(counter)}",
+                "order_reference": "BENCH-1",
+                "amount": "250000",
+                "currency": "ARS",
+                "fee_total": "15125",
+            },
+        ).raise_for_status()
+
+    return run
+
+
+@benchmark("api.compare_presets")
+def _api_compare_presets_case() -> BenchmarkCase:
+    client = _client()
+    parameters = base_payload()
+    body = {
+        "costs": parameters.pop("costs"),
+        "tc_aduana": parameters.pop("tc_aduana"),
+        "parameters": parameters,
+    }
+
+    def run() -> None:
+        client.post("/api/presets/compare", json=body).raise_for_status()
+
+    return run
@@ -0,0 +1,284 @@
+"""Local load test for a single uvicorn worker.
+
+Starts ``app.main:app`` on a temporary SQLite database, seeds a few
+calculations and drives a weighted mix of API calls from an async httpx
+client. Reports throughput, p50/p95/p99 latency and error rate per endpoint.
+
+Usage (from ``import_calc_backend/``)::
+
+    python -m benchmarks.loadtest --concurrency 16 --duration 20
+    python -m benchmarks.loadtest --sweep 1,2,4,8,16,32,64 --duration 10
+    python -m benchmarks.loadtest --base-url http://localhost:8000 --mix create=1,get=4
+
+The sweep stops at the saturation point: the first concurrency level where
+throughput grows less than ``--min-gain`` over the previous level, p99 exceeds
+``--latency-budget`` (what the Node proxy tolerates before timing out) or the
+error rate goes above ``--max-error-rate``.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import itertools
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import httpx
+
+from .payloads import base_payload
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+DEFAULT_MIX = {"create": 2, "get": 5, "export_csv": 1, "export_xlsx": 1, "notify": 1}
+
+
+@dataclass
+class Sample:
+    endpoint: str
+    latency: float
+    ok: bool
+
+
+@dataclass
+class RunReport:
+    concurrency: int
+    duration: float
+    samples: List[Sample] = field(default_factory=list)
+
+    @property
+    def throughput(self) -> float:
+        return len(self.samples) / self.duration if self.duration else 0.0
+
+    @property
+    def error_rate(self) -> float:
+        if not self.samples:
+            return 0.0
+        return sum(1 for sample in self.samples if not sample.ok) / len(self.samples)
+
+    def latency(self, quantile: float, endpoint: Optional[str] = None) -> float:
+        values = sorted(s.latency for s in self.samples if endpoint is None or s.endpoint == endpoint)
+        return percentile(values, quantile)
+
+
+def percentile(sorted_values: List[float], quantile: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+
+    if not sorted_values:
+        return math.nan
+    rank = max(1, math.ceil(quantile * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def parse_mix(raw: Optional[str]) -> Dict[str, int]:
+    if not raw:
+        return dict(DEFAULT_MIX)
+    mix: Dict[str, int] = {}
+    for chunk in raw.split(","):
+        name, _, weight = chunk.partition("=")
+        name = name.strip()
+        if name not in DEFAULT_MIX:
+            raise SystemExit(f"Unknown endpoint '{name}'. Choose from: {', '.join(DEFAULT_MIX)}")
+        mix[name] = int(weight or 1)
+    return mix
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextmanager
+def local_server(port: int) -> Iterator[str]:
+    """Run one uvicorn worker on a temporary database for the duration of the block."""
+
+    workdir = Path(tempfile.mkdtemp(prefix="import-calc-load-"))
+    env = {
+        **os.environ,
+        "IMPORT_CALC_DATABASE_URL": "sqlite:///" + str(workdir / "load.db"),
+        "IMPORT_CALC_EXPORT_CACHE_DIR": str(workdir / "exports"),
+        "IMPORT_CALC_LOG_LEVEL": "WARNING",
+    }
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--workers", "1", "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+        env=env,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            if process.poll() is not None:
+                raise SystemExit("uvicorn exited before becoming healthy")
+            try:
+                if httpx.get(f"{base_url}/health", timeout=1).status_code == 200:
+                    break
+            except httpx.HTTPError:
+                pass
+            if time.monotonic() > deadline:
+                raise SystemExit("Timed out waiting for uvicorn to start")
+            time.sleep(0.2)
+        yield base_url
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+class Workload:
+    def __init__(self, client: httpx.AsyncClient, mix: Dict[str, int], seed: int) -> None:
+        self.client = client
+        self.random = random.Random(seed)
+        self.endpoints = list(mix)
+        self.weights = [mix[name] for name in self.endpoints]
+        self.calculation_ids: List[int] = []
+        self.payment_ids = itertools.count()
+
+    async def seed(self, count: int = 20) -> None:
+        for index in range(count):
+            response = await self.client.post(
+                "/api/calculations",
+                json={"parameters": base_payload(order_reference=f"LOAD-{index}")},
+            )
+            response.raise_for_status()
+            self.calculation_ids.append(response.json()["calculation_id"])
+
+    async def request(self, endpoint: str) -> httpx.Response:
+        calculation_id = self.random.choice(self.calculation_ids)
+        if endpoint == "create":
+            return await self.client.post("/api/calculations", json={"parameters": base_payload()})
+        if endpoint == "get":
+            return await self.client.get(f"/api/calculations/{calculation_id}")
+        if endpoint in ("export_csv", "export_xlsx"):
+            fmt = endpoint.split("_", 1)[1]
+            return await self.client.get(f"/api/calculations/{calculation_id}/export", params={"format": fmt})
+        return await self.client.post(
+            "/api/payments/notify",
+            json={
+                "payment_id": f"load-{os.getpid()}-{next(self.payment_ids)}",
+                "order_reference": f"LOAD-{self.random.randrange(len(self.calculation_ids))}",
+                "amount": "250000",
+                "currency": "ARS",
+                "fee_total": "15125",
+            },
+        )
+
+    async def run(self, concurrency: int, duration: float) -> RunReport:
+        report = RunReport(concurrency=concurrency, duration=duration)
+        deadline = time.perf_counter() + duration
+
+        async def user() -> None:
+            while time.perf_counter() < deadline:
+                endpoint = self.random.choices(self.endpoints, self.weights)[0]
+                started = time.perf_counter()
+                try:
+                    response = await self.request(endpoint)
+                    ok = response.status_code < 400
+                except httpx.HTTPError:
+                    ok = False
+                report.samples.append(Sample(endpoint, time.perf_counter() - started, ok))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(user() for _ in range(concurrency)))
+        report.duration = time.perf_counter() - started
+        return report
+
+
+def print_report(report: RunReport) -> None:
+    print(
+        f"\nconcurrency={report.concurrency} requests={len(report.samples)} "
+        f"throughput={report.throughput:.1f} req/s errors={report.error_rate:.2%}"
+    )
+    print(f"  {'endpoint':12s} {'count':>7s} {'err%':>7s} {'p50 ms':>9s} {'p95 ms':>9s} {'p99 ms':>9s}")
+    grouped: Dict[str, List[Sample]] = defaultdict(list)
+    for sample in report.samples:
+        grouped[sample.endpoint].append(sample)
+    for endpoint in sorted(grouped) + [None]:
+        samples = report.samples if endpoint is None else grouped[endpoint]
+        errors = sum(1 for sample in samples if not sample.ok) / len(samples) if samples else 0.0
+        print(
+            f"  {endpoint or 'ALL':12s} {len(samples):7d} {errors:7.2%} "
+            f"{report.latency(0.50, endpoint) * 1000:9.1f} "
+            f"{report.latency(0.95, endpoint) * 1000:9.1f} "
+            f"{report.latency(0.99, endpoint) * 1000:9.1f}"
+        )
+
+
+def find_saturation(
+    reports: List[RunReport],
+    min_gain: float,
+    latency_budget: float,
+    max_error_rate: float,
+) -> Tuple[Optional[RunReport], str]:
+    previous: Optional[RunReport] = None
+    for report in reports:
+        if report.error_rate > max_error_rate:
+            return report, f"error rate {report.error_rate:.2%} above {max_error_rate:.2%}"
+        if report.latency(0.99) > latency_budget:
+            return report, f"p99 {report.latency(0.99) * 1000:.0f}ms above budget {latency_budget * 1000:.0f}ms"
+        if previous and report.throughput < previous.throughput * (1 + min_gain):
+            return report, f"throughput grew less than {min_gain:.0%} over concurrency {previous.concurrency}"
+        previous = report
+    return None, "not reached"
+
+
+async def _drive(args: argparse.Namespace, base_url: str) -> int:
+    mix = parse_mix(args.mix)
+    levels = [int(level) for level in args.sweep.split(",")] if args.sweep else [args.concurrency]
+    limits = httpx.Limits(max_connections=max(levels), max_keepalive_connections=max(levels))
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+        workload = Workload(client, mix, seed=args.seed)
+        await workload.seed()
+        reports: List[RunReport] = []
+        for level in levels:
+            report = await workload.run(level, args.duration)
+            print_report(report)
+            reports.append(report)
+            if args.sweep:
+                saturated, reason = find_saturation(reports, args.min_gain, args.latency_budget, args.max_error_rate)
+                if saturated:
+                    best = max(reports, key=lambda item: item.throughput)
+                    print(f"\nSaturation at concurrency {saturated.concurrency}: {reason}")
+                    print(f"Peak sustained throughput {best.throughput:.1f} req/s at concurrency {best.concurrency}")
+                    return 0
+    if args.sweep:
+        print("\nSaturation not reached; extend --sweep with higher concurrency levels")
+    return 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", help="target an already running server instead of starting one")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--sweep", help="comma separated concurrency levels, e.g. 1,2,4,8,16")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per concurrency level")
+    parser.add_argument("--mix", help=f"weighted endpoint mix, default {','.join(f'{k}={v}' for k, v in DEFAULT_MIX.items())}")
+    parser.add_argument("--timeout", type=float, default=30.0, help="client timeout in seconds")
+    parser.add_argument("--latency-budget", type=float, default=1.0, help="p99 budget in seconds for the sweep")
+    parser.add_argument("--min-gain", type=float, default=0.05, help="minimum throughput gain per sweep step")
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--seed", type=int, default=1234)
+    args = parser.parse_args(argv)
+
+    if args.base_url:
+        return asyncio.run(_drive(args, args.base_url))
+    with local_server(_free_port()) as base_url:
+        return asyncio.run(_drive(args, base_url))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
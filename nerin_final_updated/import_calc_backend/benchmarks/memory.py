@@ -0,0 +1,100 @@
+"""Memory and allocation footprint of ``CalculationResult``.
+
+Keeps ``--count`` results alive, the way grid and tier workloads do, and
+reports with ``tracemalloc`` the bytes each one retains and the number of
+live allocations. The compact slotted result is compared with the former
+dataclass holding ``breakdown``, ``totals`` and ``unitary`` dicts. Both sides share
+the same Decimal objects, so the difference is the container overhead alone.
+
+Usage (from ``import_calc_backend/``)::
+
+    python -m benchmarks.memory
+    python -m benchmarks.memory --count 50000 --quantities 1,3,12
+"""
+
+from __future__ import annotations
+
+import argparse
+import gc
+import sys
+import tracemalloc
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import Callable, Dict, List, Optional, Tuple
+
+from app.schemas import CalculationParameters
+from app.services.calculator import CalculationResult, calculate_import_cost
+
+from .payloads import base_payload
+
+
+@dataclass
+class LegacyResult:
+    """The result layout before the compact representation, kept as the baseline."""
+
+    breakdown: Dict[str, Decimal]
+    additional_taxes: List[Dict[str, Decimal]]
+    costo_puesto_ars: Decimal
+    precio_neto_ars: Decimal
+    precio_final_ars: Decimal
+    utilidad: Decimal
+    margen: Decimal
+    comision_mp: Decimal
+    iva_comision_mp: Decimal
+    mp_fee_total: Decimal
+    quantity: int
+    totals: Dict[str, Decimal]
+    unitary: Dict[str, Decimal]
+
+
+def _retained(build: Callable[[CalculationResult], object], sources: List[CalculationResult]) -> Tuple[int, int]:
+    """Bytes and allocations still alive after building one object per source."""
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    kept = [build(source) for source in sources]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    stats = after.compare_to(before, "filename")
+    size = sum(stat.size_diff for stat in stats)
+    blocks = sum(stat.count_diff for stat in stats)
+    del kept
+    return size, blocks
+
+
+def measure(count: int, quantities: List[int]) -> Dict[str, Dict[str, float]]:
+    params = [
+        CalculationParameters.model_validate(base_payload(quantity=quantities[index % len(quantities)]))
+        for index in range(min(count, len(quantities)))
+    ]
+    sources = [calculate_import_cost(params[index % len(params)]) for index in range(count)]
+    layouts = {
+        # ``tuple(list(...))`` so each compact result owns its values tuple, as a fresh one does.
+        "compact": lambda source: CalculationResult(tuple(list(source.values)), source.additional_taxes, source.quantity),
+        "legacy": lambda source: LegacyResult(**source.as_dict()),
+    }
+    report: Dict[str, Dict[str, float]] = {}
+    for name, build in layouts.items():
+        size, blocks = _retained(build, sources)
+        report[name] = {"bytes_per_result": size / count, "allocations_per_result": blocks / count}
+    return report
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=20000, help="results kept alive per layout")
+    parser.add_argument("--quantities", default="1,3", help="comma-separated quantities cycled through")
+    args = parser.parse_args(argv)
+
+    report = measure(args.count, [int(value) for value in args.quantities.split(",")])
+    print(f"{'layout':10s} {'bytes/result':>14s} {'allocations/result':>20s}")
+    for name, stats in report.items():
+        print(f"{name:10s} {stats['bytes_per_result']:14.1f} {stats['allocations_per_result']:20.2f}")
+    saved = 1 - report["compact"]["bytes_per_result"] / report["legacy"]["bytes_per_result"]
+    print(f"\ncompact layout retains {saved:.0%} fewer bytes per result")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
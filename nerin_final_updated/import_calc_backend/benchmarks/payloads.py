@@ -0,0 +1,27 @@
+"""Request payloads shared by the benchmark suite and the load test."""
+
+from __future__ import annotations
+
+
+def base_payload(**overrides) -> dict:
+    payload = {
+        "costs": {
+            "fob": {"amount": "100", "currency": "USD"},
+            "freight": {"amount": "5", "currency": "USD"},
+            "insurance": {"amount": "1", "currency": "USD"},
+        },
+        "tc_aduana": "980",
+        "di_rate": "0.08",
+        "apply_tasa_estadistica": True,
+        "iva_rate": "0.21",
+        "perc_iva_rate": "0.20",
+        "perc_ganancias_rate": "0.06",
+        "gastos_locales_ars": "8000",
+        "costos_salida_ars": "2500",
+        "mp_rate": "0.05",
+        "mp_iva_rate": "0.21",
+        "target": "margen",
+        "margen_objetivo": "0.25",
+    }
+    payload.update(overrides)
+    return payload
@@ -0,0 +1,127 @@
+"""Micro-benchmark runner with a stored JSON baseline and a regression gate.
+
+Usage (from ``import_calc_backend/``)::
+
+    python -m benchmarks.run --save benchmarks/baseline.json
+    python -m benchmarks.run --compare benchmarks/baseline.json --threshold 0.25
+
+``--compare`` exits with status 1 when any benchmark is slower than the
+baseline by more than ``threshold`` (a fraction, 0.25 = 25%).
+"""
+
+from __future__ import annotations
+
+import argparse
+import fnmatch
+import json
+import platform
+import statistics
+import sys
+import time
+import timeit
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "baseline.json"
+
+
+def measure(func, repeat: int, min_time: float) -> Dict[str, float]:
+    """Time ``func`` and return per-call statistics in microseconds."""
+
+    func()  # warm caches, lazy imports and the SQLite page cache
+    timer = timeit.Timer(func)
+    loops = 1
+    while True:
+        elapsed = timer.timeit(loops)
+        if elapsed >= min_time:
+            break
+        loops *= 10 if elapsed < min_time / 10 else 2
+    samples = [value / loops * 1e6 for value in timer.repeat(repeat=repeat, number=loops)]
+    return {
+        "min_us": min(samples),
+        "median_us": statistics.median(samples),
+        "max_us": max(samples),
+        "loops": loops,
+        "repeat": repeat,
+    }
+
+
+def run_suite(patterns: List[str], repeat: int, min_time: float) -> Dict[str, Dict[str, float]]:
+    from .cases import CASES
+
+    results: Dict[str, Dict[str, float]] = {}
+    for name, factory in CASES.items():
+        if patterns and not any(fnmatch.fnmatch(name, pattern) for pattern in patterns):
+            continue
+        stats = measure(factory(), repeat=repeat, min_time=min_time)
+        results[name] = stats
+        print(f"{name:45s} {stats['min_us']:12.2f} us  (median {stats['median_us']:.2f} us, {stats['loops']} loops)")
+    return results
+
+
+def compare(
+    current: Dict[str, Dict[str, float]],
+    baseline: Dict[str, Dict[str, float]],
+    threshold: float,
+) -> List[str]:
+    """Return a description of every benchmark slower than ``baseline * (1 + threshold)``.
+
+    The minimum sample is compared because it is the least sensitive to noise
+    from other processes on the machine.
+    """
+
+    regressions: List[str] = []
+    print()
+    print(f"{'benchmark':45s} {'baseline':>12s} {'current':>12s} {'change':>9s}")
+    for name, stats in current.items():
+        reference = baseline.get(name)
+        if reference is None:
+            print(f"{name:45s} {'-':>12s} {stats['min_us']:12.2f} {'new':>9s}")
+            continue
+        ratio = stats["min_us"] / reference["min_us"] - 1
+        flag = " REGRESSION" if ratio > threshold else ""
+        print(f"{name:45s} {reference['min_us']:12.2f} {stats['min_us']:12.2f} {ratio:+8.1%}{flag}")
+        if flag:
+            regressions.append(f"{name}: {reference['min_us']:.2f}us -> {stats['min_us']:.2f}us ({ratio:+.1%})")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-k", "--filter", action="append", default=[], help="fnmatch pattern selecting benchmarks")
+    parser.add_argument("--repeat", type=int, default=5, help="samples per benchmark")
+    parser.add_argument("--min-time", type=float, default=0.1, help="minimum seconds per sample")
+    parser.add_argument("--save", type=Path, nargs="?", const=DEFAULT_BASELINE, help="write results as a baseline")
+    parser.add_argument("--compare", type=Path, nargs="?", const=DEFAULT_BASELINE, help="baseline to compare against")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown before failing (0.25 = 25%%)")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    results = run_suite(args.filter, repeat=args.repeat, min_time=args.min_time)
+    print(f"\n{len(results)} benchmarks in {time.perf_counter() - started:.1f}s")
+
+    if args.save:
+        document = {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "machine": platform.platform(),
+            "benchmarks": results,
+        }
+        args.save.write_text(json.dumps(document, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+        print(f"Baseline written to {args.save}")
+
+    if args.compare:
+        baseline = json.loads(args.compare.read_text(encoding="utf-8"))["benchmarks"]
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} benchmark(s) regressed more than {args.threshold:.0%}:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print(f"\nNo regressions above {args.threshold:.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,54 @@
+import os
 import sys
+import tempfile
 from pathlib import Path
 
+import pytest
+
 ROOT = Path(__file__).resolve().parents[1]
 sys.path.append(str(ROOT))
+
+# The engine and the on-disk caches are bound when ``app`` modules are imported,
+# so API tests must point them at scratch locations before anything loads.
+_SCRATCH = Path(tempfile.mkdtemp(prefix="import-calc-tests-"))
+os.environ.setdefault("IMPORT_CALC_DATABASE_URL", "sqlite:///" + str(_SCRATCH / "test.db"))
+os.environ.setdefault("IMPORT_CALC_EXPORT_CACHE_DIR", str(_SCRATCH / "exports"))
+os.environ.setdefault("IMPORT_CALC_ARCHIVE_DIR", str(_SCRATCH / "archive"))
+os.environ.setdefault("IMPORT_CALC_STORE_IMPORT_DIR", str(_SCRATCH / "imports"))
+os.environ.setdefault("IMPORT_CALC_CACHE_PATH", str(_SCRATCH / "shared.sqlite3"))
+os.environ.setdefault("IMPORT_CALC_REPORTING_REPLICA_PATH", str(_SCRATCH / "replica" / "reporting.db"))
+
+
+@pytest.fixture
+def client():
+    from fastapi.testclient import TestClient
+
+    from app.main import app
+
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def make_params():
+    """Build ``CalculationParameters`` from a small base payload; an override of ``None`` drops the field."""
+
+    from app.schemas import CalculationParameters
+
+    base = {
+        "costs": {
+            "fob": {"amount": "100", "currency": "USD"},
+            "freight": {"amount": "5", "currency": "USD"},
+            "insurance": {"amount": "1", "currency": "USD"},
+        },
+        "tc_aduana": "980",
+        "di_rate": "0.08",
+        "target": "margen",
+        "margen_objetivo": "0.25",
+    }
+
+    def build(**overrides):
+        payload = {key: value for key, value in {**base, **overrides}.items() if value is not None}
+        return CalculationParameters.model_validate(payload)
+
+    return build
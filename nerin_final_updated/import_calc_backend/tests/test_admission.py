@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.api.admission import AdmissionController, AdmissionRejected, classify_request
+from app.main import app
+
+
+def _controller(**overrides) -> AdmissionController:
+    options = {
+        "total_limit": 3,
+        "webhook_reserved": 1,
+        "limits": {"webhook": 2, "default": 2, "export": 1, "batch": 1},
+        "queue_sizes": {"webhook": 4, "default": 4, "export": 1, "batch": 1},
+        "queue_timeout": 0.5,
+    }
+    options.update(overrides)
+    return AdmissionController(**options)
+
+
+def test_routes_are_classified():
+    assert classify_request("POST", "/api/payments/notify") == "webhook"
+    assert classify_request("GET", "/api/calculations/7/export") == "export"
+    assert classify_request("GET", "/api/reports/calculations") == "export"
+    assert classify_request("POST", "/api/reports/replica/refresh") == "batch"
+    assert classify_request("POST", "/api/presets/compare") == "batch"
+    assert classify_request("GET", "/api/calculations/7") == "default"
+    assert classify_request("GET", "/api/metrics/admission") is None
+    assert classify_request("GET", "/health") is None
+
+
+def test_full_queue_is_rejected_with_429_and_retry_after():
+    async def scenario():
+        controller = _controller()
+        await controller.acquire("export")
+        waiter = asyncio.create_task(controller.acquire("export"))
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as rejected:
+            await controller.acquire("export")
+        assert rejected.value.status_code == 429
+        assert rejected.value.retry_after >= 1
+
+        controller.release("export", 0.01)
+        await waiter
+        snapshot = controller.snapshot()["classes"]["export"]
+        assert snapshot["active"] == 1 and snapshot["queued"] == 0
+        assert snapshot["admitted"] == 2 and snapshot["rejected_queue_full"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_queue_timeout_is_rejected_with_503():
+    async def scenario():
+        controller = _controller(queue_timeout=0.05)
+        await controller.acquire("batch")
+        with pytest.raises(AdmissionRejected) as rejected:
+            await controller.acquire("batch")
+        assert rejected.value.status_code == 503
+        assert controller.snapshot()["classes"]["batch"]["queued"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_webhooks_use_reserved_slot_and_jump_the_queue():
+    async def scenario():
+        controller = _controller()
+        await controller.acquire("default")
+        await controller.acquire("default")
+        # The last shared slot is reserved for webhooks.
+        await asyncio.wait_for(controller.acquire("webhook"), 0.1)
+
+        order = []
+
+        async def wait_for(name):
+            await controller.acquire(name)
+            order.append(name)
+
+        default = asyncio.create_task(wait_for("default"))
+        await asyncio.sleep(0)
+        webhook = asyncio.create_task(wait_for("webhook"))
+        await asyncio.sleep(0)
+
+        controller.release("webhook")
+        await asyncio.wait_for(webhook, 0.1)
+        assert order == ["webhook"]
+        controller.release("default")
+        controller.release("webhook")
+        await asyncio.wait_for(default, 0.1)
+        assert order == ["webhook", "default"]
+
+    asyncio.run(scenario())
+
+
+def test_metrics_endpoint_exposes_counters():
+    with TestClient(app) as client:
+        client.get("/api/presets")
+        body = client.get("/api/metrics/admission").json()
+    assert set(body["classes"]) == {"webhook", "default", "export", "batch"}
+    assert body["classes"]["default"]["admitted"] >= 1
+    assert body["active"] == 0
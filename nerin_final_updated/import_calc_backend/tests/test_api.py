@@ -0,0 +1,209 @@
+from __future__ import annotations
+
+from decimal import Decimal
+
+import pytest
+
+from app.services import notifications
+from app.storage.database import get_session
+from app.storage.models import Calculation
+
+
+@pytest.fixture
+def payload() -> dict:
+    return {
+        "parameters": {
+            "costs": {
+                "fob": {"amount": "100", "currency": "USD"},
+                "freight": {"amount": "5", "currency": "USD"},
+                "insurance": {"amount": "1", "currency": "USD"},
+            },
+            "tc_aduana": "980",
+            "di_rate": "0.08",
+            "gastos_locales_ars": "8000",
+            "costos_salida_ars": "2500",
+            "mp_rate": "0.05",
+            "target": "margen",
+            "margen_objetivo": "0.25",
+            "order_reference": "API-TEST-1",
+        }
+    }
+
+
+def test_create_returns_decimals_as_strings(client, payload):
+    response = client.post("/api/calculations", json=payload)
+    assert response.status_code == 200
+    body = response.json()
+    assert body["results"]["margen"] == "0.2500"
+    assert body["results"]["breakdown"]["Tasa_Estadistica_USD"] == "3.1800"
+    assert body["parameters"]["tc_aduana"] == "980"
+
+
+def test_get_reuses_stored_json(client, payload):
+    created = client.post("/api/calculations", json=payload).json()
+    response = client.get(f"/api/calculations/{created['calculation_id']}")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/json"
+    assert response.json() == created
+
+
+def test_get_missing_calculation_returns_404(client):
+    assert client.get("/api/calculations/999999").status_code == 404
+
+
+def test_payment_notification_updates_results(client, payload):
+    created = client.post("/api/calculations", json=payload).json()
+    response = client.post(
+        "/api/payments/notify",
+        json={
+            "payment_id": "api-test-payment-1",
+            "order_reference": "API-TEST-1",
+            "amount": created["results"]["precio_neto_ars"],
+            "currency": "ARS",
+            "fee_total": "1000",
+        },
+    )
+    assert response.status_code == 200
+    updated = client.get(f"/api/calculations/{response.json()['calculation_id']}").json()
+    assert updated["results"]["breakdown"]["MP_Fee_Total_ARS"] == "1000.00"
+
+
+def test_real_fee_keeps_a_concurrent_revision_bump(client, payload, monkeypatch):
+    payload["parameters"]["order_reference"] = "API-REVISION-1"
+    calculation_id = client.post("/api/calculations", json=payload).json()["calculation_id"]
+    calculate = notifications.calculate_import_cost
+
+    def racing_calculate(*args, **kwargs):
+        # Another worker applies its own update while this one is still computing.
+        with get_session() as session:
+            session.get(Calculation, calculation_id).revision += 1
+            session.commit()
+        return calculate(*args, **kwargs)
+
+    monkeypatch.setattr(notifications, "calculate_import_cost", racing_calculate)
+    updated = notifications.apply_real_fee_to_calculation("API-REVISION-1", Decimal("1000"))
+    assert updated.revision == 3
+    assert updated.results["breakdown"]["MP_Fee_Total_ARS"] == "1000.00"
+
+
+def test_conditional_get_returns_304_until_real_fee_applied(client, payload):
+    payload["parameters"]["order_reference"] = "API-ETAG-1"
+    created = client.post("/api/calculations", json=payload)
+    calculation_id = created.json()["calculation_id"]
+    etag = created.headers["etag"]
+
+    first = client.get(f"/api/calculations/{calculation_id}")
+    assert first.headers["etag"] == etag
+    # gzip and identity bodies share the validator, so it must be weak.
+    assert etag.startswith('W/"')
+    identity = client.get(f"/api/calculations/{calculation_id}", headers={"Accept-Encoding": "identity"})
+    assert identity.headers["etag"] == etag
+    assert client.get(f"/api/calculations/{calculation_id}", headers={"If-None-Match": etag}).status_code == 304
+    strong_form = etag.removeprefix("W/")
+    assert client.get(f"/api/calculations/{calculation_id}", headers={"If-None-Match": strong_form}).status_code == 304
+
+    client.post(
+        "/api/payments/notify",
+        json={
+            "payment_id": "api-etag-payment-1",
+            "order_reference": "API-ETAG-1",
+            "amount": "1",
+            "currency": "ARS",
+            "fee_total": "1000",
+        },
+    )
+    refreshed = client.get(f"/api/calculations/{calculation_id}", headers={"If-None-Match": etag})
+    assert refreshed.status_code == 200
+    assert refreshed.headers["etag"] != etag
+
+
+def test_export_etag_is_per_format(client, payload):
+    calculation_id = client.post("/api/calculations", json=payload).json()["calculation_id"]
+    csv_response = client.get(f"/api/calculations/{calculation_id}/export", params={"format": "csv"})
+    etag = csv_response.headers["etag"]
+    url = f"/api/calculations/{calculation_id}/export"
+    assert client.get(url, params={"format": "csv"}, headers={"If-None-Match": etag}).status_code == 304
+    assert client.get(url, params={"format": "xlsx"}, headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_large_json_bodies_are_gzipped(client, payload):
+    response = client.post("/api/calculations", json=payload, headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+
+
+def test_export_served_from_cache_and_invalidated_by_real_fee(client, payload):
+    from app.services.export_cache import get_export_cache
+
+    payload["parameters"]["order_reference"] = "API-EXPORT-1"
+    calculation_id = client.post("/api/calculations", json=payload).json()["calculation_id"]
+    url = f"/api/calculations/{calculation_id}/export"
+    first = client.get(url, params={"format": "xlsx"})
+    assert first.status_code == 200
+    assert get_export_cache().get(calculation_id, 1, "xlsx") is not None
+    assert client.get(url, params={"format": "xlsx"}).content == first.content
+
+    client.post(
+        "/api/payments/notify",
+        json={
+            "payment_id": "api-export-payment-1",
+            "order_reference": "API-EXPORT-1",
+            "amount": "1",
+            "currency": "ARS",
+            "fee_total": "1000",
+        },
+    )
+    assert get_export_cache().get(calculation_id, 1, "xlsx") is None
+    assert "MP_Fee_Total_ARS,1000.00" in client.get(url, params={"format": "csv"}).text
+
+
+def test_compare_presets_ranks_and_matches_full_calculation(client, payload):
+    from decimal import Decimal
+
+    from app.schemas import CalculationParameters
+    from app.services.calculator import calculate_import_cost
+    from app.services.presets import get_preset
+
+    base = payload["parameters"]
+    shared = {key: value for key, value in base.items() if key not in ("costs", "tc_aduana")}
+    client.post("/api/presets", json={"name": "Compare-Invalid", "parameters": {"di_rate": "2"}})
+    names = ["Pantallas-Importadas", "Baterias-NCM8507", "Compare-Invalid"]
+    response = client.post(
+        "/api/presets/compare",
+        json={"costs": base["costs"], "tc_aduana": base["tc_aduana"], "parameters": shared, "preset_names": names},
+    )
+    assert response.status_code == 200
+    body = response.json()
+    assert body["cif"]["CIF_USD"] == "106.0000"
+    assert [item["preset_name"] for item in body["skipped"]] == ["Compare-Invalid"]
+
+    rows = body["results"]
+    assert [row["rank"] for row in rows] == [1, 2]
+    prices = [Decimal(row["precio_final_ars"]) for row in rows]
+    assert prices == sorted(prices)
+    for row in rows:
+        preset = get_preset(row["preset_name"])
+        merged = {**shared, **preset.parameters, "costs": base["costs"], "tc_aduana": base["tc_aduana"]}
+        expected = calculate_import_cost(CalculationParameters.model_validate(merged))
+        assert row["precio_final_ars"] == str(expected.precio_final_ars)
+        assert row["margen"] == str(expected.margen)
+        assert row["tributos_ars"]["DI_ARS"] == str(expected.breakdown["DI_ARS"])
+
+
+def test_tiers_endpoint_returns_every_breakpoint(client, payload):
+    response = client.post(
+        "/api/calculations/tiers",
+        json={**payload, "tiers": {"quantities": [100, 1, 5, 10, 50]}},
+    )
+    assert response.status_code == 200
+    body = response.json()
+    assert [tier["quantity"] for tier in body["tiers"]] == [1, 5, 10, 50, 100]
+    assert body["per_shipment"] == ["freight", "insurance", "gastos_locales_ars", "additional_taxes_ars"]
+
+    invalid = client.post("/api/calculations/tiers", json={**payload, "tiers": {"quantities": [0]}})
+    assert invalid.status_code == 422
+
+    costs = {**payload["parameters"]["costs"], "fob": {"amount": "1e999990", "currency": "USD"}}
+    huge = {**payload["parameters"], "costs": costs}
+    overflow = client.post("/api/calculations/tiers", json={"parameters": huge, "tiers": {"quantities": [1, 10]}})
+    assert overflow.status_code == 422
+    assert overflow.json()["detail"].startswith("Calculation failed")
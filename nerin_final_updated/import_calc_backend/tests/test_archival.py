@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+import gzip
+import json
+from datetime import datetime, timedelta
+
+from sqlalchemy import update
+from sqlmodel import create_engine
+
+from app.services import archival
+from app.services.archival import archive_old_rows, find_archived_by_order_reference, run_maintenance
+from app.storage.archive import ArchiveSegmentStore
+from app.storage import database
+from app.storage.database import engine, get_session
+from app.storage.models import Calculation, PaymentNotification
+from app.utils.serialization import dumps_json
+
+
+def _payload(order_reference: str) -> dict:
+    return {
+        "parameters": {
+            "costs": {
+                "fob": {"amount": "100", "currency": "USD"},
+                "freight": {"amount": "5", "currency": "USD"},
+                "insurance": {"amount": "1", "currency": "USD"},
+            },
+            "tc_aduana": "980",
+            "di_rate": "0.08",
+            "mp_rate": "0.05",
+            "target": "precio",
+            "precio_neto_input_ars": "250000",
+            "order_reference": order_reference,
+        }
+    }
+
+
+def _notify(client, payment_id: str, order_reference=None) -> None:
+    body = {"payment_id": payment_id, "amount": "250000", "currency": "ARS", "fee_total": "1000"}
+    if order_reference:
+        body["order_reference"] = order_reference
+    client.post("/api/payments/notify", json=body).raise_for_status()
+
+
+def _age(model, column, ids, days: int) -> None:
+    with get_session() as session:
+        aged = datetime.utcnow() - timedelta(days=days)
+        session.exec(update(model).where(model.id.in_(ids)).values({column: aged}))
+        session.commit()
+
+
+def test_segment_store_appends_members_and_rotates(tmp_path):
+    store = ArchiveSegmentStore(tmp_path, max_segment_bytes=1)
+    first = store.append("calculations", [{"id": 1}, {"id": 2}], dumps_json)
+    second = store.append("calculations", [{"id": 3}], dumps_json)
+
+    assert first[0] == "calculations/segment-000001.ndjson.gz"
+    assert second[0] == "calculations/segment-000002.ndjson.gz"
+    assert [record["id"] for record in store.read(*first)] == [1, 2]
+    assert [record["id"] for record in store.read(*second)] == [3]
+
+    store.max_segment_bytes = 1 << 20
+    third = store.append("calculations", [{"id": 4}], dumps_json)
+    assert third[0] == second[0] and third[1] == second[2]
+    # Concatenated members still read as one gzip stream.
+    lines = gzip.decompress((tmp_path / third[0]).read_bytes()).splitlines()
+    assert [json.loads(line)["id"] for line in lines] == [3, 4]
+
+
+def test_archived_calculation_is_served_transparently(client):
+    old = client.post("/api/calculations", json=_payload("ARCH-1")).json()
+    _notify(client, "arch-pay-1", "ARCH-1")
+    live = client.post("/api/calculations", json=_payload("ARCH-2")).json()
+    _notify(client, "arch-pay-2", "ARCH-2")
+    _age(Calculation, "created_at", [old["calculation_id"]], days=400)
+    before = client.get(f"/api/calculations/{old['calculation_id']}")
+    etag = before.headers["etag"]
+    with get_session() as session:
+        notification = session.exec(
+            PaymentNotification.__table__.select().where(PaymentNotification.payment_id == "arch-pay-1")
+        ).first()
+    _age(PaymentNotification, "received_at", [notification.id], days=400)
+
+    moved = archive_old_rows(timedelta(days=365))
+    assert moved["calculations"] >= 1 and moved["payment_notifications"] >= 1
+    with get_session() as session:
+        assert session.get(Calculation, old["calculation_id"]) is None
+        assert session.get(Calculation, live["calculation_id"]) is not None
+
+    after = client.get(f"/api/calculations/{old['calculation_id']}")
+    assert after.status_code == 200
+    assert after.json() == before.json()
+    assert after.headers["etag"] == etag
+    assert client.get(f"/api/calculations/{old['calculation_id']}", headers={"If-None-Match": etag}).status_code == 304
+    export = client.get(f"/api/calculations/{old['calculation_id']}/export", params={"format": "csv"})
+    assert export.status_code == 200 and b"MP_Fee_Total_ARS" in export.content
+
+    archived = find_archived_by_order_reference("ARCH-1")
+    assert [record["id"] for record in archived["calculations"]] == [old["calculation_id"]]
+    assert [record["payment_id"] for record in archived["payment_notifications"]] == ["arch-pay-1"]
+
+    # Redelivering an archived payment is still idempotent.
+    _notify(client, "arch-pay-1")
+    with get_session() as session:
+        live_rows = session.exec(
+            PaymentNotification.__table__.select().where(PaymentNotification.payment_id == "arch-pay-1")
+        ).all()
+    assert live_rows == []
+
+
+def test_newest_row_is_never_archived(client):
+    created = client.post("/api/calculations", json=_payload("ARCH-NEWEST")).json()
+    _age(Calculation, "created_at", [created["calculation_id"]], days=400)
+
+    archive_old_rows(timedelta(days=365))
+    with get_session() as session:
+        assert session.get(Calculation, created["calculation_id"]) is not None
+
+
+def test_maintenance_runs_incremental_vacuum(client):
+    with engine.connect() as connection:
+        assert connection.exec_driver_sql("PRAGMA auto_vacuum").scalar() == 2
+    report = run_maintenance(timedelta(days=365), vacuum_pages=100)
+    assert report["skipped"] is False
+    assert report["released_pages"] >= 0
+
+
+def test_existing_database_is_only_vacuumed_on_request(tmp_path, monkeypatch, capsys):
+    legacy = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with legacy.connect() as connection:
+        connection.exec_driver_sql("CREATE TABLE legacy (id INTEGER PRIMARY KEY)")
+        connection.commit()
+    monkeypatch.setattr(database, "engine", legacy)
+    monkeypatch.setattr(archival, "run_maintenance", lambda older_than, vacuum_pages: {"skipped": False})
+
+    database.init_db()  # startup never rewrites an existing file
+    with legacy.connect() as connection:
+        assert connection.exec_driver_sql("PRAGMA auto_vacuum").scalar() == 0
+
+    archival.main(["--enable-incremental-vacuum"])
+    assert json.loads(capsys.readouterr().out)["converted_to_incremental"] is True
+    with legacy.connect() as connection:
+        assert connection.exec_driver_sql("PRAGMA auto_vacuum").scalar() == 2
+    assert database.enable_incremental_vacuum() is False
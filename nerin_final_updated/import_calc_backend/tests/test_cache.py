@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+import multiprocessing
+
+import pytest
+
+from app.services.presets import get_preset
+from app.storage.cache import MemoryCache, SQLiteCache, get_cache
+from app.storage.database import get_session
+from app.storage.models import Preset
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def cache(request, tmp_path):
+    if request.param == "memory":
+        return MemoryCache(max_bytes=1000)
+    return SQLiteCache(tmp_path / "cache.sqlite3", max_bytes=1000)
+
+
+def test_generations_retire_entries_and_budget_is_kept(cache):
+    cache.set_json("results", "a", {"precio": "10.50"})
+    assert cache.get_json("results", "a") == {"precio": "10.50"}
+
+    # A value computed before an invalidation is not served after it.
+    before = cache.generation("results")
+    assert cache.invalidate("results") == before + 1
+    assert cache.get("results", "a") is None
+    cache.set("results", "late", b"old", generation=before)
+    assert cache.get("results", "late") is None
+    cache.set("results", "a", b"new")
+    assert cache.get("results", "a") == b"new"
+    cache.delete("results", "a")
+    assert cache.get("results", "a") is None
+
+    for index in range(40):
+        cache.set("exports", str(index), bytes(100))
+    if isinstance(cache, SQLiteCache):
+        cache.evict()
+    assert cache.stats()["bytes"] <= 1000
+    assert cache.get("exports", "39") == bytes(100)
+    assert cache.get("exports", "0") is None
+
+
+def _write_from_other_process(path: str) -> None:
+    other = SQLiteCache(path, max_bytes=1000)
+    other.set("presets", "all", b"from-child")
+    other.invalidate("results")
+
+
+def test_sqlite_cache_is_shared_across_processes(tmp_path):
+    path = tmp_path / "shared.sqlite3"
+    cache = SQLiteCache(path, max_bytes=1000)
+    cache.set("results", "a", b"parent")
+
+    process = multiprocessing.get_context("fork").Process(target=_write_from_other_process, args=(str(path),))
+    process.start()
+    process.join(30)
+    assert process.exitcode == 0
+
+    assert cache.get("presets", "all") == b"from-child"
+    assert cache.generation("results") == 1
+    assert cache.get("results", "a") is None
+
+
+def test_presets_use_the_shared_cache(client):
+    assert get_preset("Shared-Cache") is None
+    # Another worker creates a preset: the row plus a generation bump.
+    with get_session() as session:
+        session.add(Preset(name="Shared-Cache", parameters={"di_rate": "0.12"}))
+        session.commit()
+    assert get_preset("Shared-Cache") is None
+    get_cache().invalidate("presets")
+    assert get_preset("Shared-Cache").parameters == {"di_rate": "0.12"}
+    assert client.get("/api/metrics/cache").json()["backend"] == get_cache().name
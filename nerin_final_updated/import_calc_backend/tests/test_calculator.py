@@ -5,7 +5,7 @@ from decimal import Decimal
 import pytest
 
 from app.schemas import AdditionalTaxInput, CalculationParameters, CostBreakdownInput, MoneyInput, RoundingRule
-from app.services.calculator import calculate_import_cost
+from app.services.calculator import BREAKDOWN_KEYS, CalculationResult, calculate_import_cost
 
 
 @pytest.fixture
@@ -80,3 +80,24 @@ def test_additional_taxes_and_rounding(base_parameters):
     assert any(tax["name"] == "Imp Interno" for tax in result.additional_taxes)
     assert result.precio_neto_ars % Decimal("10") != 0  # due to psychological ending
 
+
+def test_compact_result_views(base_parameters):
+    params = CalculationParameters(**{**base_parameters, "quantity": 4})
+    result = calculate_import_cost(params)
+
+    assert not hasattr(result, "__dict__")
+    assert list(result.breakdown) == list(BREAKDOWN_KEYS)
+    assert result["DI_ARS"] == result.breakdown["DI_ARS"]
+    assert result["utilidad_total"] == result.totals["utilidad_total"] == result.utilidad * 4
+    assert result["precio_neto_unitario"] == result.unitary["precio_neto_unitario"] == result.precio_neto_ars
+
+    # Views are fresh dicts: mutating one leaves the result untouched.
+    view = result.breakdown
+    view["DI_ARS"] = Decimal("0")
+    assert result.breakdown["DI_ARS"] != Decimal("0")
+
+    same = calculate_import_cost(params)
+    assert same == result and repr(same) == repr(result)
+    assert CalculationResult(result.values, result.additional_taxes, 5) != result
+    with pytest.raises(KeyError):
+        result["unknown"]
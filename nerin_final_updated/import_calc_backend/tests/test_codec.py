@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import json
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import event
+from sqlmodel import select
+
+from app.storage.codec import CodecError, decode, decode_json, encode
+from app.storage import database
+from app.storage.database import compact_json_columns, engine, get_session
+from app.storage.models import Calculation, PaymentNotification
+from app.utils.serialization import dumps_json
+
+PAYLOAD = {
+    "parameters": {
+        "costs": {
+            "fob": {"amount": "100", "currency": "USD"},
+            "freight": {"amount": "5", "currency": "USD"},
+            "insurance": {"amount": "1", "currency": "USD"},
+        },
+        "tc_aduana": "980",
+        "di_rate": "0.08",
+        "target": "margen",
+        "margen_objetivo": "0.25",
+        "order_reference": "CODEC-1",
+    }
+}
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        {"precio_neto_ars": Decimal("251398.75"), "margen": Decimal("0.2500"), "big": Decimal("-1E+30")},
+        {"quantity": 3, "ratio": 0.1, "flag": True, "none": None, "nan": Decimal("NaN"), "zero": Decimal("-0")},
+        # Numeric-looking strings are only packed when they render back identically.
+        {"order_reference": "00123", "code": "8471.30", "exp": "1e5", "plain": "123", "tax": "Ñandú ✓"},
+        {"additional_taxes": [{"name": "II", "base": "CIF", "rate": "0.1"}], "empty": {}, "list": []},
+    ],
+)
+def test_round_trip_matches_the_json_view(value):
+    blob = encode(value)
+
+    assert decode(blob) == json.loads(dumps_json(value))
+    assert decode_json(blob) == dumps_json(value)
+
+
+def test_blobs_are_much_smaller_and_reject_garbage(client):
+    created = client.post("/api/calculations", json=PAYLOAD).json()
+    for column in ("parameters", "results"):
+        assert len(encode(created[column])) * 3 < len(dumps_json(created[column]))
+
+    with pytest.raises(CodecError):
+        decode(encode(created["results"])[:40])
+    with pytest.raises(CodecError, match="version"):
+        decode(b"\x07\x00")
+
+
+def test_legacy_json_rows_read_transparently_and_migrate(client):
+    created = client.post("/api/calculations", json=PAYLOAD).json()
+    calculation_id = created["calculation_id"]
+    with engine.begin() as connection:
+        connection.exec_driver_sql(
+            "UPDATE calculations SET parameters = ?, results = ? WHERE id = ?",
+            (dumps_json(created["parameters"]), dumps_json(created["results"]), calculation_id),
+        )
+
+    assert client.get(f"/api/calculations/{calculation_id}").json() == created
+    assert compact_json_columns(batch_size=2)["calculations"] >= 1
+    assert compact_json_columns()["calculations"] == 0
+
+    with engine.connect() as connection:
+        kinds = connection.exec_driver_sql(
+            "SELECT typeof(parameters), typeof(results) FROM calculations WHERE id = ?", (calculation_id,)
+        ).one()
+    assert kinds == ("blob", "blob")
+    assert client.get(f"/api/calculations/{calculation_id}").json() == created
+    with get_session() as session:
+        assert session.get(Calculation, calculation_id).results["margen"] == "0.2500"
+
+
+def test_startup_refuses_unconverted_columns(monkeypatch):
+    # SQLite stores blobs in any column; on PostgreSQL only the maintenance CLI alters the types.
+    assert database.convert_compact_columns() == []
+    monkeypatch.setattr(database, "_unconverted_compact_columns", lambda: ["calculations.results"])
+    with pytest.raises(RuntimeError, match="calculations.results"):
+        database.init_db()
+
+
+def test_raw_payload_is_loaded_only_on_access(client):
+    body = {
+        "payment_id": "codec-pay-1",
+        "amount": "1000",
+        "currency": "ARS",
+        "fee_total": "50",
+        "fee_breakdown": {"mercadopago_fee": "41.32", "financing_fee": "8.68"},
+        "raw_payload": {"action": "payment.created", "data": {"id": "codec-pay-1"}, "live_mode": False},
+    }
+    assert client.post("/api/payments/notify", json=body).status_code == 200
+
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        with get_session() as session:
+            notification = session.exec(
+                select(PaymentNotification).where(PaymentNotification.payment_id == "codec-pay-1")
+            ).one()
+            assert notification.fee_breakdown == {"mercadopago_fee": "41.32", "financing_fee": "8.68"}
+            assert "raw_payload" not in statements[-1]
+            assert notification.raw_payload == body["raw_payload"]
+            assert "raw_payload" in statements[-1]
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+from datetime import date
+from decimal import Decimal
+
+import pytest
+from pydantic import ValidationError
+
+from app.schemas import CalculationParameters
+from app.services.calculator import calculate_import_cost
+from app.services.exchange_rates import (
+    CrossRateMatrix,
+    ExchangeRateImportError,
+    RateSeries,
+    cross_rates_as_of,
+    import_csv,
+    rate_as_of,
+)
+
+WIDE_CSV = b"""fecha;aduana;mep
+02/05/2024;880,50;1050
+03/05/2024;882;
+06/05/2024;884,25;1062
+"""
+
+
+def test_series_bisects_to_latest_observation_on_or_before_day():
+    series = RateSeries()
+    series.ordinals = [date(2024, 5, 2).toordinal(), date(2024, 5, 6).toordinal()]
+
+    assert series.as_of(date(2024, 5, 1)) is None
+    assert series.as_of(date(2024, 5, 2)) == 0
+    assert series.as_of(date(2024, 5, 5)) == 0
+    assert series.as_of(date(2030, 1, 1)) == 1
+
+
+def test_wide_csv_resolves_parameters_as_of_a_date(client, make_params):
+    assert import_csv(WIDE_CSV)["loaded"] == 5
+
+    # Saturday falls back to Friday; the MEP blank on the 3rd falls back to the 2nd.
+    assert rate_as_of("aduana", date(2024, 5, 4)).rate == Decimal("882")
+    assert rate_as_of("MEP", date(2024, 5, 3)).rate_date == date(2024, 5, 2)
+    assert rate_as_of("aduana", date(2024, 5, 1)) is None
+
+    params = make_params(tc_aduana=None, tc_aduana_source_key="aduana", tc_aduana_date="2024-05-05")
+    assert params.tc_aduana == Decimal("882")
+    assert params.tc_aduana_rate_date == date(2024, 5, 3)
+
+    # A literal rate still wins, so stored parameters re-validate unchanged.
+    assert make_params(tc_aduana="990", tc_aduana_source_key="aduana").tc_aduana == Decimal("990")
+    with pytest.raises(ValidationError, match="No 'aduana' exchange rate"):
+        make_params(tc_aduana=None, tc_aduana_source_key="aduana", tc_aduana_date="2020-01-01")
+    with pytest.raises(ValidationError, match="tc_aduana is required"):
+        make_params(tc_aduana=None)
+
+
+def test_long_and_single_layouts_and_corrections(client):
+    import_csv(b"source_key,date,rate\nblue,2024-05-02,1100\nblue,2024-05-03,1110\n")
+    import_csv(b"fecha,tc\n2024-05-03,1115\n", source_key="blue")
+
+    assert rate_as_of("blue", date(2024, 5, 3)).rate == Decimal("1115")
+    with pytest.raises(ExchangeRateImportError, match="Row 3"):
+        import_csv(b"fecha,tarjeta\n2024-05-02,1200\n2024-05-03,-1\n")
+    assert rate_as_of("tarjeta", date(2024, 5, 2)) is None
+
+
+def test_api_import_lookup_and_calculation(client, make_params):
+    files = {"file": ("tc.csv", b"fecha,tc\n2024-06-03,900\n2024-06-10,905.5\n", "text/csv")}
+    response = client.post("/api/exchange-rates/import", params={"source_key": "oficial"}, files=files)
+    assert response.status_code == 200
+    assert response.json()["loaded"] == 2
+
+    assert client.get("/api/exchange-rates/oficial", params={"date": "2024-06-09"}).json() == {
+        "source_key": "oficial",
+        "rate_date": "2024-06-03",
+        "rate": "900",
+    }
+    assert client.get("/api/exchange-rates/oficial", params={"date": "2024-01-01"}).status_code == 404
+    assert client.get("/api/exchange-rates").json()["oficial"] == 2
+
+    params = make_params(tc_aduana=None, tc_aduana_source_key="oficial", tc_aduana_date="2024-06-10")
+    payload = params.model_dump(mode="json")
+    payload.pop("tc_aduana")
+    body = client.post("/api/calculations", json={"parameters": payload}).json()
+    assert body["parameters"]["tc_aduana"] == "905.5"
+    assert body["parameters"]["tc_aduana_rate_date"] == "2024-06-10"
+
+
+def test_cross_rate_matrix_chains_and_inverts_quotes():
+    quotes = {("eur", "usd"): Decimal("1.08"), ("usd", "cny"): Decimal("7.2"), ("cny", "usd"): Decimal("0.14")}
+    matrix = CrossRateMatrix.from_quotes(date(2024, 7, 1), quotes)
+
+    assert matrix.rate("EUR", "CNY") == Decimal("1.08") * Decimal("7.2")
+    assert matrix.rate("usd", "eur") == Decimal(1) / Decimal("1.08")
+    # A direct quote wins over the inverse of the opposite pair.
+    assert matrix.rate("CNY", "USD") == Decimal("0.14")
+    assert matrix.rate("EUR", "EUR") == Decimal(1)
+    assert matrix.currencies() == ["cny", "eur", "usd"]
+    with pytest.raises(ValueError, match="No EUR/BRL"):
+        matrix.rate("EUR", "BRL")
+
+
+def test_costs_and_fixed_taxes_in_any_currency(client, make_params):
+    import_csv(b"fecha,fx.eur_usd,fx.usd_cny\n2024-07-01,1.08,8\n2024-07-03,1.10,8\n")
+    day = date(2024, 7, 2)
+    # Every request for the same day reads one precomputed matrix.
+    assert cross_rates_as_of(day) is cross_rates_as_of(day)
+
+    params = make_params(
+        costs={
+            "fob": {"amount": "800", "currency": "cny"},
+            "freight": {"amount": "50", "currency": "EUR"},
+            "insurance": {"amount": "980", "currency": "ARS"},
+        },
+        tc_aduana="980",
+        fx_date="2024-07-02",
+        additional_taxes=[{"name": "Tasa EUR", "base": "ARS", "amount": {"amount": "10", "currency": "EUR"}}],
+    )
+    assert params.fx_rates == {"CNY": Decimal("0.125"), "EUR": Decimal("1.08")}
+    result = calculate_import_cost(params)
+    assert result["FOB_USD"] == Decimal("100.0000")
+    assert result["Freight_USD"] == Decimal("54.0000")
+    assert result["Insurance_USD"] == Decimal("1.0000")
+    assert result.additional_taxes[0]["amount_ars"] == Decimal("10584.00")
+
+    # Stored rates win on re-validation, even after newer quotes are loaded.
+    stored = params.model_dump(mode="json")
+    assert CalculationParameters.model_validate({**stored, "fx_date": "2024-07-05"}).fx_rates == params.fx_rates
+
+    body = client.get("/api/exchange-rates/cross-rates", params={"date": "2024-07-05"}).json()
+    assert body["date"] == "2024-07-05"
+    assert body["rates"]["EUR"]["CNY"] == "8.80"
+    with pytest.raises(ValidationError, match="No BRL/USD exchange rate"):
+        make_params(tc_aduana="980", costs={**stored["costs"], "fob": {"amount": "1", "currency": "BRL"}})
+    with pytest.raises(ValidationError, match="Invalid ISO 4217"):
+        make_params(tc_aduana="980", costs={**stored["costs"], "fob": {"amount": "1", "currency": "EURO"}})
@@ -0,0 +1,67 @@
+from __future__ import annotations
+
+from app.services.export_cache import ExportArtifactCache
+
+
+def test_get_returns_stored_artifact(tmp_path):
+    cache = ExportArtifactCache(tmp_path, max_bytes=1024)
+    assert cache.get(1, 1, "csv") is None
+    path = cache.put(1, 1, "csv", b"Concepto,Valor\n")
+    assert cache.get(1, 1, "csv") == path
+    assert path.read_bytes() == b"Concepto,Valor\n"
+    assert cache.get(1, 2, "csv") is None
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = ExportArtifactCache(tmp_path, max_bytes=250)
+    cache.put(1, 1, "csv", b"a" * 100)
+    cache.put(2, 1, "csv", b"b" * 100)
+    cache.get(1, 1, "csv")
+    cache.put(3, 1, "csv", b"c" * 100)
+    assert cache.get(2, 1, "csv") is None
+    assert cache.get(1, 1, "csv") is not None
+    assert cache.total_bytes == 200
+
+
+def test_invalidate_drops_every_revision_and_format(tmp_path):
+    cache = ExportArtifactCache(tmp_path, max_bytes=1024)
+    cache.put(7, 1, "csv", b"x")
+    cache.put(7, 2, "xlsx", b"y")
+    cache.put(70, 1, "csv", b"z")
+    assert cache.invalidate(7) == 2
+    assert cache.get(7, 2, "xlsx") is None
+    assert cache.get(70, 1, "csv") is not None
+
+
+def test_index_is_rebuilt_from_disk(tmp_path):
+    ExportArtifactCache(tmp_path, max_bytes=1024).put(5, 3, "xlsx", b"data")
+    reopened = ExportArtifactCache(tmp_path, max_bytes=1024)
+    assert reopened.total_bytes == 4
+    assert reopened.get(5, 3, "xlsx") is not None
+
+
+def test_open_handle_survives_eviction(tmp_path):
+    cache = ExportArtifactCache(tmp_path, max_bytes=150)
+    cache.put(1, 1, "csv", b"a" * 100)
+    handle = cache.open(1, 1, "csv")
+    # Another request evicts the artifact while the first one is still sending it.
+    cache.put(2, 1, "csv", b"b" * 100)
+    assert cache.get(1, 1, "csv") is None
+    with handle:
+        assert handle.read() == b"a" * 100
+    assert cache.open(1, 1, "csv") is None
+
+
+def test_workers_sharing_the_directory_share_invalidation_and_budget(tmp_path):
+    first = ExportArtifactCache(tmp_path, max_bytes=250)
+    second = ExportArtifactCache(tmp_path, max_bytes=250)
+    second.put(7, 1, "csv", b"x" * 100)
+    assert first.invalidate(7) == 1
+    assert second.get(7, 1, "csv") is None
+
+    first.put(1, 1, "csv", b"a" * 100)
+    second.put(2, 1, "csv", b"b" * 100)
+    first.put(3, 1, "csv", b"c" * 100)
+    # The budget covers the other worker's artifact too.
+    assert sum(path.stat().st_size for path in tmp_path.iterdir()) == 200
+    assert first.get(3, 1, "csv") is not None
@@ -0,0 +1,157 @@
+from __future__ import annotations
+
+import random
+from decimal import Decimal
+
+import pytest
+from pydantic import ValidationError
+
+from app.schemas import CalculationParameters
+from app.services.calculator import calculate_import_cost
+from app.services.formula_graph import CalculationSession
+
+BASE = {
+    "costs": {
+        "fob": {"amount": "100", "currency": "USD"},
+        "freight": {"amount": "5", "currency": "USD"},
+        "insurance": {"amount": "1", "currency": "USD"},
+    },
+    "tc_aduana": "980",
+    "di_rate": "0.08",
+    "additional_taxes": [{"name": "II", "base": "CIF", "rate": "0.1"}],
+    "target": "margen",
+    "margen_objetivo": "0.25",
+    "quantity": 3,
+}
+
+
+def _amount(rng: random.Random, low: float, high: float, max_places: int) -> str:
+    places = rng.randint(0, max_places)
+    return str(round(Decimal(str(rng.uniform(low, high))), places))
+
+
+def _random_parameters(rng: random.Random) -> dict:
+    def money() -> dict:
+        currency = rng.choice(["USD", "USD", "ARS"])
+        high = 5000 if currency == "USD" else 5_000_000
+        return {"amount": _amount(rng, 0, high, 4), "currency": currency}
+
+    params = {
+        "costs": {"fob": money(), "freight": money(), "insurance": money()},
+        "tc_aduana": _amount(rng, 1, 2500, rng.choice([0, 2, 4, 6])),
+        "di_rate": _amount(rng, 0, 0.35, 4),
+        "apply_tasa_estadistica": rng.random() < 0.7,
+        "iva_rate": rng.choice(["0.21", "0.105", "0.27", "0"]),
+        "perc_iva_rate": rng.choice(["0.20", "0.10", "0"]),
+        "perc_ganancias_rate": rng.choice(["0.06", "0.11", "0"]),
+        "gastos_locales_ars": _amount(rng, 0, 200_000, 3),
+        "costos_salida_ars": _amount(rng, 0, 50_000, 3),
+        "mp_rate": _amount(rng, 0, 0.12, 4),
+        "mp_iva_rate": rng.choice(["0.21", "0", "0.105"]),
+        "quantity": rng.randint(1, 60),
+        "additional_taxes": [],
+    }
+    for index in range(rng.randint(0, 3)):
+        base = rng.choice(["CIF", "BaseIVA", "ARS"])
+        tax = {"name": f"tax-{index}", "base": base}
+        if base == "ARS":
+            tax["amount_ars"] = _amount(rng, 0, 20_000, 3)
+        else:
+            tax["rate"] = _amount(rng, 0, 0.2, 4)
+        params["additional_taxes"].append(tax)
+
+    if rng.random() < 0.5:
+        params["target"] = "margen"
+        params["margen_objetivo"] = _amount(rng, -0.1, 0.6, 4)
+    else:
+        params["target"] = "precio"
+        params["precio_neto_input_ars"] = _amount(rng, 0, 3_000_000, 2)
+
+    if rng.random() < 0.5:
+        params["rounding"] = {
+            "step": rng.choice(["1", "10", "100", "0.5", "3", "0.25", "7"]),
+            "mode": rng.choice(["nearest", "up", "down"]),
+            "psychological_endings": rng.choice([None, [".99"], [".49", ".99"], ["0.9"], ["-0.5", ".95"]]),
+        }
+    return params
+
+
+def _outcome(compute):
+    try:
+        return repr(compute())
+    except ValueError as error:
+        return ("error", str(error))
+
+
+def test_session_matches_the_calculator_across_random_edits():
+    rng = random.Random(20240702)
+    session = None
+    for _ in range(300):
+        try:
+            params = CalculationParameters.model_validate(_random_parameters(rng))
+        except ValidationError:
+            continue
+        override = Decimal(rng.randint(0, 5000)) if params.target == "precio" and rng.random() < 0.3 else None
+        if session is None:
+            session = CalculationSession(params, mp_fee_override=override)
+        else:
+            session.set_parameters(params, mp_fee_override=override)
+        assert _outcome(session.result) == _outcome(lambda: calculate_import_cost(params, override))
+
+
+def test_edits_only_recompute_what_depends_on_them():
+    session = CalculationSession(CalculationParameters.model_validate(BASE))
+    session.result()
+
+    assert session.patch({"mp_rate": "0.05"}) == {"mp_rate"}
+    session.result()
+    assert "pricing" in session.recomputed
+    assert not {"CIF_USD", "DI_USD", "IVA_USD", "costo_puesto_ars"} & set(session.recomputed)
+
+    assert session.patch({"quantity": 7}) == {"quantity"}
+    session.result()
+    assert set(session.recomputed) == {"totals", "unitary"}
+
+    # Same value, different object: nothing to do.
+    assert session.patch({"tc_aduana": "980"}) == set()
+    session.result()
+    assert session.recomputed == ()
+
+    # Nested objects merge, so only the freight amount changes.
+    assert session.patch({"costs": {"freight": {"amount": "6"}}}) == {"freight"}
+    assert session.params.costs.fob.amount == Decimal("100")
+    expected = calculate_import_cost(session.params)
+    assert repr(session.result()) == repr(expected)
+
+
+def test_failed_pricing_recovers_on_the_next_edit():
+    session = CalculationSession(CalculationParameters.model_validate(BASE))
+    session.patch({"margen_objetivo": "0.99", "mp_rate": "0.05"})
+    with pytest.raises(ValueError):
+        session.result()
+
+    session.patch({"margen_objetivo": "0.30"})
+    assert repr(session.result()) == repr(calculate_import_cost(session.params))
+
+
+def test_what_if_endpoint(client):
+    scenarios = [{"tc_aduana": "1015"}, {"margen_objetivo": "0.3", "quantity": 10}]
+    response = client.post("/api/calculations/what-if", json={"parameters": BASE, "scenarios": scenarios})
+    assert response.status_code == 200
+    body = response.json()
+
+    base = CalculationParameters.model_validate(BASE)
+    assert body["results"]["precio_neto_ars"] == str(calculate_import_cost(base).precio_neto_ars)
+    first, second = body["scenarios"]
+    assert first["changed_inputs"] == ["tc_aduana"]
+    # Scenarios are relative to the base, so the second one also reverts the exchange rate.
+    assert second["changed_inputs"] == ["margen_objetivo", "quantity", "tc_aduana"]
+    expected = calculate_import_cost(base.model_copy(update={"margen_objetivo": Decimal("0.3"), "quantity": 10}))
+    assert second["results"]["precio_neto_ars"] == str(expected.precio_neto_ars)
+    assert second["results"]["totals"]["precio_neto_total"] == str(expected.totals["precio_neto_total"])
+
+    invalid = client.post("/api/calculations/what-if", json={"parameters": BASE, "scenarios": [{}, {"di_rate": "x"}]})
+    assert invalid.status_code == 422
+    assert invalid.json()["detail"][0]["loc"][:2] == ["scenarios", 1]
+    failing = client.post("/api/calculations/what-if", json={"parameters": BASE, "scenarios": [{"margen_objetivo": "0.99", "mp_rate": "0.05"}]})
+    assert failing.status_code == 400
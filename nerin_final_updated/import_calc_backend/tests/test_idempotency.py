@@ -0,0 +1,161 @@
+from __future__ import annotations
+
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from sqlmodel import select
+
+from app.config import get_settings
+from app.services import idempotency
+from app.services.idempotency import StoredResponse, purge_expired, run_idempotent
+from app.storage.database import get_session
+from app.storage.models import Calculation, IdempotencyRecord
+
+
+def _body(order_reference: str, fob: str = "100") -> dict:
+    return {
+        "parameters": {
+            "costs": {
+                "fob": {"amount": fob, "currency": "USD"},
+                "freight": {"amount": "5", "currency": "USD"},
+                "insurance": {"amount": "1", "currency": "USD"},
+            },
+            "tc_aduana": "980",
+            "di_rate": "0.08",
+            "target": "margen",
+            "margen_objetivo": "0.25",
+            "order_reference": order_reference,
+        }
+    }
+
+
+def _count(order_reference: str) -> int:
+    with get_session() as session:
+        return len(session.exec(select(Calculation.id).where(Calculation.order_reference == order_reference)).all())
+
+
+def test_replay_returns_stored_response_without_new_row(client):
+    headers = {"Idempotency-Key": "idem-replay"}
+    first = client.post("/api/calculations", json=_body("IDEM-1"), headers=headers)
+    second = client.post("/api/calculations", json=_body("IDEM-1"), headers=headers)
+
+    assert first.status_code == second.status_code == 200
+    assert second.content == first.content
+    assert second.headers["etag"] == first.headers["etag"]
+    assert second.headers["idempotent-replayed"] == "true"
+    assert "idempotent-replayed" not in first.headers
+    assert _count("IDEM-1") == 1
+
+
+def test_key_reused_with_other_body_is_rejected(client):
+    headers = {"Idempotency-Key": "idem-conflict"}
+    assert client.post("/api/calculations", json=_body("IDEM-2"), headers=headers).status_code == 200
+    conflict = client.post("/api/calculations", json=_body("IDEM-2", fob="200"), headers=headers)
+    assert conflict.status_code == 422
+    assert _count("IDEM-2") == 1
+
+
+def test_concurrent_duplicates_share_one_computation(client):
+    calls = []
+    release = threading.Event()
+
+    def compute() -> StoredResponse:
+        calls.append(1)
+        release.wait(5)
+        return StoredResponse(status_code=200, body='{"ok":true}')
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(run_idempotent("idem-flight", "hash", compute)))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.2)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert len(results) == 8
+    assert sorted(result.replayed for result in results) == [False] + [True] * 7
+    assert {result.body for result in results} == {'{"ok":true}'}
+
+
+def test_failure_releases_key(client):
+    def boom() -> StoredResponse:
+        raise RuntimeError("calculator failed")
+
+    with pytest.raises(RuntimeError):
+        run_idempotent("idem-failure", "hash", boom)
+    retried = run_idempotent("idem-failure", "hash", lambda: StoredResponse(status_code=200, body="{}"))
+    assert retried.replayed is False
+
+
+def test_expired_keys_are_purged(client):
+    run_idempotent("idem-expired", "hash", lambda: StoredResponse(status_code=200, body="{}"))
+    assert purge_expired(now=datetime.utcnow() + timedelta(days=2)) >= 1
+    with get_session() as session:
+        assert session.exec(select(IdempotencyRecord).where(IdempotencyRecord.key == "idem-expired")).first() is None
+
+
+def test_retry_is_fingerprinted_on_the_body_as_sent(client):
+    def load(rows: bytes) -> None:
+        files = {"file": ("tc.csv", b"fecha,tc\n" + rows, "text/csv")}
+        assert client.post("/api/exchange-rates/import", params={"source_key": "idem"}, files=files).status_code == 200
+
+    body = _body("IDEM-RATE")
+    del body["parameters"]["tc_aduana"]
+    body["parameters"].update(tc_aduana_source_key="idem", tc_aduana_date="2024-06-10")
+    headers = {"Idempotency-Key": "idem-resolved"}
+
+    load(b"2024-06-03,900\n")
+    first = client.post("/api/calculations", json=body, headers=headers)
+    # A newer quote changes what the body resolves to, not the request itself.
+    load(b"2024-06-05,950\n")
+    retry = client.post("/api/calculations", json=body, headers=headers)
+
+    assert retry.status_code == 200 and retry.headers["idempotent-replayed"] == "true"
+    assert retry.json()["parameters"]["tc_aduana"] == first.json()["parameters"]["tc_aduana"] == "900"
+
+
+def test_only_one_worker_takes_over_an_abandoned_key(client, monkeypatch):
+    abandoned = datetime.utcnow() - timedelta(hours=1)
+    with get_session() as session:
+        session.add(
+            IdempotencyRecord(
+                key="idem-abandoned",
+                request_hash="hash",
+                created_at=abandoned,
+                expires_at=abandoned + timedelta(days=1),
+            )
+        )
+        session.commit()
+    monkeypatch.setattr(get_settings(), "idempotency_wait_seconds", 5.0)
+    # Both workers read the abandoned marker before either tries to take it over.
+    barrier = threading.Barrier(2)
+    real_update = idempotency.update
+
+    def racing_update(*args):
+        barrier.wait(5)
+        return real_update(*args)
+
+    monkeypatch.setattr(idempotency, "update", racing_update)
+    outcomes = []
+    threads = [
+        threading.Thread(target=lambda: outcomes.append(idempotency._claim("idem-abandoned", "hash"))) for _ in range(2)
+    ]
+    for thread in threads:
+        thread.start()
+    deadline = time.monotonic() + 5
+    while None not in outcomes and time.monotonic() < deadline:
+        time.sleep(0.01)
+    # The winner finishes; the other worker replays its response instead of running again.
+    idempotency._complete("idem-abandoned", StoredResponse(status_code=200, body="{}"))
+    for thread in threads:
+        thread.join(5)
+
+    assert len(outcomes) == 2 and outcomes[0] is None
+    assert outcomes[1].replayed is True and outcomes[1].body == "{}"
@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import pytest
+
+from app.services import job_handlers
+from app.services.jobs import JobContext, _claim_next, get_job, list_job_items, requeue_stale_jobs, run_job, submit_job
+
+BASE_PARAMETERS = {
+    "costs": {
+        "fob": {"amount": "100", "currency": "USD"},
+        "freight": {"amount": "5", "currency": "USD"},
+        "insurance": {"amount": "1", "currency": "USD"},
+    },
+    "tc_aduana": "980",
+    "di_rate": "0.08",
+    "mp_rate": "0.05",
+    "target": "margen",
+    "margen_objetivo": "0.25",
+}
+
+
+def _items(count: int) -> list:
+    return [{"reference": f"SKU-{index}", "fob": {"amount": str(10 + index)}} for index in range(count)]
+
+
+def _wait(client, job_id: int) -> dict:
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        body = client.get(f"/api/jobs/{job_id}").json()
+        if body["status"] in ("succeeded", "failed"):
+            return body
+        time.sleep(0.05)
+    raise AssertionError("job did not finish")
+
+
+def _events(text: str) -> list:
+    events = []
+    for block in text.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines() if not line.startswith(":"))
+        if fields:
+            events.append(fields)
+    return events
+
+
+def test_reprice_job_runs_and_streams_items(client):
+    response = client.post(
+        "/api/jobs", json={"kind": "reprice", "payload": {"parameters": BASE_PARAMETERS, "items": _items(120)}}
+    )
+    assert response.status_code == 202
+    job_id = response.json()["id"]
+    assert response.headers["location"] == f"/api/jobs/{job_id}"
+
+    body = _wait(client, job_id)
+    assert body["status"] == "succeeded"
+    assert body["result"] == {"items": 120, "failed": 0}
+    assert body["progress_done"] == body["progress_total"] == 120
+
+    items = client.get(f"/api/jobs/{job_id}/items", params={"after": 118}).json()["items"]
+    assert [item["reference"] for item in items] == ["SKU-118", "SKU-119"]
+    assert Decimal(items[1]["precio_final_ars"]) > Decimal(items[0]["precio_final_ars"])
+
+    stream = client.get(f"/api/jobs/{job_id}/events")
+    assert stream.headers["content-type"].startswith("text/event-stream")
+    events = _events(stream.text)
+    assert [event["event"] for event in events].count("item") == 120
+    assert events[-1]["event"] == "end"
+
+    resumed = _events(client.get(f"/api/jobs/{job_id}/events", headers={"Last-Event-ID": "115"}).text)
+    assert [event["id"] for event in resumed if event["event"] == "item"] == ["116", "117", "118", "119", "120"]
+
+
+def test_revalue_job_reports_new_prices(client):
+    created = client.post("/api/calculations", json={"parameters": BASE_PARAMETERS}).json()
+    payload = {"tc_aduana": "1100", "calculation_ids": [created["calculation_id"], 999999]}
+    response = client.post("/api/jobs", json={"kind": "revalue", "payload": payload})
+    body = _wait(client, response.json()["id"])
+    assert body["result"] == {"items": 2, "failed": 1}
+    revalued, missing = client.get(f"/api/jobs/{body['id']}/items").json()["items"]
+    assert Decimal(revalued["precio_final_ars"]) > Decimal(revalued["precio_final_anterior_ars"])
+    assert missing["error"] == "Calculation not found"
+
+
+def test_submission_is_validated(client):
+    assert client.post("/api/jobs", json={"kind": "nope", "payload": {}}).status_code == 400
+    assert client.post("/api/jobs", json={"kind": "reprice", "payload": {"parameters": {}}}).status_code == 422
+    assert client.get("/api/jobs/999999").status_code == 404
+
+
+def test_interrupted_job_resumes_from_checkpoint(monkeypatch):
+    monkeypatch.setattr(job_handlers, "CHECKPOINT_EVERY", 10)
+    job = submit_job("reprice", {"parameters": BASE_PARAMETERS, "items": _items(35)})
+
+    original_report = JobContext.report
+    calls = {"count": 0}
+
+    def crashing_report(self, *args, **kwargs):
+        calls["count"] += 1
+        if calls["count"] == 4:  # initial report + two checkpoints, then the worker "dies"
+            raise SystemExit("worker killed")
+        return original_report(self, *args, **kwargs)
+
+    monkeypatch.setattr(JobContext, "report", crashing_report)
+    claimed = _claim_next("worker-a")
+    assert claimed.id == job.id
+    with pytest.raises(SystemExit):
+        run_job(claimed, "worker-a")
+    monkeypatch.setattr(JobContext, "report", original_report)
+
+    assert get_job(job.id).checkpoint == {"next_index": 20, "failed": 0}
+    assert requeue_stale_jobs(timedelta(seconds=60), now=datetime.utcnow() + timedelta(minutes=5)) >= 1
+    resumed = _claim_next("worker-b")
+    run_job(resumed, "worker-b")
+
+    finished = get_job(job.id)
+    assert finished.status == "succeeded" and finished.attempts == 2
+    items = list_job_items(job.id, limit=1000)
+    assert [item.data["index"] for item in items] == list(range(35))
+    assert [item.seq for item in items] == list(range(1, 36))
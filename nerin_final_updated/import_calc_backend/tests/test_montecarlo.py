@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+import time
+from decimal import Decimal
+
+import numpy as np
+import pytest
+
+from app.schemas import CalculationParameters, MonteCarloRequest
+from app.services.calculator import calculate_import_cost
+from app.services.montecarlo import landed_cost_batch, simulate_margin_risk
+
+PARAMETERS = {
+    "costs": {
+        "fob": {"amount": "100", "currency": "USD"},
+        "freight": {"amount": "5", "currency": "USD"},
+        "insurance": {"amount": "1500", "currency": "ARS"},
+    },
+    "tc_aduana": "980",
+    "di_rate": "0.08",
+    "gastos_locales_ars": "8000",
+    "costos_salida_ars": "2500",
+    "mp_rate": "0.05",
+    "target": "margen",
+    "margen_objetivo": "0.10",
+    "additional_taxes": [
+        {"name": "Imp Interno", "base": "CIF", "rate": "0.10"},
+        {"name": "Ingresos Brutos", "base": "BaseIVA", "rate": "0.03"},
+        {"name": "Eco", "base": "ARS", "amount_ars": "1500"},
+    ],
+}
+
+
+def test_batch_landed_cost_matches_calculator_per_scenario():
+    params = CalculationParameters.model_validate(PARAMETERS)
+    rates = np.array([850.0, 980.0, 1234.5])
+    freights = np.array([3.0, 5.0, 12.25])
+
+    costs = landed_cost_batch(params, rates, freights)
+
+    for rate, freight, cost in zip(rates, freights, costs):
+        scenario = CalculationParameters.model_validate(
+            {
+                **PARAMETERS,
+                "tc_aduana": str(rate),
+                "costs": {**PARAMETERS["costs"], "freight": {"amount": str(freight), "currency": "USD"}},
+            }
+        )
+        expected = calculate_import_cost(scenario).costo_puesto_ars
+        assert abs(Decimal(repr(float(cost))) - expected) < Decimal("0.10")
+
+
+def test_simulation_is_seeded_and_fast():
+    params = CalculationParameters.model_validate(PARAMETERS)
+    request = MonteCarloRequest(
+        parameters=params,
+        tc_aduana={"kind": "lognormal", "mean": "1050", "std": "120"},
+        freight={"kind": "triangular", "low": "4", "mode": "5", "high": "9"},
+        scenarios=50000,
+        seed=7,
+    )
+
+    started = time.perf_counter()
+    first = simulate_margin_risk(params, request)
+    elapsed = time.perf_counter() - started
+
+    assert elapsed < 0.5
+    assert first == simulate_margin_risk(params, request)
+    assert first["quote"]["margen"] == Decimal("0.1000")
+    # The price is fixed at the quoted rate, so an expected weaker peso erodes the median margin.
+    margins = first["margen"]["percentiles"]
+    assert margins["p5"] < margins["p50"] < first["quote"]["margen"] < margins["p95"]
+    assert Decimal("0") < first["probability_of_loss"] < Decimal("1")
+    assert Decimal("4") <= first["freight"]["min"] and first["freight"]["max"] <= Decimal("9")
+
+
+def test_constant_rate_reproduces_the_quote():
+    params = CalculationParameters.model_validate(PARAMETERS)
+    request = MonteCarloRequest(parameters=params, tc_aduana={"kind": "normal", "std": "0"}, scenarios=100)
+
+    summary = simulate_margin_risk(params, request)
+
+    assert abs(summary["utilidad_ars"]["mean"] - summary["quote"]["utilidad_ars"]) < Decimal("0.10")
+    assert summary["utilidad_ars"]["std"] == Decimal("0.00")
+    assert summary["probability_of_loss"] == Decimal("0.0000")
+
+
+def test_endpoint_simulates_stored_calculation(client):
+    created = client.post("/api/calculations", json={"parameters": PARAMETERS}).json()
+    body = {
+        "calculation_id": created["calculation_id"],
+        "tc_aduana": {"kind": "uniform", "low": "900", "high": "1400"},
+        "scenarios": 20000,
+        "seed": 1,
+        "percentiles": [1, 50, 99],
+    }
+
+    response = client.post("/api/simulations/margin-risk", json=body)
+
+    assert response.status_code == 200
+    summary = response.json()
+    assert summary["quote"]["precio_neto_ars"] == created["results"]["precio_neto_ars"]
+    assert set(summary["utilidad_ars"]["percentiles"]) == {"p1", "p50", "p99"}
+    assert Decimal(summary["probability_of_loss"]) > 0
+
+    missing = client.post("/api/simulations/margin-risk", json={**body, "calculation_id": 999999})
+    assert missing.status_code == 404
+    both = client.post("/api/simulations/margin-risk", json={**body, "parameters": PARAMETERS})
+    assert both.status_code == 422
+
+
+def test_scenarios_failing_a_formula_tax_are_counted_and_left_out():
+    # Positive at the quoted 980, negative below a rate of 950.
+    taxes = [*PARAMETERS["additional_taxes"], {"name": "Ajuste", "base": "formula", "formula": "tc_aduana / 10 - 95"}]
+    params = CalculationParameters.model_validate({**PARAMETERS, "additional_taxes": taxes})
+
+    def request(low, high):
+        return MonteCarloRequest(
+            parameters=params, tc_aduana={"kind": "uniform", "low": low, "high": high}, scenarios=1000, seed=3
+        )
+
+    summary = simulate_margin_risk(params, request("900", "1100"))
+
+    assert 150 < summary["invalid_scenarios"] < 350
+    assert summary["tc_aduana"]["min"] >= Decimal("950")
+    with pytest.raises(ValueError, match="every scenario"):
+        simulate_margin_risk(params, request("800", "900"))
@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import io
+from decimal import Decimal
+
+import pytest
+from openpyxl import Workbook
+from pydantic import ValidationError
+
+from app.services import ncm
+from app.services.ncm import NcmEntry, NcmImportError, NcmTrie, import_file, lookup_ncm
+
+TARIFF_CSV = """NCM;Descripción;DI;Tasa estadística
+85;Máquinas eléctricas;16;si
+8507;Acumuladores eléctricos;18%;si
+8507.60.00;De iones de litio;14;no
+8471.30.12;Notebooks;0;no
+""".encode("utf-8")
+
+
+def test_trie_returns_longest_matching_prefix():
+    trie = NcmTrie()
+    chapter = NcmEntry("85", Decimal("0.16"), True)
+    heading = NcmEntry("8507", Decimal("0.18"), True)
+    trie.insert("85", chapter)
+    trie.insert("8507", heading)
+
+    assert trie.size == 2
+    assert trie.longest_prefix("85076000") is heading
+    assert trie.longest_prefix("8501") is chapter
+    assert trie.longest_prefix("8471") is None
+
+
+def test_csv_load_resolves_calculation_rates(client, make_params):
+    summary = import_file(TARIFF_CSV, "arancel.csv")
+    assert summary["loaded"] == 4
+
+    assert lookup_ncm("8507.90.20").code == "8507"
+    lithium = lookup_ncm("85076000")
+    assert lithium.di_rate == Decimal("0.14")
+    assert lithium.apply_tasa_estadistica is False
+
+    params = make_params(di_rate=None, ncm_code="8507.60.00")
+    assert params.di_rate == Decimal("0.14")
+    assert params.apply_tasa_estadistica is False
+    assert params.ncm_position == "85076000"
+
+    # Explicit rates win over the table, which keeps stored parameters stable.
+    explicit = make_params(ncm_code="85076000", di_rate="0.05", apply_tasa_estadistica=True)
+    assert explicit.di_rate == Decimal("0.05")
+    assert explicit.apply_tasa_estadistica is True
+
+    with pytest.raises(ValidationError, match="No NCM position"):
+        make_params(di_rate=None, ncm_code="9999")
+    with pytest.raises(ValidationError, match="di_rate is required"):
+        make_params(di_rate=None)
+
+
+def test_xlsx_restores_leading_zero_and_bad_rows_roll_back(client):
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.append(["codigo", "descripcion", "di_rate", "te"])
+    sheet.append([1012100, "Caballos reproductores", 0.02, "x"])
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    import_file(buffer.getvalue(), "nomenclador.xlsx")
+
+    assert lookup_ncm("01012100").di_rate == Decimal("0.02")
+
+    with pytest.raises(NcmImportError, match="Row 3"):
+        import_file(b"ncm,di\n0201,10\n0202,abc\n", "broken.csv")
+    assert lookup_ncm("0201") is None
+
+
+def test_numeric_cells_keep_every_digit():
+    assert ncm._parse_code(1012100) == "01012100"
+    assert ncm._parse_code(85076000.0) == "85076000"
+    # Dotted numbers lose the trailing zero of the subheading, and chapters 01-09 their leading zero.
+    assert ncm._parse_code(8507.6) == "850760"
+    assert ncm._parse_code(102.21) == "010221"
+    assert ncm._parse_code(8507.6011) == "85076011"
+    with pytest.raises(ValueError, match="Invalid NCM code"):
+        ncm._parse_code(85076.5)
+
+
+def test_api_import_lookup_and_calculation(client):
+    response = client.post(
+        "/api/ncm/import",
+        params={"replace": "true"},
+        files={"file": ("arancel.csv", TARIFF_CSV, "text/csv")},
+    )
+    assert response.status_code == 200
+    assert response.json() == {"loaded": 4, "removed": 1, "total": 4}
+    assert lookup_ncm("01012100") is None
+
+    found = client.get("/api/ncm/8471.30.12").json()
+    assert found["code"] == "84713012"
+    assert found["di_rate"] == "0"
+    assert client.get("/api/ncm/0101").status_code == 404
+    assert client.get("/api/ncm/abc").status_code == 422
+
+    payload = {
+        "parameters": {
+            "costs": {
+                "fob": {"amount": "100", "currency": "USD"},
+                "freight": {"amount": "5", "currency": "USD"},
+                "insurance": {"amount": "1", "currency": "USD"},
+            },
+            "tc_aduana": "980",
+            "ncm_code": "8507.10",
+            "target": "margen",
+            "margen_objetivo": "0.25",
+        }
+    }
+    body = client.post("/api/calculations", json=payload).json()
+    assert body["parameters"]["di_rate"] == "0.18"
+    assert body["parameters"]["ncm_position"] == "8507"
+    assert body["results"]["breakdown"]["Tasa_Estadistica_USD"] == "3.1800"
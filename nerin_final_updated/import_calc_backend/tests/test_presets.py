@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+import os
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+
+from app.services import presets
+from app.services.presets import DefaultsWatcher, get_preset
+from app.storage.database import engine, init_db
+
+PRESET = """- name: "{name}"
+  di_rate: "{di_rate}"
+  iva_rate: "0.21"
+  perc_iva_rate: "0.20"
+  perc_ganancias_rate: "0.06"
+  notes: "{notes}"
+"""
+
+
+def _write(path, *presets) -> None:
+    path.write_text("".join(PRESET.format(name=name, di_rate=rate, notes="hot") for name, rate in presets))
+
+
+@pytest.fixture
+def statements():
+    init_db()
+    captured = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        captured.append(statement.split()[0].upper())
+
+    event.listen(engine, "before_cursor_execute", record)
+    yield captured
+    event.remove(engine, "before_cursor_execute", record)
+
+
+def test_reload_upserts_only_changed_presets(tmp_path, statements):
+    path = tmp_path / "defaults.yaml"
+    _write(path, ("Hot-A", "0.08"), ("Hot-B", "0.12"), ("Hot-C", "0.16"))
+    watcher = DefaultsWatcher(path, interval=60)
+
+    assert watcher.reload() == {"inserted": 3, "updated": 0, "unchanged": 0}
+    assert get_preset("Hot-B").parameters["di_rate"] == "0.12"
+
+    _write(path, ("Hot-A", "0.08"), ("Hot-B", "0.10"), ("Hot-C", "0.16"))
+    # Throttled: the previous reload counts as the last check.
+    assert watcher.check() is None
+
+    statements.clear()
+    assert watcher.reload() == {"inserted": 0, "updated": 1, "unchanged": 2}
+    assert [kind for kind in statements if kind in ("SELECT", "UPDATE", "INSERT")] == ["SELECT", "UPDATE"]
+    # The in-memory cache was refreshed along with the table.
+    assert get_preset("Hot-B").parameters["di_rate"] == "0.10"
+
+
+def test_touch_without_content_change_and_invalid_file_are_ignored(tmp_path, statements):
+    path = tmp_path / "defaults.yaml"
+    _write(path, ("Hot-D", "0.08"))
+    watcher = DefaultsWatcher(path, interval=60)
+    watcher.reload()
+
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    statements.clear()
+    assert watcher.reload() is None
+    assert statements == []
+
+    path.write_text("- name: Hot-D\n  di_rate: [unclosed\n")
+    assert watcher.reload() is None
+    assert get_preset("Hot-D").parameters["di_rate"] == "0.08"
+
+
+def test_failed_sync_is_retried_on_the_next_check(tmp_path, statements, monkeypatch):
+    path = tmp_path / "defaults.yaml"
+    _write(path, ("Hot-E", "0.08"))
+    watcher = DefaultsWatcher(path, interval=60)
+    sync = presets.sync_presets
+
+    def locked(rows):
+        raise OperationalError("INSERT", {}, Exception("database is locked"))
+
+    monkeypatch.setattr(presets, "sync_presets", locked)
+    with pytest.raises(OperationalError):
+        watcher.reload()
+    assert get_preset("Hot-E") is None
+
+    monkeypatch.setattr(presets, "sync_presets", sync)
+    assert watcher.reload() == {"inserted": 1, "updated": 0, "unchanged": 0}
+    assert get_preset("Hot-E").parameters["di_rate"] == "0.08"
@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+import sqlite3
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+from app.config import get_settings
+from app.main import app
+from app.storage.replica import ReportingReplica, get_reporting_replica
+
+
+def _live_database(path, journal_mode):
+    connection = sqlite3.connect(path, isolation_level=None)
+    connection.execute(f"PRAGMA journal_mode={journal_mode}")
+    connection.execute("CREATE TABLE payments (id INTEGER PRIMARY KEY, fee TEXT NOT NULL)")
+    connection.executemany("INSERT INTO payments (fee) VALUES (?)", [(str(index),) for index in range(2000)])
+    return connection
+
+
+@pytest.mark.parametrize("journal_mode", ["wal", "delete"])
+def test_replica_is_a_read_only_copy_that_never_blocks_writers(tmp_path, journal_mode):
+    live = _live_database(tmp_path / "live.db", journal_mode)
+    replica = ReportingReplica(tmp_path / "live.db", tmp_path / "replica" / "reporting.db")
+    assert replica.status()["staleness_seconds"] is None
+
+    with replica.session() as session:  # the first read makes the copy
+        assert session.exec(text("SELECT COUNT(*) FROM payments")).scalar() == 2000
+        with pytest.raises(Exception, match="readonly|read-only"):
+            session.exec(text("DELETE FROM payments"))
+    status = replica.status()
+    assert status["source"] == "replica" and 0 <= status["staleness_seconds"] < 60 and status["size_bytes"] > 0
+
+    # A report still reading the replica does not hold up a write to the live file.
+    with replica.session() as session:
+        rows = session.exec(text("SELECT id FROM payments ORDER BY id"))
+        rows.fetchmany(10)
+        started = time.monotonic()
+        live.execute("INSERT INTO payments (fee) VALUES ('webhook')")
+        assert time.monotonic() - started < 1
+        assert len(rows.fetchall()) == 1990
+
+    # A copy taken while another connection keeps writing still finishes with a consistent file.
+    stop = threading.Event()
+
+    def write() -> None:
+        writer = sqlite3.connect(tmp_path / "live.db", isolation_level=None, timeout=5)
+        while not stop.is_set():
+            writer.execute("INSERT INTO payments (fee) VALUES ('busy')")
+            time.sleep(0.002)
+        writer.close()
+
+    thread = threading.Thread(target=write)
+    thread.start()
+    try:
+        replica.refresh()
+    finally:
+        stop.set()
+        thread.join()
+    with replica.session() as session:
+        assert session.exec(text("PRAGMA integrity_check")).scalar() == "ok"
+        assert session.exec(text("SELECT COUNT(*) FROM payments WHERE fee = 'webhook'")).scalar() == 1
+    live.close()
+
+
+@pytest.fixture
+def replica_enabled(monkeypatch):
+    monkeypatch.setattr(get_settings(), "reporting_replica", True)
+    get_reporting_replica.cache_clear()
+    yield get_reporting_replica()
+    monkeypatch.undo()
+    get_reporting_replica.cache_clear()
+
+
+def _payload(order_reference: str, precio: str) -> dict:
+    return {
+        "parameters": {
+            "costs": {
+                "fob": {"amount": "100", "currency": "USD"},
+                "freight": {"amount": "5", "currency": "USD"},
+                "insurance": {"amount": "1", "currency": "USD"},
+            },
+            "tc_aduana": "980",
+            "di_rate": "0.08",
+            "target": "precio",
+            "precio_neto_input_ars": precio,
+            "order_reference": order_reference,
+        }
+    }
+
+
+def test_listing_reports_and_exports_read_the_replica(replica_enabled):
+    with TestClient(app) as client:
+        ids = [
+            client.post("/api/calculations", json=_payload("REPLICA-1", precio)).json()["calculation_id"]
+            for precio in ("250000", "300000")
+        ]
+        refreshed = client.post("/api/reports/replica/refresh").json()
+        assert refreshed["source"] == "replica" and refreshed["staleness_seconds"] < 60
+
+        late = client.post("/api/calculations", json=_payload("REPLICA-1", "350000")).json()["calculation_id"]
+        page = client.get("/api/calculations", params={"order_reference": "REPLICA-1", "limit": 1}).json()
+        # The replica predates the third calculation.
+        assert [item["id"] for item in page["items"]] == [ids[1]]
+        assert page["next_before"] == ids[1] and page["replica"]["source"] == "replica"
+        rest = client.get("/api/calculations", params={"order_reference": "REPLICA-1", "before": ids[1]}).json()
+        assert [item["id"] for item in rest["items"]] == [ids[0]] and rest["next_before"] is None
+
+        report = client.get("/api/reports/calculations", params={"group_by": "preset"}).json()
+        assert sum(group["count"] for group in report["groups"]) >= 2
+        assert report["replica"]["staleness_seconds"] >= 0
+
+        # Exports of rows the replica does not have yet fall back to the live database.
+        assert client.get(f"/api/calculations/{late}/export").status_code == 200
+        assert client.get(f"/api/calculations/{ids[0]}/export").status_code == 200
+
+        client.post("/api/reports/replica/refresh")
+        page = client.get("/api/calculations", params={"order_reference": "REPLICA-1"}).json()
+        assert [item["id"] for item in page["items"]] == [late, ids[1], ids[0]]
+        assert page["items"][0]["precio_final_ars"] is not None
+
+
+def test_replica_disabled_reads_live_database():
+    with TestClient(app) as client:
+        assert client.get("/api/reports/replica").json()["source"] == "live"
+        assert client.post("/api/reports/replica/refresh").status_code == 409
+        created = client.post("/api/calculations", json=_payload("LIVE-1", "250000")).json()["calculation_id"]
+        page = client.get("/api/calculations", params={"order_reference": "LIVE-1"}).json()
+        assert [item["id"] for item in page["items"]] == [created]
@@ -0,0 +1,166 @@
+from __future__ import annotations
+
+import io
+import json
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from pathlib import Path
+
+import pytest
+from sqlalchemy import update
+
+from app.config import get_settings
+from app.services.archival import archive_old_rows
+from app.services.store_import import StoreImportError, StoreReader, import_store
+from app.storage.database import get_session
+from app.storage.models import Calculation, PaymentNotification
+
+PARAMETERS = {
+    "costs": {
+        "fob": {"amount": "100", "currency": "USD"},
+        "freight": {"amount": "5", "currency": "USD"},
+        "insurance": {"amount": "1", "currency": "USD"},
+    },
+    "tc_aduana": "980",
+    "di_rate": "0.08",
+    "target": "margen",
+    "margen_objetivo": "0.25",
+}
+
+
+def _calculation(identifier: int, reference: str, **overrides) -> dict:
+    record = {
+        "id": identifier,
+        "created_at": f"2024-03-0{identifier % 9 + 1}T12:00:00.{identifier:03d}Z",
+        "parameters": {**PARAMETERS, "order_reference": reference},
+        "results": {"precio_neto_ars": "251398.75", "margen": "0.2500"},
+        "order_reference": reference,
+        "preset_name": None,
+        "mp_fee_applied": None,
+        "mp_fee_details": {},
+    }
+    return {**record, **overrides}
+
+
+def _store(calculations: list, notifications: list = ()) -> bytes:
+    document = {"lastCalculationId": len(calculations), "calculations": calculations, "notifications": list(notifications)}
+    return json.dumps(document, indent=2, ensure_ascii=False).encode("utf-8")
+
+
+def test_reader_matches_json_loads_across_tiny_reads():
+    document = {
+        "extra": {"nested": ["}", "]", "{\"quoted\""]},
+        "lastCalculationId": 123456789,
+        "calculations": [{"text": "Ñandú ✓ ,]}", "amount": 1234.5678}, [], 10.25, -1e3],
+        "notifications": [],
+    }
+    data = b"\xef\xbb\xbf" + json.dumps(document, ensure_ascii=False).encode("utf-8") + b"\n"
+
+    for read_size in (1, 3, 7, 64):
+        reader = StoreReader(io.BytesIO(data), read_size=read_size)
+        assert list(reader) == [("calculations", item) for item in json.loads(data, parse_float=Decimal)["calculations"]]
+        assert reader.last_calculation_id == 123456789
+        assert reader.bytes_read == len(data)
+
+    for broken in (b'{"calculations": [{"id": 1}', b'{"calculations": [{"id": 1} {"id": 2}]}', b"[]", b"{} []"):
+        with pytest.raises(StoreImportError):
+            list(StoreReader(io.BytesIO(broken), read_size=4))
+
+
+def test_import_dedupes_renumbers_and_reports_progress(client):
+    occupied = client.post("/api/calculations", json={"parameters": {**PARAMETERS, "order_reference": "PY-1"}}).json()
+    taken_id = occupied["calculation_id"]
+    free_id = taken_id + 1000
+
+    calculations = [
+        _calculation(taken_id, "NODE-A"),  # id already used by another calculation
+        _calculation(free_id, "NODE-B", results={"precio_neto_ars": 251398.75}),
+        _calculation(free_id + 1, "NODE-C", parameters={"costs": {}}),  # invalid
+        _calculation(free_id + 2, "NODE-D", mp_fee_details={"mercadopago_fee": 41.32}),
+    ]
+    notifications = [
+        {"payment_id": "node-pay-1", "amount": 1000, "currency": "ARS", "fee_total": 50},
+        {"payment_id": "node-pay-1", "amount": 1000, "currency": "ARS", "fee_total": 51},
+    ]
+    data = _store(calculations, notifications)
+    calls = []
+
+    summary = import_store(io.BytesIO(data), chunk_size=2, progress=lambda stats, errors: calls.append((stats, errors)))
+    assert summary["calculations_inserted"] == 3
+    assert summary["calculations_renumbered"] == 1
+    assert summary["notifications_inserted"] == 1
+    assert summary["notifications_duplicates"] == 1
+    assert summary["rejected"] == 1
+    assert summary["last_calculation_id"] == 4
+    assert [stats["records"] for stats, _ in calls] == [2, 4, 6, 6]
+    assert calls[-1][0]["bytes_read"] == len(data)
+    assert [error["id"] for _, errors in calls for error in errors] == [free_id + 1]
+
+    stored = client.get(f"/api/calculations/{free_id}").json()
+    assert stored["parameters"]["order_reference"] == "NODE-B"
+    assert stored["results"]["precio_neto_ars"] == "251398.75"
+    assert client.get(f"/api/calculations/{taken_id}").json()["parameters"]["order_reference"] == "PY-1"
+
+    again = import_store(io.BytesIO(data), chunk_size=3)
+    assert again["calculations_inserted"] == again["notifications_inserted"] == 0
+    assert again["calculations_duplicates"] == 3
+
+
+def test_unreferenced_and_archived_ids_are_renumbered_not_dropped(client):
+    def notify(payment_id: str) -> None:
+        body = {"payment_id": payment_id, "amount": "250000", "currency": "ARS", "fee_total": "1000"}
+        client.post("/api/payments/notify", json=body).raise_for_status()
+
+    def create() -> int:
+        return client.post("/api/calculations", json={"parameters": PARAMETERS}).json()["calculation_id"]
+
+    archived_id, live_id = create(), create()
+    notify("node-archived-pay")
+    notify("node-live-pay")
+    aged = datetime.utcnow() - timedelta(days=400)
+    with get_session() as session:
+        session.exec(update(Calculation).where(Calculation.id == archived_id).values(created_at=aged))
+        session.exec(
+            update(PaymentNotification)
+            .where(PaymentNotification.payment_id == "node-archived-pay")
+            .values(received_at=aged)
+        )
+        session.commit()
+    archive_old_rows(timedelta(days=365))
+    with get_session() as session:
+        assert session.get(Calculation, archived_id) is None
+
+    # Neither id holds this calculation: both collisions are renumbered, the archived payment is known.
+    data = _store(
+        [_calculation(archived_id, None), _calculation(live_id, None)],
+        [{"payment_id": "node-archived-pay", "amount": 1000, "currency": "ARS", "fee_total": 50}],
+    )
+    summary = import_store(io.BytesIO(data), chunk_size=10)
+    assert summary["calculations_inserted"] == summary["calculations_renumbered"] == 2
+    assert summary["calculations_duplicates"] == 0
+    assert summary["notifications_inserted"] == 0 and summary["notifications_duplicates"] == 1
+    with get_session() as session:
+        assert session.get(Calculation, archived_id) is None
+    assert client.get(f"/api/calculations/{archived_id}").json()["created_at"].startswith(aged.date().isoformat())
+
+
+def test_upload_endpoint_runs_an_import_job(client):
+    data = _store([_calculation(5000 + index, f"NODE-JOB-{index}") for index in range(5)] + [{"id": 6000}])
+
+    response = client.post(
+        "/api/calculations/import-store", params={"chunk_size": 2}, files={"file": ("store.json", data)}
+    )
+    assert response.status_code == 202
+    job_id = response.json()["id"]
+    deadline = time.monotonic() + 10
+    while (body := client.get(f"/api/jobs/{job_id}").json())["status"] not in ("succeeded", "failed"):
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+
+    assert body["status"] == "succeeded"
+    assert body["result"]["calculations_inserted"] == 5
+    assert body["progress_done"] == body["progress_total"] == len(data)
+    (rejected,) = client.get(f"/api/jobs/{job_id}/items").json()["items"]
+    assert rejected["id"] == 6000
+    assert not list(Path(get_settings().store_import_dir).iterdir())
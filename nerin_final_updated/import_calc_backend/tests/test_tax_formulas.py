@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+from decimal import Decimal
+
+import numpy as np
+import pytest
+from pydantic import ValidationError
+
+from app.schemas import CalculationParameters
+from app.services.calculator import calculate_import_cost
+from app.services.montecarlo import landed_cost_batch
+from app.services.tax_formulas import DECIMAL, FormulaError, compile_formula
+
+TAXES = [
+    {"name": "Imp Interno", "base": "CIF", "rate": "0.10"},
+    # Provincial gross-income tax, capped at USD 5.
+    {"name": "Ingresos Brutos", "base": "formula", "formula": "min(Subtotal_USD * 0.03, 5)"},
+    # Declared before the tax it reads: evaluation follows the dependencies.
+    {"name": "Sellos", "base": "formula", "formula": "Tasa_Fija + (Ingresos_Brutos * 0.5 if CIF_USD > 100 else 0)"},
+    {"name": "Tasa Fija", "base": "formula", "formula": "round(2000 / tc_aduana, 4)"},
+]
+PARAMETERS = {
+    "costs": {
+        "fob": {"amount": "100", "currency": "USD"},
+        "freight": {"amount": "5", "currency": "USD"},
+        "insurance": {"amount": "1", "currency": "USD"},
+    },
+    "tc_aduana": "1000",
+    "di_rate": "0.08",
+    "target": "margen",
+    "margen_objetivo": "0.25",
+    "additional_taxes": TAXES,
+}
+
+
+def test_formulas_compile_once_and_reject_unsafe_syntax():
+    compiled = compile_formula("max(CIF_USD - 0.1, 0) if not DI_USD >= 1 or 1 < CIF_USD <= 2 else -DI_USD / 3")
+    assert compile_formula(compiled.text) is compiled
+    assert compiled.names == {"CIF_USD", "DI_USD"}
+    assert compiled.evaluate({"CIF_USD": Decimal("0.3"), "DI_USD": Decimal("0")}, DECIMAL) == Decimal("0.2")
+    assert compiled.evaluate({"CIF_USD": Decimal("9"), "DI_USD": Decimal("3")}, DECIMAL) == Decimal("-1")
+
+    unsafe = ("__import__('os')", "CIF_USD.real", "CIF_USD ** 2", "'x'", "open(CIF_USD)", "[1][0]", "True", "round(1, x)")
+    for text in unsafe:
+        with pytest.raises(FormulaError):
+            compile_formula(text)
+    with pytest.raises(FormulaError, match="Invalid tax formula"):
+        compile_formula("CIF_USD *")
+
+
+def test_formula_taxes_run_in_dependency_order():
+    hits = compile_formula.cache_info().hits
+    params = CalculationParameters.model_validate(PARAMETERS)
+    result = calculate_import_cost(params)
+    details = {detail["name"]: detail for detail in result.additional_taxes}
+
+    # CIF 106, DI 8.48, tasa 3.18, Imp Interno 10.60: subtotal 128.26, 3% = 3.8478.
+    assert details["Ingresos Brutos"]["amount_usd"] == Decimal("3.8478")
+    assert details["Tasa Fija"]["amount_usd"] == Decimal("2.0000")
+    assert details["Sellos"]["amount_usd"] == Decimal("3.9239")
+    assert details["Sellos"]["amount_ars"] == Decimal("3923.90")
+    assert result["Base_IVA_USD"] == Decimal("128.26") + Decimal("3.8478") + Decimal("2") + Decimal("3.9239")
+    # Validation and calculation reuse the compiled closures.
+    assert compile_formula.cache_info().hits > hits
+
+    costs = {**PARAMETERS["costs"], "fob": {"amount": "400"}}
+    capped = CalculationParameters.model_validate({**PARAMETERS, "costs": costs})
+    assert calculate_import_cost(capped).additional_taxes[1] == {
+        "name": "Ingresos Brutos",
+        "amount_usd": Decimal("5.0000"),
+        "amount_ars": Decimal("5000.00"),
+    }
+
+    rates = np.array([800.0, 1000.0, 1250.0])
+    for rate, cost in zip(rates, landed_cost_batch(params, rates)):
+        expected = calculate_import_cost(params.model_copy(update={"tc_aduana": Decimal(str(rate))})).costo_puesto_ars
+        assert abs(Decimal(str(cost)) - expected) < Decimal("0.50")
+
+
+def test_cycles_unknown_names_and_negative_amounts_are_rejected(client):
+    def taxes(*formulas):
+        listed = [{"name": name, "base": "formula", "formula": text} for name, text in formulas]
+        return {**PARAMETERS, "additional_taxes": listed}
+
+    with pytest.raises(ValidationError, match="Tax formula cycle: A -> B -> A"):
+        CalculationParameters.model_validate(taxes(("A", "B + 1"), ("B", "A * 2")))
+    with pytest.raises(ValidationError, match="unknown name"):
+        CalculationParameters.model_validate(taxes(("A", "FOB * 2")))
+    with pytest.raises(ValidationError, match="must be unique"):
+        CalculationParameters.model_validate(taxes(("A", "1"), ("A", "2")))
+
+    response = client.post("/api/calculations", json={"parameters": taxes(("A", "B"), ("B", "A"))})
+    assert response.status_code == 422
+    with pytest.raises(ValueError, match="negative amount"):
+        calculate_import_cost(CalculationParameters.model_validate(taxes(("Rebate", "0 - CIF_USD"))))
+    tiers = client.post(
+        "/api/calculations/tiers", json={"parameters": PARAMETERS, "tiers": {"quantities": [1, 10]}}
+    )
+    assert tiers.status_code == 400
+
+
+def test_formulas_failing_at_evaluation_answer_422(client):
+    for text in ("CIF_USD > 5", "CIF_USD > 5 and DI_USD > 1", "not CIF_USD", "(CIF_USD > 5) + 1", "max(CIF_USD < 1, 2)"):
+        with pytest.raises(FormulaError, match="not an amount"):
+            compile_formula(text)
+
+    failures = {
+        "CIF_USD / 0": "DivisionByZero",
+        "1e999999 * 1e999999": "Overflow",
+        "-CIF_USD": "negative amount",
+        "1e30": "InvalidOperation",  # does not fit the 28-digit context once rounded
+        "1e23": "Calculation failed",  # fits, but the ARS amounts derived from it do not
+    }
+    for text, error in failures.items():
+        parameters = {**PARAMETERS, "additional_taxes": [{"name": "X", "base": "formula", "formula": text}]}
+        responses = [
+            client.post("/api/calculations", json={"parameters": parameters}),
+            client.post("/api/calculations/what-if", json={"parameters": parameters, "scenarios": [{}]}),
+            client.post(
+                "/api/simulations/margin-risk",
+                json={"parameters": parameters, "tc_aduana": {"kind": "normal", "std": "50"}, "scenarios": 100},
+            ),
+        ]
+        for response in responses:
+            assert response.status_code == 422, (text, response.text)
+            assert error in response.json()["detail"]
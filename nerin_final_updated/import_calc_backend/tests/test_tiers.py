@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+from decimal import Decimal
+
+from app.schemas import TierPricingInput
+from app.services.calculator import calculate_import_cost
+from app.services.tiers import calculate_price_tiers
+
+# Shipment-level costs and taxes for the amortization to spread.
+SHIPMENT = {
+    "gastos_locales_ars": "8000",
+    "costos_salida_ars": "2500",
+    "mp_rate": "0.05",
+    "additional_taxes": [
+        {"name": "Imp Interno", "base": "CIF", "rate": "0.10"},
+        {"name": "Eco", "base": "ARS", "amount_ars": "1500"},
+    ],
+}
+
+
+def test_all_per_unit_matches_single_calculation(make_params):
+    params = make_params(**SHIPMENT)
+    tiers = calculate_price_tiers(params, TierPricingInput(quantities=[10, 1], per_shipment=[]))
+    expected = calculate_import_cost(params)
+
+    assert [tier["quantity"] for tier in tiers["tiers"]] == [1, 10]
+    for tier in tiers["tiers"]:
+        assert tier["costo_puesto_unitario"] == expected.costo_puesto_ars
+        assert tier["precio_neto_unitario"] == expected.precio_neto_ars
+        assert tier["margen"] == expected.margen
+    assert tiers["landed"]["per_shipment"]["costo_puesto_ars"] == Decimal("0.00")
+
+
+def test_shipment_costs_are_amortized_across_quantity(make_params):
+    params = make_params(**SHIPMENT)
+    tiers = calculate_price_tiers(params, TierPricingInput(quantities=[1, 5, 10, 50, 100]))
+    rows = tiers["tiers"]
+    unit_cost = tiers["landed"]["per_unit"]["costo_puesto_ars"]
+    shipment_cost = tiers["landed"]["per_shipment"]["costo_puesto_ars"]
+
+    assert shipment_cost > 0
+    assert tiers["landed"]["per_unit"]["breakdown"]["Freight_USD"] == Decimal("0.0000")
+    costs = [row["costo_puesto_unitario"] for row in rows]
+    assert costs == sorted(costs, reverse=True)
+    assert rows[-1]["costo_puesto_unitario"] == (unit_cost + shipment_cost / 100).quantize(Decimal("0.01"))
+    assert all(row["margen"] == Decimal("0.2500") for row in rows)
+    # One unit carries the whole shipment, so it lands within rounding of the full calculation.
+    full = calculate_import_cost(params).costo_puesto_ars
+    assert abs(rows[0]["costo_puesto_unitario"] - full) <= Decimal("0.05")
+
+
+def test_price_target_reports_margin_per_tier(make_params):
+    params = make_params(**SHIPMENT, target="precio", margen_objetivo=None, precio_neto_input_ars="250000")
+    rows = calculate_price_tiers(params, TierPricingInput(quantities=[1, 100]))["tiers"]
+
+    assert all(row["precio_neto_unitario"] == Decimal("250000.00") for row in rows)
+    assert rows[1]["margen"] > rows[0]["margen"]
+    assert rows[1]["totals"]["precio_neto_total"] == Decimal("25000000.00")